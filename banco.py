@@ -0,0 +1,441 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from rastreamento import rastrear
+
+ARQUIVO_BANCO = "vectura.db"
+
+TIPOS_ENDERECO = ["Origem", "Destino", "Recarga"]
+
+RETENCAO_HISTORICO = 100_000 # Quantidade máxima de consultas mantidas no histórico (as mais antigas são descartadas)
+
+# Colunas do histórico que podem ser filtradas e ordenadas no banco (cada uma com índice)
+COLUNAS_FILTRO_HISTORICO = {
+    "origem": "TEXT",
+    "destino_1": "TEXT",
+    "recarga": "TEXT",
+    "destino_2": "TEXT",
+    "calculado_em": "TEXT",
+    "valor_excedente": "REAL",
+}
+
+_local = threading.local()
+
+# ---- Funções de Conexão ----
+
+def _conectar():
+    """
+    Abre (uma vez por thread) a conexão com o banco, em modo WAL, e garante que as tabelas existam.
+    Retorna (conexao: sqlite3.Connection)
+    """
+    conexao = getattr(_local, "conexao", None)
+
+    if conexao is None:
+        conexao = sqlite3.connect(ARQUIVO_BANCO, timeout=30)
+        conexao.row_factory = sqlite3.Row
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                chave TEXT PRIMARY KEY,
+                valor TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS enderecos (
+                id INTEGER PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                nome TEXT NOT NULL,
+                endereco_formatado TEXT NOT NULL,
+                endereco_normalizado TEXT NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                cep TEXT,
+                data_cadastro TEXT NOT NULL,
+                UNIQUE (tipo, nome),
+                UNIQUE (tipo, endereco_normalizado)
+            );
+
+            CREATE TABLE IF NOT EXISTS historico (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                registrado_em TEXT NOT NULL,
+                dados TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS consumo_api (
+                dia TEXT NOT NULL,
+                sku TEXT NOT NULL,
+                chamadas INTEGER NOT NULL DEFAULT 0,
+                acertos_cache INTEGER NOT NULL DEFAULT 0,
+                degradadas INTEGER NOT NULL DEFAULT 0,
+                bloqueadas INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (dia, sku)
+            );
+        """)
+        _migrar_colunas_historico(conexao)
+        conexao.commit()
+        _local.conexao = conexao
+
+    return conexao
+
+def _migrar_colunas_historico(conexao):
+    """Garante as colunas de filtro do histórico (preenchendo-as nas consultas antigas) e os seus índices."""
+    def colunas_faltantes():
+        existentes = {linha[1] for linha in conexao.execute("PRAGMA table_info(historico)")}
+        return [coluna for coluna in COLUNAS_FILTRO_HISTORICO if coluna not in existentes]
+
+    # Outra conexão pode estar migrando ao mesmo tempo: com colunas faltando, confere de novo já com o lock de escrita
+    if colunas_faltantes():
+        conexao.execute("BEGIN IMMEDIATE")
+
+    faltantes = colunas_faltantes()
+
+    for coluna in faltantes:
+        conexao.execute(f"ALTER TABLE historico ADD COLUMN {coluna} {COLUNAS_FILTRO_HISTORICO[coluna]}")
+
+    if faltantes:
+        linhas = conexao.execute("SELECT seq, dados FROM historico").fetchall()
+        conexao.executemany(
+            f"UPDATE historico SET {', '.join(f'{coluna} = ?' for coluna in COLUNAS_FILTRO_HISTORICO)} WHERE seq = ?",
+            [(*_colunas_filtro(json.loads(dados)), seq) for seq, dados in linhas]
+        )
+
+    for coluna in COLUNAS_FILTRO_HISTORICO:
+        conexao.execute(f"CREATE INDEX IF NOT EXISTS idx_historico_{coluna} ON historico ({coluna})")
+
+# ---- Fim das Funções de Conexão ----
+
+# ---- Funções de Endereço ----
+
+def migrar_enderecos_json(arquivo, normalizar):
+    """
+    Importa, uma única vez, os endereços do antigo arquivo JSON para o banco, em uma só transação.
+    Endereços repetidos no JSON são ignorados. Recebe a função usada para normalizar o texto dos endereços.
+    Retorna (quantidade importada: int)
+    """
+    conexao = _conectar()
+
+    if conexao.execute("SELECT 1 FROM meta WHERE chave = 'migracao_enderecos_json'").fetchone():
+        return 0
+
+    registros = []
+    if os.path.exists(arquivo):
+        with open(arquivo, "r", encoding="utf-8") as f:
+            enderecos = json.load(f)
+
+        registros = [(tipo, nome, dados["endereco_formatado"], normalizar(dados["endereco_formatado"]),
+                      dados["latitude"], dados["longitude"], dados.get("cep"), dados["data_cadastro"])
+                     for tipo, locais in enderecos.items() for nome, dados in locais.items()]
+
+    with conexao:
+        # A marca entra na mesma transação e antes dos endereços: se outro processo migrou nesse meio-tempo, não importa de novo
+        marca = conexao.execute("INSERT OR IGNORE INTO meta (chave, valor) VALUES ('migracao_enderecos_json', ?)", (arquivo,))
+
+        if marca.rowcount == 0:
+            return 0
+
+        antes = conexao.total_changes
+        conexao.executemany("""
+            INSERT OR IGNORE INTO enderecos (tipo, nome, endereco_formatado, endereco_normalizado, latitude, longitude, cep, data_cadastro)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, registros)
+        importados = conexao.total_changes - antes
+
+    return importados
+
+@rastrear()
+def listar_enderecos():
+    """
+    Lê todos os endereços do banco no mesmo formato do antigo enderecos.json.
+    Retorna (enderecos: dict -> tipo: {nome: registro})
+    """
+    enderecos = {tipo: {} for tipo in TIPOS_ENDERECO}
+
+    for linha in _conectar().execute("SELECT * FROM enderecos ORDER BY id"):
+        enderecos.setdefault(linha["tipo"], {})[linha["nome"]] = {
+            "endereco_formatado": linha["endereco_formatado"],
+            "latitude": linha["latitude"],
+            "longitude": linha["longitude"],
+            "cep": linha["cep"],
+            "data_cadastro": linha["data_cadastro"]
+        }
+
+    return enderecos
+
+@rastrear()
+def endereco_existe(tipo, endereco_normalizado):
+    """Verifica (pelo índice único) se o endereço normalizado já está cadastrado no tipo."""
+    return _conectar().execute(
+        "SELECT 1 FROM enderecos WHERE tipo = ? AND endereco_normalizado = ?", (tipo, endereco_normalizado)
+    ).fetchone() is not None
+
+@rastrear()
+def endereco_em_uso(endereco_formatado, endereco_normalizado):
+    """Verifica (pelo índice único de cada tipo) se o endereço formatado continua cadastrado em algum nome ou tipo."""
+    return _conectar().execute(
+        f"SELECT 1 FROM enderecos WHERE tipo IN ({', '.join('?' * len(TIPOS_ENDERECO))}) AND endereco_normalizado = ? AND endereco_formatado = ?",
+        (*TIPOS_ENDERECO, endereco_normalizado, endereco_formatado)
+    ).fetchone() is not None
+
+@rastrear()
+def inserir_endereco(tipo, nome, registro, endereco_normalizado):
+    """
+    Grava um novo endereço em uma transação.
+    Retorna (sucesso: bool, campo repetido: 'nome', 'endereco' ou None)
+    """
+    conexao = _conectar()
+
+    try:
+        with conexao:
+            conexao.execute("""
+                INSERT INTO enderecos (tipo, nome, endereco_formatado, endereco_normalizado, latitude, longitude, cep, data_cadastro)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (tipo, nome, registro["endereco_formatado"], endereco_normalizado,
+                  registro["latitude"], registro["longitude"], registro["cep"], registro["data_cadastro"]))
+
+    except sqlite3.IntegrityError as erro:
+        return False, "nome" if "enderecos.nome" in str(erro) else "endereco"
+
+    return True, None
+
+@rastrear()
+def remover_endereco_banco(tipo, nome):
+    """
+    Exclui um endereço em uma transação.
+    Retorna (removido: bool)
+    """
+    conexao = _conectar()
+
+    with conexao:
+        cursor = conexao.execute("DELETE FROM enderecos WHERE tipo = ? AND nome = ?", (tipo, nome))
+
+    return cursor.rowcount > 0
+
+# ---- Fim das Funções de Endereço ----
+
+# ---- Funções de Histórico ----
+
+def _colunas_filtro(consulta):
+    """
+    Extrai da consulta os valores das colunas de filtro: a data vira texto ISO (ordenável) e o valor excedente vira número.
+    Retorna (valores: tuple na ordem de COLUNAS_FILTRO_HISTORICO)
+    """
+    # Consultas novas já vêm com a data em ISO e o valor em centavos; as antigas vinham como texto formatado
+    calculado_em = None
+    for formato in ("%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S"):
+        try:
+            calculado_em = datetime.strptime(consulta.get("data_calculo"), formato).strftime("%Y-%m-%d %H:%M:%S")
+            break
+        except (TypeError, ValueError):
+            continue
+
+    if "valor_excedente_centavos" in consulta:
+        valor_excedente = consulta["valor_excedente_centavos"] / 100
+    else:
+        try:
+            valor_excedente = float(str(consulta.get("valor_excedente")).replace("R$", "").strip())
+        except ValueError:
+            valor_excedente = None
+
+    return (consulta.get("origem"), consulta.get("destino_1"), consulta.get("recarga"), consulta.get("destino_2"),
+            calculado_em, valor_excedente)
+
+def _linha_historico(id_consulta, consulta):
+    """Monta os valores de uma linha da tabela historico, na ordem de INSERIR_HISTORICO."""
+    return (id_consulta, json.dumps(consulta, ensure_ascii=False), *_colunas_filtro(consulta))
+
+INSERIR_HISTORICO = f"""
+    INSERT OR IGNORE INTO historico (id, registrado_em, dados, {', '.join(COLUNAS_FILTRO_HISTORICO)})
+    VALUES (?, datetime('now'), ?{', ?' * len(COLUNAS_FILTRO_HISTORICO)})
+"""
+
+def migrar_historico_json(arquivo, gerar_id):
+    """
+    Importa, uma única vez, as consultas do antigo historico.json para o banco. Recebe a função que gera o id de cada consulta.
+    Retorna (quantidade importada: int)
+    """
+    conexao = _conectar()
+
+    if conexao.execute("SELECT 1 FROM meta WHERE chave = 'migracao_historico_json'").fetchone():
+        return 0
+
+    consultas = []
+    if os.path.exists(arquivo):
+        with open(arquivo, "r", encoding="utf-8") as f:
+            consultas = json.load(f)
+
+    with conexao:
+        # Mesma proteção da migração de endereços: a marca entra primeiro, na mesma transação das consultas
+        marca = conexao.execute("INSERT OR IGNORE INTO meta (chave, valor) VALUES ('migracao_historico_json', ?)", (arquivo,))
+
+        if marca.rowcount == 0:
+            return 0
+
+        antes = conexao.total_changes
+        conexao.executemany(INSERIR_HISTORICO, [_linha_historico(gerar_id(consulta), consulta) for consulta in consultas])
+        importados = conexao.total_changes - antes
+
+    return importados
+
+@rastrear()
+def registrar_historico(id_consulta, consulta, retencao=RETENCAO_HISTORICO):
+    """
+    Acrescenta uma consulta ao histórico. Gravar de novo o mesmo id não tem efeito, então a chamada pode ser repetida sem duplicar.
+    Quando a retenção é ultrapassada, as consultas mais antigas são descartadas.
+    Retorna (inserida: bool)
+    """
+    conexao = _conectar()
+
+    with conexao:
+        cursor = conexao.execute(INSERIR_HISTORICO, _linha_historico(id_consulta, consulta))
+
+        if cursor.rowcount == 0:
+            return False
+
+        conexao.execute("DELETE FROM historico WHERE seq <= ?", (cursor.lastrowid - retencao,))
+
+    return True
+
+@rastrear()
+def ler_historico(pagina=0, tamanho=50):
+    """
+    Lê uma página do histórico, da consulta mais recente para a mais antiga.
+    Retorna (consultas: list[dict])
+    """
+    linhas = _conectar().execute(
+        "SELECT dados FROM historico ORDER BY seq DESC LIMIT ? OFFSET ?", (tamanho, pagina * tamanho)
+    )
+
+    return [json.loads(linha["dados"]) for linha in linhas]
+
+@rastrear()
+def consultar_historico(origem=None, destino=None, recarga=None, data_inicio=None, data_fim=None, valor_minimo=None, valor_maximo=None,
+                        ordenar_por="calculado_em", decrescente=True, pagina=0, tamanho=50):
+    """
+    Busca no histórico com filtros, ordenação e paginação feitos no próprio banco (usando os índices das colunas de filtro).
+    O filtro de destino vale tanto para o Destino 1 quanto para o Destino 2. As datas são 'AAAA-MM-DD' (ou date/datetime) e o intervalo inclui as pontas.
+    Retorna (consultas: list[dict] da página pedida, total: int de consultas que atendem aos filtros)
+    """
+    if ordenar_por not in COLUNAS_FILTRO_HISTORICO:
+        raise ValueError(f"Não é possível ordenar o histórico por '{ordenar_por}'.")
+
+    condicoes = []
+    parametros = []
+
+    if origem is not None:
+        condicoes.append("origem = ?")
+        parametros.append(origem)
+
+    if destino is not None:
+        condicoes.append("(destino_1 = ? OR destino_2 = ?)")
+        parametros += [destino, destino]
+
+    if recarga is not None:
+        condicoes.append("recarga = ?")
+        parametros.append(recarga)
+
+    if data_inicio is not None:
+        condicoes.append("calculado_em >= ?")
+        parametros.append(str(data_inicio)[:10])
+
+    if data_fim is not None:
+        condicoes.append("calculado_em < date(?, '+1 day')")
+        parametros.append(str(data_fim)[:10])
+
+    if valor_minimo is not None:
+        condicoes.append("valor_excedente >= ?")
+        parametros.append(valor_minimo)
+
+    if valor_maximo is not None:
+        condicoes.append("valor_excedente <= ?")
+        parametros.append(valor_maximo)
+
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    direcao = "DESC" if decrescente else "ASC"
+    conexao = _conectar()
+
+    total = conexao.execute(f"SELECT COUNT(*) FROM historico {where}", parametros).fetchone()[0]
+    linhas = conexao.execute(
+        f"SELECT dados FROM historico {where} ORDER BY {ordenar_por} {direcao}, seq {direcao} LIMIT ? OFFSET ?",
+        parametros + [tamanho, pagina * tamanho]
+    )
+
+    return [json.loads(linha["dados"]) for linha in linhas], total
+
+def valores_historico(coluna):
+    """
+    Lista os valores distintos de uma coluna de filtro do histórico (para montar as opções dos filtros na tela).
+    Retorna (valores: list)
+    """
+    if coluna not in COLUNAS_FILTRO_HISTORICO:
+        raise ValueError(f"Coluna '{coluna}' não é uma coluna de filtro do histórico.")
+
+    linhas = _conectar().execute(f"SELECT DISTINCT {coluna} FROM historico WHERE {coluna} IS NOT NULL ORDER BY {coluna}")
+
+    return [linha[0] for linha in linhas]
+
+@rastrear()
+def contar_historico():
+    """Retorna (quantidade de consultas no histórico: int)"""
+    return _conectar().execute("SELECT COUNT(*) FROM historico").fetchone()[0]
+
+def apagar_historico():
+    """Apaga todas as consultas do histórico."""
+    conexao = _conectar()
+
+    with conexao:
+        conexao.execute("DELETE FROM historico")
+
+# ---- Fim das Funções de Histórico ----
+
+# ---- Funções de Consumo da API ----
+
+@rastrear()
+def reservar_chamada(dia, sku, limite=None):
+    """
+    Soma uma chamada ao contador do SKU no dia ('AAAA-MM-DD') se ele ainda estiver abaixo do limite (None não limita).
+    A conferência e a soma acontecem na mesma transação, então o limite vale somando todos os processos que usam o banco.
+    Retorna (reservou: bool)
+    """
+    conexao = _conectar()
+
+    with conexao:
+        conexao.execute("INSERT OR IGNORE INTO consumo_api (dia, sku) VALUES (?, ?)", (dia, sku))
+        cursor = conexao.execute(
+            "UPDATE consumo_api SET chamadas = chamadas + 1 WHERE dia = ? AND sku = ? AND (? IS NULL OR chamadas < ?)",
+            (dia, sku, limite, limite)
+        )
+
+    return cursor.rowcount == 1
+
+@rastrear()
+def registrar_consumo(contagens):
+    """
+    Soma, em uma única transação, os contadores de uso acumulados por dia e SKU.
+    Recebe (contagens: dict -> (dia, sku): dict com acertos_cache, degradadas e/ou bloqueadas)
+    """
+    conexao = _conectar()
+
+    with conexao:
+        conexao.executemany("""
+            INSERT INTO consumo_api (dia, sku, acertos_cache, degradadas, bloqueadas) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (dia, sku) DO UPDATE SET acertos_cache = acertos_cache + excluded.acertos_cache,
+                                                 degradadas = degradadas + excluded.degradadas,
+                                                 bloqueadas = bloqueadas + excluded.bloqueadas
+        """, [(dia, sku, contagem.get("acertos_cache", 0), contagem.get("degradadas", 0), contagem.get("bloqueadas", 0))
+              for (dia, sku), contagem in contagens.items()])
+
+def ler_consumo(dia_inicio, dia_fim=None):
+    """
+    Lê os contadores de uso por dia e SKU no intervalo (inclui as pontas; sem fim, só o dia de início).
+    Retorna (consumo: list[dict] com dia, sku, chamadas, acertos_cache, degradadas e bloqueadas)
+    """
+    linhas = _conectar().execute(
+        "SELECT * FROM consumo_api WHERE dia BETWEEN ? AND ? ORDER BY dia, sku", (dia_inicio, dia_fim or dia_inicio)
+    )
+
+    return [dict(linha) for linha in linhas]
+
+# ---- Fim das Funções de Consumo da API ----
@@ -0,0 +1,339 @@
+"""
+Benchmarks do Vectura contra o servidor simulado das APIs do Google (servidor_simulado.py), sem rede e sem chave.
+
+Cada execução roda em um diretório temporário (bancos e cache novos) e grava os resultados em JSON em benchmarks/resultados/,
+com o commit e a máquina, para comparar execuções: python benchmarks/executar.py --comparar benchmarks/resultados/<anterior>.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados")
+
+sys.path.insert(0, RAIZ)
+
+from servidor_simulado import iniciar_servidor, CAMINHO_ROTAS, CAMINHO_GEOCODE
+
+LATENCIA = 0.05 # Latência simulada de cada chamada às APIs (segundos)
+JITTER = 0.02
+CONCORRENCIAS = [1, 2, 4, 8]
+TAMANHOS_ENDERECOS = [100, 1_000, 10_000]
+TAMANHOS_HISTORICO = [1_000, 10_000, 50_000]
+PONTOS_POLILINHA = {"curta": 200, "longa": 20_000}
+
+resultados = []
+
+# ---- Medição ----
+
+def medir(nome, funcao, repeticoes=10, preparar=None, **parametros):
+    """Roda 'funcao' várias vezes (chamando 'preparar' antes de cada uma, fora da medição) e guarda as estatísticas em ms."""
+    tempos = []
+
+    for _ in range(repeticoes):
+        if preparar is not None:
+            preparar()
+
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    tempos.sort()
+    registro = {"nome": nome,
+                "parametros": parametros,
+                "repeticoes": repeticoes,
+                "media_ms": statistics.fmean(tempos),
+                "mediana_ms": statistics.median(tempos),
+                "p95_ms": tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))],
+                "min_ms": tempos[0],
+                "max_ms": tempos[-1]}
+
+    resultados.append(registro)
+    print(f"  {nome} {parametros or ''}: mediana {registro['mediana_ms']:.2f} ms (p95 {registro['p95_ms']:.2f} ms)")
+
+    return registro
+
+def registrar(nome, **valores):
+    """Guarda um resultado que não é um tempo por chamada (ex.: vazão)."""
+    resultados.append({"nome": nome, **valores})
+    print(f"  {nome}: {valores}")
+
+# ---- Fim da Medição ----
+
+# ---- Dados Sintéticos ----
+
+def endereco_sintetico(tipo, numero):
+    return f"Rua {tipo} {numero}, {numero % 900 + 100} - São Paulo, SP"
+
+def cadastrar(quantidade, tipos=("Origem", "Destino", "Recarga"), inicio=0):
+    """Cadastra endereços direto no banco (sem geocodificação), com coordenadas aleatórias no estado."""
+    from banco import inserir_endereco
+
+    aleatorio = random.Random(inicio)
+
+    for numero in range(inicio, inicio + quantidade):
+        tipo = tipos[numero % len(tipos)]
+        endereco = endereco_sintetico(tipo, numero)
+        registro = {"endereco_formatado": endereco,
+                    "latitude": aleatorio.uniform(-24.5, -20.5),
+                    "longitude": aleatorio.uniform(-52.5, -44.5),
+                    "cep": "",
+                    "data_cadastro": datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
+
+        inserir_endereco(tipo, f"{tipo} {numero}", registro, endereco.lower())
+
+def consulta_sintetica(numero):
+    return {"data_calculo": f"2026-{numero % 12 + 1:02}-{numero % 28 + 1:02} 10:00:00",
+            "origem": endereco_sintetico("Origem", numero % 5),
+            "destino_1": endereco_sintetico("Destino", numero % 40),
+            "recarga": endereco_sintetico("Recarga", numero % 20),
+            "destino_2": endereco_sintetico("Destino", (numero + 7) % 40),
+            "simples_metros": 100_000 + numero,
+            "simples_segundos": 4_000,
+            "simples_pedagio_centavos": 5_000,
+            "total_metros": 250_000 + numero,
+            "total_segundos": 9_000,
+            "total_pedagio_centavos": 12_000,
+            "diferenca_metros": 150_000,
+            "diferenca_segundos": 5_000,
+            "diferenca_pedagio_centavos": 7_000,
+            "racional": 12.0,
+            "valor_excedente_centavos": 187_000 + numero}
+
+# ---- Fim dos Dados Sintéticos ----
+
+# ---- Benchmarks ----
+
+def bench_vectura():
+    from cache import limpar_cache
+    from utils import vectura
+
+    paradas = [endereco_sintetico("Origem", 1), endereco_sintetico("Destino", 2), endereco_sintetico("Recarga", 3), endereco_sintetico("Destino", 4)]
+
+    def cotar():
+        status, mensagem, _ = vectura(*paradas, chave_api="bench", racional=12.0, usar_matriz=False, roteamento="google")
+        assert status, mensagem
+
+    medir("vectura", cotar, repeticoes=10, preparar=limpar_cache, cache="frio")
+    medir("vectura", cotar, repeticoes=20, preparar=lambda: limpar_cache("cotacoes"), cache="rotas")
+    medir("vectura", cotar, repeticoes=50, cache="cotacao")
+
+def bench_lote(diretorio):
+    import pandas as pd
+    from cache import limpar_cache
+    from lote import cotar_lote
+
+    cadastrar(65, tipos=("Origem",) * 5 + ("Destino",) * 40 + ("Recarga",) * 20, inicio=100_000)
+
+    from utils import carregar_enderecos
+    enderecos = carregar_enderecos()
+    aleatorio = random.Random(1)
+    lanes = []
+
+    for _ in range(200):
+        destino, destino_2 = aleatorio.sample(sorted(enderecos["Destino"]), 2)
+        lanes.append({"origem": aleatorio.choice(sorted(enderecos["Origem"])), "destino": destino,
+                      "recarga": aleatorio.choice(sorted(enderecos["Recarga"])), "destino_2": destino_2})
+
+    entrada = os.path.join(diretorio, "lanes.csv")
+    pd.DataFrame(lanes).to_csv(entrada, index=False)
+
+    for concorrencia in CONCORRENCIAS:
+        limpar_cache()
+
+        inicio = time.perf_counter()
+        resumo = cotar_lote(entrada, os.path.join(diretorio, "saida.jsonl"), "bench", 12.0, max_workers=concorrencia, requisicoes_por_segundo=1_000)
+        duracao = time.perf_counter() - inicio
+
+        registrar("lote", parametros={"concorrencia": concorrencia}, lanes=resumo["lanes"], rotas_unicas=resumo["rotas_unicas"],
+                  falhas=resumo["falhas"], duracao_s=duracao, cotacoes_por_segundo=resumo["lanes"] / duracao)
+
+def bench_mapa():
+    import numpy as np
+    from polilinha import codificar
+    import utils
+
+    aleatorio = np.random.default_rng(0)
+
+    for nome, pontos in PONTOS_POLILINHA.items():
+        rota = np.column_stack((-23.5 + np.cumsum(aleatorio.normal(0, 5e-4, pontos)), -46.6 + np.cumsum(aleatorio.normal(0, 5e-4, pontos))))
+        polilinha = codificar(rota)
+
+        def limpar():
+            utils.gerar_mapa.clear()
+            utils.pontos_mapa.clear()
+
+        # O HTML do mapa é o que o st_folium serializa para o navegador
+        medir("gerar_mapa", lambda: utils.gerar_mapa(polilinha).get_root().render(), repeticoes=10, preparar=limpar, polilinha=nome, pontos=pontos)
+        medir("gerar_mapa", lambda: utils.gerar_mapa(polilinha), repeticoes=50, polilinha=nome, pontos=pontos, cache="quente")
+
+def bench_enderecos():
+    from geografia import construir_indice
+    from banco import endereco_existe, inserir_endereco
+    from utils import carregar_enderecos, excluir_enderecos
+
+    cadastrados = 0
+    proximo = 200_000
+
+    for tamanho in TAMANHOS_ENDERECOS:
+        cadastrar(tamanho - cadastrados, inicio=cadastrados)
+        cadastrados = tamanho
+
+        enderecos = carregar_enderecos()
+        indice = construir_indice(enderecos)
+        novos = []
+
+        # Caminho de armazenamento do cadastro (a geocodificação e a matriz de trechos dependem da API e ficam de fora)
+        def salvar():
+            nonlocal proximo
+            endereco = endereco_sintetico("Destino", proximo)
+            registro = {"endereco_formatado": endereco, "latitude": -23.0, "longitude": -46.0, "cep": "", "data_cadastro": ""}
+            nome = f"Novo {proximo}"
+            proximo += 1
+
+            if not endereco_existe("Destino", endereco.lower()):
+                inserir_endereco("Destino", nome, registro, endereco.lower())
+                enderecos["Destino"][nome] = registro
+                indice.adicionar("Destino", nome, registro["latitude"], registro["longitude"])
+                novos.append(nome)
+
+        def excluir():
+            excluir_enderecos("Destino", novos.pop(), enderecos, indice)
+
+        medir("salvar_endereco", salvar, repeticoes=50, enderecos=tamanho)
+        medir("excluir_endereco", excluir, repeticoes=50, enderecos=tamanho)
+        medir("carregar_enderecos", carregar_enderecos, repeticoes=10, enderecos=tamanho)
+
+def bench_historico():
+    from banco import registrar_historico, ler_historico, consultar_historico
+    from utils import gerar_id_consulta
+
+    gravados = 0
+
+    for tamanho in TAMANHOS_HISTORICO:
+        for numero in range(gravados, tamanho):
+            consulta = consulta_sintetica(numero)
+            registrar_historico(gerar_id_consulta(consulta), consulta)
+
+        gravados = tamanho
+        extra = iter(range(10**9, 10**9 + 1000))
+
+        def gravar():
+            consulta = consulta_sintetica(next(extra))
+            registrar_historico(gerar_id_consulta(consulta), consulta)
+
+        medir("historico_gravar", gravar, repeticoes=50, consultas=tamanho)
+        medir("historico_ler_pagina", lambda: ler_historico(0, 50), repeticoes=50, consultas=tamanho)
+        medir("historico_filtrar", lambda: consultar_historico(origem=endereco_sintetico("Origem", 1), valor_minimo=1870, ordenar_por="valor_excedente", pagina=2, tamanho=50),
+              repeticoes=50, consultas=tamanho)
+
+BENCHMARKS = {"vectura": bench_vectura, "lote": bench_lote, "mapa": bench_mapa, "enderecos": bench_enderecos, "historico": bench_historico}
+
+# ---- Fim dos Benchmarks ----
+
+# ---- Resultados ----
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def chave_resultado(registro):
+    return registro["nome"], json.dumps(registro.get("parametros", {}), sort_keys=True)
+
+def comparar(atual, anterior):
+    """Mostra, para cada medição presente nas duas execuções, a razão entre a mediana (ou a vazão) atual e a anterior."""
+    antigos = {chave_resultado(registro): registro for registro in anterior["resultados"]}
+
+    print(f"\nComparação com {anterior['commit']} ({anterior['data']}):")
+
+    for registro in atual["resultados"]:
+        antigo = antigos.get(chave_resultado(registro))
+
+        if antigo is None:
+            continue
+
+        campo = "mediana_ms" if "mediana_ms" in registro else "cotacoes_por_segundo"
+        razao = registro[campo] / antigo[campo] if antigo[campo] else float("inf")
+
+        print(f"  {registro['nome']} {registro.get('parametros', {})}: {antigo[campo]:.2f} → {registro[campo]:.2f} {campo} ({razao:.2f}x)")
+
+# ---- Fim dos Resultados ----
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do Vectura contra o servidor simulado das APIs do Google.")
+    parser.add_argument("--apenas", nargs="+", choices=list(BENCHMARKS), help="Roda só os benchmarks escolhidos.")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultados (padrão: benchmarks/resultados/<data>_<commit>.json).")
+    parser.add_argument("--comparar", default=None, help="Arquivo JSON de uma execução anterior, para comparar.")
+    parser.add_argument("--latencia", type=float, default=LATENCIA, help="Latência simulada das APIs (segundos).")
+    parser.add_argument("--rapido", action="store_true", help="Tamanhos menores, para conferir que tudo roda (os números não servem para comparar).")
+    args = parser.parse_args()
+
+    if args.rapido:
+        global TAMANHOS_ENDERECOS, TAMANHOS_HISTORICO
+        TAMANHOS_ENDERECOS = [100, 1_000]
+        TAMANHOS_HISTORICO = [1_000]
+
+    # Fora do "streamlit run" os caches do Streamlit avisam que estão só em memória, o que é o esperado aqui. O logger é pego
+    # pelo get_logger do Streamlit, que só define o nível na criação: um logging.getLogger comum teria o nível trocado depois.
+    from streamlit.logger import get_logger
+    get_logger("streamlit.runtime.caching.cache_data_api").setLevel(logging.ERROR)
+
+    servidor, url_base = iniciar_servidor(latencia=args.latencia, jitter=min(JITTER, args.latencia), semente=0)
+    os.environ["VECTURA_URL_ROTAS"] = url_base + CAMINHO_ROTAS
+    os.environ["VECTURA_URL_GEOCODE"] = url_base + CAMINHO_GEOCODE
+
+    # Bancos, cache e arquivos do aplicativo são criados no diretório atual: cada execução começa do zero
+    diretorio = tempfile.mkdtemp(prefix="vectura_bench_")
+    os.chdir(diretorio)
+
+    # Os benchmarks medem o aplicativo, não o orçamento da API: sem limites de chamadas
+    from consumo import configurar_orcamentos, ORCAMENTOS
+    configurar_orcamentos({sku: (None, None) for sku in ORCAMENTOS})
+
+    inicio = time.perf_counter()
+
+    for nome in args.apenas or list(BENCHMARKS):
+        print(f"▶ {nome}")
+        funcao = BENCHMARKS[nome]
+        funcao(diretorio) if nome == "lote" else funcao()
+
+    servidor.shutdown()
+
+    execucao = {"commit": commit_atual(),
+                "data": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "plataforma": platform.platform(),
+                "latencia_simulada_s": args.latencia,
+                "rapido": args.rapido,
+                "duracao_total_s": time.perf_counter() - inicio,
+                "requisicoes_servidor": servidor.contagem,
+                "resultados": resultados}
+
+    saida = args.saida or os.path.join(DIR_RESULTADOS, f"{datetime.now():%Y%m%d_%H%M%S}_{execucao['commit'] or 'sem_commit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(execucao, f, ensure_ascii=False, indent=2)
+
+    print(f"\n✅ Resultados salvos em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            comparar(execucao, json.load(f))
+
+
+if __name__ == "__main__":
+
+    main()
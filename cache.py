@@ -0,0 +1,134 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from rastreamento import rastrear, anotar
+
+ARQUIVO_CACHE = "cache.db"
+
+# Configurações padrão de cada tabela do cache: (tempo de vida em segundos, quantidade máxima de entradas)
+CONFIG_CACHE = {
+    "rotas": (60 * 60 * 24 * 7, 5000),
+    "geocode": (60 * 60 * 24 * 90, 20000),
+    "cotacoes": (60 * 60 * 24 * 7, 5000), # Mesmo tempo de vida das rotas, para que uma cotação não sobreviva aos dados que a geraram
+}
+
+_local = threading.local()
+
+# ---- Funções de Conexão ----
+
+def _conectar():
+    """
+    Abre (uma vez por thread) a conexão com o arquivo de cache e garante que a tabela exista.
+    Retorna (conexao: sqlite3.Connection)
+    """
+    conexao = getattr(_local, "conexao", None)
+
+    if conexao is None:
+        conexao = sqlite3.connect(ARQUIVO_CACHE, timeout=30)
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        conexao.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                tabela TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL,
+                PRIMARY KEY (tabela, chave)
+            )
+        """)
+        conexao.execute("CREATE INDEX IF NOT EXISTS idx_cache_acesso ON cache (tabela, ultimo_acesso)")
+        conexao.commit()
+        _local.conexao = conexao
+
+    return conexao
+
+# ---- Fim das Funções de Conexão ----
+
+# ---- Funções de Cache ----
+
+def gerar_chave(*partes):
+    """
+    Gera uma chave estável (hash) a partir das partes informadas, respeitando a ordem delas.
+    Retorna (chave: str)
+    """
+    texto = json.dumps(partes, ensure_ascii=False, sort_keys=True)
+
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+@rastrear()
+def ler_cache(tabela, chave):
+    """
+    Procura a chave na tabela do cache. Entradas vencidas são descartadas e entradas encontradas têm o último acesso atualizado (LRU).
+    Retorna (valor: objeto salvo ou None)
+    """
+    ttl, _ = CONFIG_CACHE[tabela]
+    agora = time.time()
+    conexao = _conectar()
+    anotar(tabela=tabela, acerto=False)
+
+    linha = conexao.execute(
+        "SELECT valor, criado_em FROM cache WHERE tabela = ? AND chave = ?", (tabela, chave)
+    ).fetchone()
+
+    if linha is None:
+        return None
+
+    valor, criado_em = linha
+
+    # Entrada vencida: remove e trata como ausente
+    if agora - criado_em > ttl:
+        conexao.execute("DELETE FROM cache WHERE tabela = ? AND chave = ?", (tabela, chave))
+        conexao.commit()
+        return None
+
+    conexao.execute(
+        "UPDATE cache SET ultimo_acesso = ? WHERE tabela = ? AND chave = ?", (agora, tabela, chave)
+    )
+    conexao.commit()
+    anotar(acerto=True)
+
+    return json.loads(valor)
+
+@rastrear()
+def gravar_cache(tabela, chave, valor):
+    """
+    Grava o valor na tabela do cache e remove as entradas menos usadas quando o limite da tabela é ultrapassado.
+    """
+    _, limite = CONFIG_CACHE[tabela]
+    agora = time.time()
+    conexao = _conectar()
+    anotar(tabela=tabela)
+
+    with conexao:
+        conexao.execute(
+            "INSERT OR REPLACE INTO cache (tabela, chave, valor, criado_em, ultimo_acesso) VALUES (?, ?, ?, ?, ?)",
+            (tabela, chave, json.dumps(valor, ensure_ascii=False), agora, agora)
+        )
+
+        # Despejo LRU: mantém apenas as 'limite' entradas acessadas mais recentemente
+        conexao.execute("""
+            DELETE FROM cache WHERE tabela = ? AND chave IN (
+                SELECT chave FROM cache WHERE tabela = ?
+                ORDER BY ultimo_acesso DESC LIMIT -1 OFFSET ?
+            )
+        """, (tabela, tabela, limite))
+
+def limpar_cache(tabela=None):
+    """
+    Apaga todas as entradas do cache, ou somente as da tabela informada.
+    Retorna (sucesso: bool, mensagem: str)
+    """
+    conexao = _conectar()
+
+    with conexao:
+        if tabela is None:
+            conexao.execute("DELETE FROM cache")
+        else:
+            conexao.execute("DELETE FROM cache WHERE tabela = ?", (tabela,))
+
+    return True, "✅ Cache limpo com sucesso."
+
+# ---- Fim das Funções de Cache ----
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from rastreamento import rastrear, anotar
+
+TIMEOUT_CONEXAO = 5 # Tempo máximo (em segundos) para abrir a conexão
+TIMEOUT_LEITURA = 25 # Tempo máximo (em segundos) esperando a resposta
+TENTATIVAS = 3 # Quantidade máxima de tentativas por requisição
+ESPERA_BASE = 0.5 # Espera (em segundos) antes da primeira nova tentativa, dobrada a cada tentativa
+ESPERA_MAXIMA = 8 # Limite da espera entre tentativas
+TAMANHO_POOL = 10 # Conexões mantidas abertas por host
+
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+
+# Gravação e reprodução das respostas das APIs: "gravar" salva cada resposta real em DIR_GRAVACOES,
+# "reproduzir" responde só com o que foi gravado (sem rede); vazio desliga
+MODO_GRAVACAO = os.environ.get("VECTURA_GRAVACAO", "")
+DIR_GRAVACOES = os.environ.get("VECTURA_DIR_GRAVACOES", "fixtures")
+
+_sessao = None
+
+# ---- Funções de Sessão ----
+
+def obter_sessao():
+    """
+    Cria (uma única vez) a sessão HTTP compartilhada, que mantém as conexões abertas (keep-alive) entre as chamadas.
+    Retorna (sessao: requests.Session)
+    """
+    global _sessao
+
+    if _sessao is None:
+        sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=TAMANHO_POOL, pool_maxsize=TAMANHO_POOL)
+        sessao.mount("https://", adaptador)
+        sessao.mount("http://", adaptador)
+        _sessao = sessao
+
+    return _sessao
+
+def calcular_espera(tentativa, resposta=None):
+    """
+    Calcula a espera antes da próxima tentativa: backoff exponencial com jitter, ou o Retry-After enviado pela API.
+    Retorna (espera: float)
+    """
+    if resposta is not None:
+        retry_after = resposta.headers.get("Retry-After", "")
+
+        if retry_after.isdigit():
+            return min(float(retry_after), ESPERA_MAXIMA)
+
+    limite = min(ESPERA_MAXIMA, ESPERA_BASE * (2 ** tentativa))
+
+    return random.uniform(0, limite)
+
+@rastrear()
+def requisitar(metodo, url, timeout=None, tentativas=TENTATIVAS, **kwargs):
+    """
+    Faz a requisição pela sessão compartilhada, com timeout e novas tentativas em falhas de rede e status 429/5xx.
+    Retorna (resposta: requests.Response). Se todas as tentativas falharem por erro de rede, a última exceção é lançada.
+    """
+    if MODO_GRAVACAO:
+        chave = chave_gravacao(metodo, url, kwargs.get("params"), kwargs.get("json"))
+
+    anotar(metodo=metodo, caminho=urlsplit(url).path)
+
+    if MODO_GRAVACAO == "reproduzir":
+        gravacao = ler_gravacao(chave)
+
+        if gravacao is None:
+            raise requests.ConnectionError(f"Nenhuma resposta gravada para {metodo} {urlsplit(url).path}.")
+
+        return resposta_gravada(gravacao)
+
+    sessao = obter_sessao()
+
+    if timeout is None:
+        timeout = (TIMEOUT_CONEXAO, TIMEOUT_LEITURA)
+
+    for tentativa in range(tentativas):
+        ultima = tentativa == tentativas - 1
+
+        try:
+            resposta = sessao.request(metodo, url, timeout=timeout, **kwargs)
+
+        except (requests.ConnectionError, requests.Timeout):
+            if ultima:
+                raise
+
+            time.sleep(calcular_espera(tentativa))
+            continue
+
+        if resposta.status_code in STATUS_REPETIVEIS and not ultima:
+            time.sleep(calcular_espera(tentativa, resposta))
+            continue
+
+        anotar(status=resposta.status_code, tentativas=tentativa + 1)
+
+        if MODO_GRAVACAO == "gravar":
+            gravar_gravacao(chave, metodo, url, kwargs.get("params"), kwargs.get("json"), resposta)
+
+        return resposta
+
+# ---- Fim das Funções de Sessão ----
+
+# ---- Gravação e Reprodução ----
+
+def configurar_gravacao(modo, diretorio=None):
+    """Liga ("gravar" ou "reproduzir") ou desliga ("") a gravação das respostas, sem depender das variáveis de ambiente."""
+    global MODO_GRAVACAO, DIR_GRAVACOES
+
+    MODO_GRAVACAO = modo
+    DIR_GRAVACOES = diretorio or DIR_GRAVACOES
+
+def chave_gravacao(metodo, url, parametros=None, corpo=None):
+    """
+    Identifica uma requisição pelo método, pelo caminho da URL (sem o servidor, para valer também no servidor simulado),
+    pelos parâmetros e pelo corpo. A chave da API fica de fora, então as gravações não guardam credenciais.
+    Retorna (chave: str)
+    """
+    parametros = {nome: valor for nome, valor in (parametros or {}).items() if nome != "key"}
+    texto = json.dumps([metodo.upper(), urlsplit(url).path, parametros, corpo], ensure_ascii=False, sort_keys=True)
+
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+def ler_gravacao(chave, diretorio=None):
+    """Retorna (gravacao: dict com metodo, caminho, parametros, corpo, status e resposta) ou None."""
+    caminho = os.path.join(diretorio or DIR_GRAVACOES, f"{chave}.json")
+
+    if not os.path.exists(caminho):
+        return None
+
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def gravar_gravacao(chave, metodo, url, parametros, corpo, resposta):
+    try:
+        conteudo = resposta.json()
+    except ValueError:
+        return
+
+    gravacao = {"metodo": metodo.upper(),
+                "caminho": urlsplit(url).path,
+                "parametros": {nome: valor for nome, valor in (parametros or {}).items() if nome != "key"},
+                "corpo": corpo,
+                "status": resposta.status_code,
+                "resposta": conteudo}
+
+    os.makedirs(DIR_GRAVACOES, exist_ok=True)
+
+    with open(os.path.join(DIR_GRAVACOES, f"{chave}.json"), "w", encoding="utf-8") as f:
+        json.dump(gravacao, f, ensure_ascii=False, indent=2)
+
+def resposta_gravada(gravacao):
+    """Retorna (resposta: requests.Response) montada a partir de uma gravação."""
+    resposta = requests.Response()
+    resposta.status_code = gravacao["status"]
+    resposta._content = json.dumps(gravacao["resposta"], ensure_ascii=False).encode("utf-8")
+    resposta.headers["Content-Type"] = "application/json"
+    resposta.encoding = "utf-8"
+
+    return resposta
+
+# ---- Fim da Gravação e Reprodução ----
+
+# ---- Controle de Taxa ----
+
+class LimitadorTaxa:
+    """
+    Balde de fichas (token bucket) compartilhado entre threads: libera no máximo 'taxa' chamadas por segundo, com rajadas de até 'capacidade'.
+    """
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = taxa
+        self.capacidade = capacidade if capacidade is not None else max(1, taxa)
+        self.fichas = self.capacidade
+        self.ultima_reposicao = time.monotonic()
+        self.trava = threading.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self.ultima_reposicao) * self.taxa)
+        self.ultima_reposicao = agora
+
+    def tentar(self):
+        """
+        Consome uma ficha se houver uma disponível, sem bloquear.
+        Retorna (espera: float -> 0 se a ficha foi consumida, senão os segundos até a próxima ficha)
+        """
+        with self.trava:
+            self._repor()
+
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return 0.0
+
+            return (1 - self.fichas) / self.taxa
+
+    def aguardar(self):
+        """Bloqueia até haver uma ficha disponível e a consome."""
+        while True:
+            espera = self.tentar()
+
+            if espera == 0:
+                return
+
+            time.sleep(espera)
+
+# ---- Fim do Controle de Taxa ----
@@ -0,0 +1,252 @@
+import atexit
+import threading
+import time
+from datetime import date, timedelta
+import requests
+from banco import reservar_chamada, registrar_consumo, ler_consumo
+from cliente_http import LimitadorTaxa
+from rastreamento import medir, anotar
+
+SKU_GEOCODING = "geocoding"
+SKU_ROTAS_ESSENTIALS = "rotas_essentials"
+SKU_ROTAS_PRO = "rotas_pro"
+SKU_ROTAS_ENTERPRISE = "rotas_enterprise"
+
+# Preço estimado de cada SKU em US$ por 1.000 chamadas (tabela pública do Google Maps Platform, sem descontos por volume)
+PRECOS_SKU = {
+    SKU_ROTAS_ESSENTIALS: 5.0,
+    SKU_ROTAS_PRO: 10.0,
+    SKU_ROTAS_ENTERPRISE: 15.0,
+    SKU_GEOCODING: 5.0,
+}
+
+# Orçamento de chamadas de cada SKU: (por minuto, por dia). None não limita.
+ORCAMENTOS = {
+    SKU_ROTAS_ESSENTIALS: (300, 20_000),
+    SKU_ROTAS_PRO: (300, 10_000),
+    SKU_ROTAS_ENTERPRISE: (120, 5_000),
+    SKU_GEOCODING: (60, 1_000),
+}
+
+ESPERA_ORCAMENTO = 5.0 # Tempo máximo (segundos) que uma chamada espera na fila por uma vaga no orçamento por minuto
+INTERVALO_GRAVACAO = 10.0 # Segundos entre as gravações, no banco, dos acertos de cache e das chamadas rebaixadas e bloqueadas
+
+# Níveis mais baratos de uma chamada computeRoutes, tentados em ordem quando o orçamento do nível pedido acaba:
+# (nome, routingPreference, com pedágios). Sem pedágios a chamada sai do SKU Enterprise; sem trânsito, do Pro.
+NIVEIS_ROTAS = (
+    ("sem_pedagio", "TRAFFIC_AWARE", False),
+    ("basico", "TRAFFIC_UNAWARE", False),
+)
+CAMPO_NIVEL = "vecturaNivel" # Marca, na resposta da API de Rotas, o nível usado quando a chamada foi rebaixada
+
+_limitadores = {}
+_pendentes = {} # (dia, sku) -> contadores ainda não gravados no banco
+_gravacao = {"ultima": time.monotonic()}
+_trava = threading.Lock()
+
+
+class OrcamentoEsgotado(requests.RequestException):
+    """O orçamento de chamadas de um SKU acabou. É uma falha de requisição: quem já trata falhas da API trata esta também."""
+
+# ---- SKUs e Preços ----
+
+def sku_rotas(body):
+    """Retorna (sku: str) cobrado por uma chamada computeRoutes com o corpo informado."""
+    preferencia = body.get("routingPreference")
+
+    if "TOLLS" in body.get("extraComputations", []) or preferencia == "TRAFFIC_AWARE_OPTIMAL":
+        return SKU_ROTAS_ENTERPRISE
+
+    if preferencia == "TRAFFIC_AWARE" or len(body.get("intermediates", [])) > 10:
+        return SKU_ROTAS_PRO
+
+    return SKU_ROTAS_ESSENTIALS
+
+def custo_usd(sku, chamadas):
+    return chamadas * PRECOS_SKU.get(sku, 0.0) / 1000
+
+def rebaixar_rotas(headers, body, preferencia, pedagios):
+    """Retorna (headers: dict, body: dict) de uma cópia da chamada com outra preferência de rota e, opcionalmente, sem pedágios."""
+    body = {**body, "routingPreference": preferencia}
+
+    if not pedagios:
+        body["extraComputations"] = [extra for extra in body.get("extraComputations", []) if extra != "TOLLS"]
+        campos = [campo for campo in headers["X-Goog-FieldMask"].split(",") if "tollInfo" not in campo]
+        headers = {**headers, "X-Goog-FieldMask": ",".join(campos)}
+
+    if preferencia == "TRAFFIC_UNAWARE":
+        body.pop("departureTime", None)
+
+    return headers, body
+
+def rotas_rebaixadas(*respostas):
+    """Retorna (rebaixadas: bool) se alguma das respostas veio de uma chamada rebaixada pelo orçamento."""
+    return any(resposta.get(CAMPO_NIVEL) for resposta in respostas)
+
+# ---- Fim dos SKUs e Preços ----
+
+# ---- Orçamento ----
+
+def _hoje():
+    return date.today().isoformat()
+
+def _limitador(sku):
+    por_minuto, _ = ORCAMENTOS.get(sku, (None, None))
+
+    if por_minuto is None:
+        return None
+
+    if sku not in _limitadores:
+        _limitadores[sku] = LimitadorTaxa(por_minuto / 60, capacidade=por_minuto)
+
+    return _limitadores[sku]
+
+def _tentar(sku):
+    """
+    Reserva uma chamada do SKU se houver orçamento agora, sem bloquear.
+    Retorna (espera: float -> 0 se reservou, segundos até a próxima vaga por minuto, ou infinito se o orçamento do dia acabou)
+    """
+    _, por_dia = ORCAMENTOS.get(sku, (None, None))
+
+    with _trava:
+        limitador = _limitador(sku)
+
+    espera = limitador.tentar() if limitador is not None else 0.0
+
+    if espera > 0:
+        return espera
+
+    # O orçamento por minuto é de cada processo; o do dia é conferido e somado no banco, valendo para o aplicativo, o lote e o serviço juntos
+    if not reservar_chamada(_hoje(), sku, por_dia):
+        return float("inf")
+
+    return 0.0
+
+def _contar(sku, campo):
+    # Os contadores que não limitam nada ficam em memória e vão para o banco de tempos em tempos, sem uma gravação por evento
+    with _trava:
+        contagem = _pendentes.setdefault((_hoje(), sku), {})
+        contagem[campo] = contagem.get(campo, 0) + 1
+        gravar = time.monotonic() - _gravacao["ultima"] >= INTERVALO_GRAVACAO
+
+    if gravar:
+        gravar_pendentes()
+
+def gravar_pendentes():
+    """Grava no banco os contadores acumulados em memória (a cada INTERVALO_GRAVACAO, antes de cada resumo e na saída do processo)."""
+    with _trava:
+        contagens = dict(_pendentes)
+        _pendentes.clear()
+        _gravacao["ultima"] = time.monotonic()
+
+    if contagens:
+        registrar_consumo(contagens)
+
+atexit.register(gravar_pendentes)
+
+def _reservar_na_fila(sku, espera_maxima=None):
+    """
+    Espera (até espera_maxima segundos; padrão ESPERA_ORCAMENTO, infinito espera o quanto for preciso) por uma vaga no orçamento do SKU.
+    Retorna (reservou: bool)
+    """
+    limite = time.monotonic() + (ESPERA_ORCAMENTO if espera_maxima is None else espera_maxima)
+
+    while True:
+        espera = _tentar(sku)
+
+        if espera == 0:
+            return True
+
+        if espera == float("inf") or time.monotonic() + espera > limite:
+            return False
+
+        with medir("consumo.fila", sku=sku):
+            time.sleep(espera)
+
+def reservar(sku, espera_maxima=None):
+    """Reserva uma chamada do SKU, esperando na fila se o orçamento por minuto estiver cheio. Sem orçamento, lança OrcamentoEsgotado."""
+    if not _reservar_na_fila(sku, espera_maxima):
+        _contar(sku, "bloqueadas")
+        raise OrcamentoEsgotado(f"Orçamento de chamadas da API esgotado ({sku}).")
+
+def reservar_rotas(headers, body, rebaixar=True, espera_maxima=None):
+    """
+    Reserva uma chamada computeRoutes. Sem vaga no orçamento do SKU pedido (depois da espera na fila), usa o primeiro nível
+    mais barato que ainda tenha orçamento; sem nenhum, lança OrcamentoEsgotado.
+    Retorna (headers: dict, body: dict, nivel: str -> "completo" ou o nome do nível usado)
+    """
+    sku = sku_rotas(body)
+
+    if _reservar_na_fila(sku, espera_maxima):
+        return headers, body, "completo"
+
+    if rebaixar:
+        for nivel, preferencia, pedagios in NIVEIS_ROTAS:
+            headers_nivel, body_nivel = rebaixar_rotas(headers, body, preferencia, pedagios)
+            sku_nivel = sku_rotas(body_nivel)
+
+            if sku_nivel != sku and _tentar(sku_nivel) == 0:
+                _contar(sku, "degradadas")
+                anotar(nivel=nivel)
+                return headers_nivel, body_nivel, nivel
+
+    _contar(sku, "bloqueadas")
+    raise OrcamentoEsgotado(f"Orçamento de chamadas da API de Rotas esgotado ({sku}).")
+
+def registrar_acerto(sku):
+    """Conta uma resposta que veio do cache em vez da API."""
+    _contar(sku, "acertos_cache")
+
+def configurar_orcamentos(orcamentos=None, espera_maxima=None):
+    """Troca os orçamentos (todos ou alguns SKUs) e a espera máxima na fila. Os baldes por minuto recomeçam cheios."""
+    global ESPERA_ORCAMENTO
+
+    with _trava:
+        if orcamentos is not None:
+            ORCAMENTOS.update(orcamentos)
+            _limitadores.clear()
+
+        if espera_maxima is not None:
+            ESPERA_ORCAMENTO = espera_maxima
+
+# ---- Fim do Orçamento ----
+
+# ---- Resumo ----
+
+def resumo_consumo(dias=1):
+    """
+    Resume o uso da API nos últimos 'dias' (1 = só hoje), por SKU, com o custo estimado e o que resta do orçamento de hoje.
+    Retorna (resumo: list[dict])
+    """
+    gravar_pendentes()
+
+    hoje = date.today()
+    linhas = ler_consumo((hoje - timedelta(days=dias - 1)).isoformat(), hoje.isoformat())
+    totais = {sku: {"chamadas": 0, "acertos_cache": 0, "degradadas": 0, "bloqueadas": 0, "chamadas_hoje": 0} for sku in ORCAMENTOS}
+
+    for linha in linhas:
+        total = totais.setdefault(linha["sku"], {"chamadas": 0, "acertos_cache": 0, "degradadas": 0, "bloqueadas": 0, "chamadas_hoje": 0})
+
+        for campo in ("chamadas", "acertos_cache", "degradadas", "bloqueadas"):
+            total[campo] += linha[campo]
+
+        if linha["dia"] == hoje.isoformat():
+            total["chamadas_hoje"] = linha["chamadas"]
+
+    resumo = []
+
+    for sku, total in totais.items():
+        por_minuto, por_dia = ORCAMENTOS.get(sku, (None, None))
+        consultas = total["chamadas"] + total["acertos_cache"]
+
+        resumo.append({"sku": sku,
+                       **total,
+                       "taxa_acerto": total["acertos_cache"] / consultas if consultas else None,
+                       "custo_usd": custo_usd(sku, total["chamadas"]),
+                       "limite_minuto": por_minuto,
+                       "limite_dia": por_dia,
+                       "restante_dia": None if por_dia is None else max(0, por_dia - total["chamadas_hoje"])})
+
+    return resumo
+
+# ---- Fim do Resumo ----
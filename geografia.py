@@ -0,0 +1,240 @@
+import numpy as np
+
+RAIO_TERRA_KM = 6371.0088
+
+# ---- Funções de Distância ----
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Calcula a distância em linha reta (sobre a superfície da Terra) entre pontos. Aceita números ou arrays NumPy,
+    seguindo as regras de broadcasting (ex.: um ponto contra vários, ou uma coluna contra uma linha para montar uma matriz).
+    Retorna (distancia_km: float ou np.ndarray)
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(valor, dtype=float)) for valor in (lat1, lon1, lat2, lon2))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+# ---- Fim das Funções de Distância ----
+
+# ---- Índice Espacial ----
+
+CELULA_GRAUS = 0.25 # Tamanho (em graus) de cada célula da grade do índice, cerca de 28 km na latitude de São Paulo
+KM_POR_GRAU = 111.32
+
+class IndiceEspacial:
+    """
+    Índice espacial em grade para os endereços cadastrados, separado por tipo (Origem, Destino, Recarga).
+    As coordenadas ficam em arrays NumPy e cada célula da grade guarda as posições dos pontos que caem nela,
+    então as consultas só calculam distâncias para os pontos das células próximas. Inclusões e exclusões são incrementais.
+    """
+
+    def __init__(self, celula_graus=CELULA_GRAUS):
+        self.celula_graus = celula_graus
+        self.tipos = {}
+
+    def _tipo(self, tipo):
+        if tipo not in self.tipos:
+            self.tipos[tipo] = {"lat": np.empty(16), "lon": np.empty(16), "nomes": [], "posicoes": {}, "celulas": {}}
+
+        return self.tipos[tipo]
+
+    def _celula(self, lat, lon):
+        return int(np.floor(lat / self.celula_graus)), int(np.floor(lon / self.celula_graus))
+
+    def adicionar(self, tipo, nome, lat, lon):
+        """Inclui (ou move) um ponto no índice."""
+        dados = self._tipo(tipo)
+
+        if nome in dados["posicoes"]:
+            self.remover(tipo, nome)
+
+        posicao = len(dados["nomes"])
+
+        # Dobra a capacidade dos arrays quando necessário (custo amortizado constante por inclusão)
+        if posicao == dados["lat"].size:
+            dados["lat"] = np.resize(dados["lat"], posicao * 2)
+            dados["lon"] = np.resize(dados["lon"], posicao * 2)
+
+        dados["lat"][posicao] = lat
+        dados["lon"][posicao] = lon
+        dados["nomes"].append(nome)
+        dados["posicoes"][nome] = posicao
+        dados["celulas"].setdefault(self._celula(lat, lon), set()).add(posicao)
+
+    def remover(self, tipo, nome):
+        """Retira um ponto do índice (a posição fica vaga nos arrays)."""
+        dados = self._tipo(tipo)
+        posicao = dados["posicoes"].pop(nome, None)
+
+        if posicao is None:
+            return
+
+        celula = self._celula(dados["lat"][posicao], dados["lon"][posicao])
+        dados["celulas"][celula].discard(posicao)
+
+        if not dados["celulas"][celula]:
+            del dados["celulas"][celula]
+
+        dados["nomes"][posicao] = None
+
+    def _candidatos(self, dados, lat, lon, raio_celulas):
+        """Posições dos pontos nas células até 'raio_celulas' de distância (em células) da célula do ponto consultado."""
+        linha, coluna = self._celula(lat, lon)
+        posicoes = []
+
+        for i in range(linha - raio_celulas, linha + raio_celulas + 1):
+            for j in range(coluna - raio_celulas, coluna + raio_celulas + 1):
+                posicoes.extend(dados["celulas"].get((i, j), ()))
+
+        return np.fromiter(posicoes, dtype=np.int64, count=len(posicoes))
+
+    def _ordenar(self, dados, lat, lon, posicoes, k=None):
+        """Ordena as posições informadas pela distância ao ponto consultado, ficando com as k primeiras."""
+        distancias = haversine_km(lat, lon, dados["lat"][posicoes], dados["lon"][posicoes])
+        ordem = np.argsort(distancias)[:k]
+
+        return [(dados["nomes"][posicoes[i]], float(distancias[i])) for i in ordem]
+
+    def no_raio(self, tipo, lat, lon, raio_km):
+        """
+        Busca os pontos do tipo a até 'raio_km' (linha reta) do ponto informado.
+        Retorna (pontos: list[tuple(nome, distancia_km)] do mais próximo para o mais distante)
+        """
+        dados = self._tipo(tipo)
+
+        # A longitude encolhe com a latitude, então o raio em células é calculado pelo lado mais estreito
+        graus = raio_km / (KM_POR_GRAU * max(np.cos(np.radians(min(abs(lat) + raio_km / KM_POR_GRAU, 89.0))), 1e-6))
+        raio_celulas = int(np.ceil(graus / self.celula_graus))
+
+        posicoes = self._candidatos(dados, lat, lon, raio_celulas)
+
+        if posicoes.size == 0:
+            return []
+
+        distancias = haversine_km(lat, lon, dados["lat"][posicoes], dados["lon"][posicoes])
+        dentro = distancias <= raio_km
+        posicoes, distancias = posicoes[dentro], distancias[dentro]
+        ordem = np.argsort(distancias)
+
+        return [(dados["nomes"][posicoes[i]], float(distancias[i])) for i in ordem]
+
+    def vizinhos(self, tipo, lat, lon, k=5):
+        """
+        Busca os k pontos do tipo mais próximos (linha reta) do ponto informado.
+        Retorna (pontos: list[tuple(nome, distancia_km)] do mais próximo para o mais distante)
+        """
+        dados = self._tipo(tipo)
+        total = len(dados["posicoes"])
+
+        if total == 0:
+            return []
+
+        todas = np.fromiter(dados["posicoes"].values(), dtype=np.int64, count=total)
+
+        # Pedindo todos os pontos do tipo, a grade não ajuda: ordena todos de uma vez
+        if k >= total:
+            return self._ordenar(dados, lat, lon, todas)
+
+        # Os anéis não precisam passar da célula ocupada mais distante da célula do ponto consultado
+        linha, coluna = self._celula(lat, lon)
+        raio_maximo = max(max(abs(i - linha), abs(j - coluna)) for i, j in dados["celulas"])
+
+        # Abre anéis de células até juntar k candidatos; a k-ésima distância entre eles vira o raio da busca exata
+        raio_celulas = 0
+        while True:
+            if raio_celulas >= raio_maximo:
+                return self._ordenar(dados, lat, lon, todas, k)
+
+            posicoes = self._candidatos(dados, lat, lon, raio_celulas)
+
+            if posicoes.size >= k:
+                break
+
+            raio_celulas = raio_celulas * 2 + 1
+
+        distancias = haversine_km(lat, lon, dados["lat"][posicoes], dados["lon"][posicoes])
+        raio_km = float(np.partition(distancias, k - 1)[k - 1])
+
+        return self.no_raio(tipo, lat, lon, raio_km)[:k]
+
+def construir_indice(enderecos):
+    """
+    Monta o índice espacial com todos os endereços cadastrados.
+    Retorna (indice: IndiceEspacial)
+    """
+    indice = IndiceEspacial()
+
+    for tipo, locais in enderecos.items():
+        indice._tipo(tipo)
+
+        for nome, dados in locais.items():
+            indice.adicionar(tipo, nome, dados["latitude"], dados["longitude"])
+
+    return indice
+
+# ---- Fim do Índice Espacial ----
+
+# ---- Simplificação de Rotas ----
+
+METROS_POR_PIXEL_ZOOM_0 = 156543.03392 # Escala dos mapas web (Web Mercator) no zoom 0, na linha do Equador
+TOLERANCIA_PIXELS = 1.0 # Desvio máximo (em pixels na tela) aceito ao descartar pontos da rota
+
+def metros_por_pixel(latitude, zoom):
+    """Retorna (metros: float) que um pixel do mapa representa na latitude e no zoom informados."""
+    return METROS_POR_PIXEL_ZOOM_0 * np.cos(np.radians(latitude)) / 2 ** zoom
+
+def douglas_peucker(x, y, tolerancia):
+    """
+    Escolhe os pontos de uma linha que precisam ser mantidos para que nenhum ponto descartado fique a mais de 'tolerancia'
+    da linha simplificada (Douglas-Peucker). As distâncias de cada segmento são calculadas de uma vez com NumPy.
+    Retorna (manter: np.ndarray[bool])
+    """
+    n = len(x)
+    manter = np.zeros(n, dtype=bool)
+    manter[[0, n - 1]] = True
+    pilha = [(0, n - 1)]
+
+    while pilha:
+        inicio, fim = pilha.pop()
+
+        if fim - inicio < 2:
+            continue
+
+        dx, dy = x[fim] - x[inicio], y[fim] - y[inicio]
+        px, py = x[inicio + 1:fim] - x[inicio], y[inicio + 1:fim] - y[inicio]
+        comprimento = np.hypot(dx, dy)
+
+        # Em uma rota que volta ao ponto de partida o segmento tem comprimento zero; mede-se a distância até o ponto
+        distancias = np.abs(dx * py - dy * px) / comprimento if comprimento > 0 else np.hypot(px, py)
+        maior = int(np.argmax(distancias))
+
+        if distancias[maior] > tolerancia:
+            meio = inicio + 1 + maior
+            manter[meio] = True
+            pilha += [(inicio, meio), (meio, fim)]
+
+    return manter
+
+def simplificar_rota(pontos, zoom, tolerancia_pixels=TOLERANCIA_PIXELS):
+    """
+    Simplifica uma rota para ser desenhada no zoom informado: descarta os pontos que não mudariam o traçado em mais de
+    'tolerancia_pixels' na tela. Quanto maior o zoom, menor a tolerância em metros e mais pontos são mantidos.
+    Retorna (pontos_simplificados: np.ndarray (n, 2) de latitude e longitude)
+    """
+    pontos = np.asarray(pontos, dtype=float).reshape(-1, 2)
+
+    if len(pontos) < 3:
+        return pontos
+
+    # Projeção local em metros (equiretangular), suficiente para as distâncias pequenas de uma tolerância em pixels
+    latitude_media = float(pontos[:, 0].mean())
+    y = pontos[:, 0] * KM_POR_GRAU * 1000
+    x = pontos[:, 1] * KM_POR_GRAU * 1000 * np.cos(np.radians(latitude_media))
+
+    manter = douglas_peucker(x, y, tolerancia_pixels * metros_por_pixel(latitude_media, zoom))
+
+    return pontos[manter]
+
+# ---- Fim da Simplificação de Rotas ----
@@ -0,0 +1,224 @@
+import argparse
+import csv
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+import requests
+from cliente_http import LimitadorTaxa
+from rastreamento import propagar
+from utils import carregar_enderecos, google_routes_api, processar_rotas, rotas_vectura, reduzir_para_historico, CAMPOS_HISTORICO
+
+WORKERS_LOTE = 4 # Máximo de chamadas simultâneas à API durante o lote
+REQUISICOES_POR_SEGUNDO = 5 # Taxa máxima de chamadas à API durante o lote
+
+COLUNAS_ENTRADA = ["origem", "destino", "recarga", "destino_2"]
+COLUNAS_SAIDA = ["linha", "nome_origem", "nome_destino", "nome_recarga", "nome_destino_2", "status", "mensagem"] + CAMPOS_HISTORICO
+
+# ---- Funções de Leitura e Escrita ----
+
+def ler_lanes(caminho):
+    """
+    Lê o arquivo de lanes (CSV ou Parquet). As colunas origem, destino, recarga e destino_2 devem conter nomes cadastrados em enderecos.json.
+    Uma coluna 'racional' opcional sobrescreve o racional padrão na linha.
+    Retorna (lanes: list[dict])
+    """
+    if caminho.lower().endswith(".parquet"):
+        df = pd.read_parquet(caminho)
+    else:
+        df = pd.read_csv(caminho, dtype=str, keep_default_na=False)
+
+    faltantes = [coluna for coluna in COLUNAS_ENTRADA if coluna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Colunas ausentes no arquivo de lanes: {', '.join(faltantes)}")
+
+    return df.to_dict(orient="records")
+
+def abrir_saida(caminho):
+    """
+    Abre o arquivo de saída (CSV ou JSON Lines, pela extensão) e devolve uma função que grava uma linha e força a escrita no disco.
+    Retorna (arquivo, escrever: função)
+    """
+    arquivo = open(caminho, "w", encoding="utf-8", newline="")
+
+    if caminho.lower().endswith(".jsonl"):
+        def escrever(linha):
+            arquivo.write(json.dumps(linha, ensure_ascii=False) + "\n")
+            arquivo.flush()
+
+    else:
+        escritor = csv.DictWriter(arquivo, fieldnames=COLUNAS_SAIDA, extrasaction="ignore")
+        escritor.writeheader()
+
+        def escrever(linha):
+            escritor.writerow({campo: (json.dumps(valor, ensure_ascii=False) if isinstance(valor, (list, dict)) else valor) for campo, valor in linha.items()})
+            arquivo.flush()
+
+    return arquivo, escrever
+
+# ---- Fim das Funções de Leitura e Escrita ----
+
+# ---- Funções do Lote ----
+
+def resolver_lane(lane, enderecos):
+    """
+    Troca os nomes da lane pelos endereços cadastrados.
+    Retorna (enderecos_lane: tuple ou None, mensagem: str)
+    """
+    resolvidos = []
+
+    for coluna, tipo in zip(COLUNAS_ENTRADA, ["Origem", "Destino", "Recarga", "Destino"]):
+        nome = str(lane.get(coluna, "")).strip()
+
+        if nome not in enderecos.get(tipo, {}):
+            return None, f"❌ '{nome}' não está cadastrado em {tipo}."
+
+        resolvidos.append(enderecos[tipo][nome]["endereco_formatado"])
+
+    return tuple(resolvidos), ""
+
+def ler_racional(valor, padrao):
+    """
+    Lê o racional de uma lane. Vazio (None, NaN da planilha ou texto em branco) usa o padrão; texto que não é número
+    e valores menores ou iguais a zero são inválidos.
+    Retorna (racional: float ou None, mensagem: str)
+    """
+    if (pd.api.types.is_scalar(valor) and pd.isna(valor)) or (isinstance(valor, str) and not valor.strip()):
+        valor = padrao
+
+    try:
+        racional = float(valor)
+    except (TypeError, ValueError):
+        racional = None
+
+    if racional is None or not math.isfinite(racional) or racional <= 0:
+        return None, f"❌ Racional inválido: '{valor}'."
+
+    return racional, ""
+
+def cotar_lote(caminho_entrada, caminho_saida, chave_api, racional, max_workers=WORKERS_LOTE, requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO):
+    """
+    Roda o vectura para todas as lanes do arquivo de entrada. Cada rota distinta é consultada uma única vez, mesmo que apareça em várias lanes,
+    e cada lane é gravada no arquivo de saída assim que as suas rotas ficam prontas. Uma lane com erro é registrada sem interromper o lote.
+    Retorna (resumo: dict)
+    """
+    lanes = ler_lanes(caminho_entrada)
+    enderecos = carregar_enderecos()
+    limitador = LimitadorTaxa(requisicoes_por_segundo)
+
+    resumo = {"lanes": len(lanes), "sucesso": 0, "falhas": 0, "rotas_unicas": 0}
+
+    arquivo, escrever = abrir_saida(caminho_saida)
+
+    def registrar(indice, status, mensagem, dados=None):
+        lane = lanes[indice]
+        linha = {"linha": indice + 1,
+                 "nome_origem": lane.get("origem"),
+                 "nome_destino": lane.get("destino"),
+                 "nome_recarga": lane.get("recarga"),
+                 "nome_destino_2": lane.get("destino_2"),
+                 "status": "ok" if status else "erro",
+                 "mensagem": mensagem}
+
+        if dados is not None:
+            linha.update(reduzir_para_historico(dados))
+
+        escrever(linha)
+        resumo["sucesso" if status else "falhas"] += 1
+
+    try:
+        # Resolve os nomes e agrupa as rotas repetidas entre as lanes
+        rotas_por_lane = {}
+        lanes_por_rota = {}
+
+        for indice, lane in enumerate(lanes):
+            enderecos_lane, mensagem = resolver_lane(lane, enderecos)
+
+            if enderecos_lane is None:
+                registrar(indice, False, mensagem)
+                continue
+
+            racional_lane, mensagem = ler_racional(lane.get("racional"), racional)
+
+            if racional_lane is None:
+                registrar(indice, False, mensagem)
+                continue
+
+            rotas = rotas_vectura(*enderecos_lane)
+            rotas_por_lane[indice] = (enderecos_lane, rotas, racional_lane)
+
+            for rota in rotas:
+                lanes_por_rota.setdefault(rota, set()).add(indice)
+
+        resumo["rotas_unicas"] = len(lanes_por_rota)
+
+        respostas = {}
+        erros = {}
+
+        # O lote espera na fila do orçamento da API em vez de rebaixar as chamadas, para que todas as lanes saiam com pedágio
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {executor.submit(propagar(google_routes_api), origin=rota[0], destination=rota[1], waypoints=list(rota[2]), api_key=chave_api, limitador=limitador,
+                                     rebaixar=False, espera_orcamento=float("inf")): rota
+                       for rota in lanes_por_rota}
+
+            for futuro in as_completed(futuros):
+                rota = futuros[futuro]
+
+                try:
+                    respostas[rota] = futuro.result()
+                except requests.RequestException as erro:
+                    erros[rota] = f"❌ Não foi possível consultar as rotas na API do Google ({erro.__class__.__name__})."
+
+                # Finaliza as lanes que já têm todas as rotas respondidas
+                for indice in sorted(lanes_por_rota[rota]):
+                    if indice not in rotas_por_lane:
+                        continue
+
+                    enderecos_lane, rotas, racional_lane = rotas_por_lane[indice]
+
+                    if not all(r in respostas or r in erros for r in rotas):
+                        continue
+
+                    del rotas_por_lane[indice]
+
+                    falha = next((erros[r] for r in rotas if r in erros), None)
+                    if falha is not None:
+                        registrar(indice, False, falha)
+                        continue
+
+                    try:
+                        status, mensagem, dados = processar_rotas(*enderecos_lane, respostas[rotas[0]], respostas[rotas[1]], racional_lane)
+                    except (KeyError, IndexError, ValueError) as erro:
+                        status, mensagem, dados = False, f"❌ Resposta inesperada da API ({erro.__class__.__name__}).", None
+
+                    registrar(indice, status, mensagem, dados)
+
+    finally:
+        arquivo.close()
+
+    return resumo
+
+# ---- Fim das Funções do Lote ----
+
+def main():
+    parser = argparse.ArgumentParser(description="Cotação de frete em lote a partir de um arquivo de lanes (CSV ou Parquet).")
+    parser.add_argument("entrada", help="Arquivo de lanes com as colunas origem, destino, recarga e destino_2 (nomes cadastrados).")
+    parser.add_argument("saida", help="Arquivo de resultados (.csv ou .jsonl).")
+    parser.add_argument("--chave", default=os.environ.get("GOOGLE_API_KEY", ""), help="Chave da API do Google (padrão: variável GOOGLE_API_KEY).")
+    parser.add_argument("--racional", type=float, default=12.0, help="Valor cobrado por km rodado (R$/km).")
+    parser.add_argument("--workers", type=int, default=WORKERS_LOTE, help="Máximo de chamadas simultâneas à API.")
+    parser.add_argument("--rps", type=float, default=REQUISICOES_POR_SEGUNDO, help="Máximo de chamadas à API por segundo.")
+    args = parser.parse_args()
+
+    if not args.chave:
+        parser.error("Informe a chave da API com --chave ou pela variável GOOGLE_API_KEY.")
+
+    resumo = cotar_lote(args.entrada, args.saida, args.chave, args.racional, args.workers, args.rps)
+
+    print(f"✅ {resumo['sucesso']} de {resumo['lanes']} lanes cotadas ({resumo['falhas']} com erro, {resumo['rotas_unicas']} rotas distintas consultadas).")
+
+
+if __name__ == "__main__":
+
+    main()
@@ -1,11 +1,24 @@
 import streamlit as st
 from utils import carregar_enderecos, carregar_historico, carregar_fixos
+from geografia import construir_indice
 from PIL import Image
-from telas import tela_0, tela_1, tela_2, tela_3
+from contextlib import nullcontext
+from rastreamento import coletar
+from telas import tela_0, tela_1, tela_2, tela_3, painel_rastreamento, painel_consumo
+
+TAMANHO_ICONE = 64 # Lado máximo (pixels) do ícone da aba: o set_page_config recodifica a imagem a cada execução da página
+
+# O ícone é lido do disco e reduzido uma única vez por processo, e não a cada execução da página
+@st.cache_resource(show_spinner=False)
+def carregar_icone(caminho):
+    icone = Image.open(caminho)
+    icone.thumbnail((TAMANHO_ICONE, TAMANHO_ICONE))
+
+    return icone
 
 def main():
 
-    icon = Image.open("vectura_icon.png") # Carrega a imagem do ícone na aba do navegador
+    icon = carregar_icone("vectura_icon.png") # Carrega a imagem do ícone na aba do navegador
    
     st.set_page_config(page_title="Vectura", page_icon=icon, layout="wide") # Configurações da aba
 
@@ -13,6 +26,9 @@ def main():
 
     if "enderecos" not in st.session_state:
         st.session_state["enderecos"] = carregar_enderecos() # Carrega e guarda os endereços salvos
+
+    if "indice" not in st.session_state:
+        st.session_state["indice"] = construir_indice(st.session_state["enderecos"]) # Índice espacial dos endereços salvos
     
     if "historico" not in st.session_state:
         st.session_state["historico"] = carregar_historico()
@@ -22,40 +38,51 @@ def main():
 
     aba = st.pills("Selecione uma página", options=["Início", "Endereços", "Histórico"], selection_mode="single") # Cria as abas
 
-    # ---- Página Inicial ----
+    depuracao = st.sidebar.toggle("🐞 Modo depuração", help="Mede o tempo de cada etapa (API, cache, banco, mapas) e mostra no fim da página.", key="depuracao")
 
-    if aba == None:
+    # Com a depuração desligada, nada é medido
+    with coletar() if depuracao else nullcontext() as medicoes_pagina:
 
-        tela_0()
+        # ---- Página Inicial ----
+
+        if aba == None:
+
+            tela_0()
     
-    # ---- Fim Página Inicial ----
+        # ---- Fim Página Inicial ----
 
 
-    # ---- Página Cálculo ----
+        # ---- Página Cálculo ----
     
-    if aba == "Início":
+        if aba == "Início":
 
-        tela_1()
+            tela_1()
     
-    # ---- Fim Página Cálculo ----
+        # ---- Fim Página Cálculo ----
 
 
-    # ---- Página Cadastro ----
+        # ---- Página Cadastro ----
 
-    if aba == "Endereços":
+        if aba == "Endereços":
 
-        tela_2()
+            tela_2()
     
-    # ---- Fim Página Cadastro ----
+        # ---- Fim Página Cadastro ----
+
+
+        # ---- Página Histórico ----
 
+        if aba == "Histórico":
 
-    # ---- Página Histórico ----
+            tela_3()
 
-    if aba == "Histórico":
+        # ---- Fim Página Histórico ---- 
 
-        tela_3()
+    # Depois das telas, para já contar as chamadas feitas nesta execução
+    painel_consumo()
 
-    # ---- Fim Página Histórico ---- 
+    if depuracao:
+        painel_rastreamento(medicoes_pagina)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+import time
+from rastreamento import rastrear
+
+ARQUIVO_MATRIZ = "matriz_trechos.db"
+
+_local = threading.local()
+
+# ---- Funções de Conexão ----
+
+def _conectar():
+    """
+    Abre (uma vez por thread) a conexão com o arquivo da matriz e garante que a tabela exista.
+    Retorna (conexao: sqlite3.Connection)
+    """
+    conexao = getattr(_local, "conexao", None)
+
+    if conexao is None:
+        conexao = sqlite3.connect(ARQUIVO_MATRIZ, timeout=30)
+        conexao.row_factory = sqlite3.Row
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("""
+            CREATE TABLE IF NOT EXISTS trechos (
+                partida TEXT NOT NULL,
+                chegada TEXT NOT NULL,
+                distancia_metros INTEGER NOT NULL,
+                duracao_segundos INTEGER NOT NULL,
+                pedagio_centavos INTEGER NOT NULL,
+                polilinha TEXT NOT NULL,
+                atualizado_em REAL NOT NULL,
+                PRIMARY KEY (partida, chegada)
+            )
+        """)
+        conexao.execute("CREATE INDEX IF NOT EXISTS idx_trechos_chegada ON trechos (chegada)")
+        conexao.commit()
+        _local.conexao = conexao
+
+    return conexao
+
+# ---- Fim das Funções de Conexão ----
+
+# ---- Funções da Matriz ----
+
+@rastrear()
+def consultar_trechos(pares):
+    """
+    Busca na matriz os trechos (partida, chegada) informados.
+    Retorna (trechos: dict -> (partida, chegada): dict com distancia_metros, duracao_segundos, pedagio_centavos e polilinha). Pares ausentes não aparecem.
+    """
+    conexao = _conectar()
+    trechos = {}
+
+    for partida, chegada in set(pares):
+        linha = conexao.execute(
+            "SELECT distancia_metros, duracao_segundos, pedagio_centavos, polilinha FROM trechos WHERE partida = ? AND chegada = ?",
+            (partida, chegada)
+        ).fetchone()
+
+        if linha is not None:
+            trechos[(partida, chegada)] = dict(linha)
+
+    return trechos
+
+@rastrear()
+def pares_faltantes(pares, limite=None):
+    """
+    Filtra, na ordem recebida, os pares (partida, chegada) de endereços distintos que ainda não estão na matriz, parando ao chegar em 'limite'.
+    Cada par é conferido pela chave primária, sem carregar a matriz inteira.
+    Retorna (pares: list[tuple])
+    """
+    conexao = _conectar()
+    faltantes = []
+
+    for partida, chegada in dict.fromkeys(pares):
+        if limite is not None and len(faltantes) >= limite:
+            break
+
+        if partida == chegada:
+            continue
+
+        if conexao.execute("SELECT 1 FROM trechos WHERE partida = ? AND chegada = ?", (partida, chegada)).fetchone() is None:
+            faltantes.append((partida, chegada))
+
+    return faltantes
+
+@rastrear()
+def gravar_trechos(trechos):
+    """
+    Grava (ou substitui) os trechos calculados na matriz, em uma única transação.
+    Recebe (trechos: dict -> (partida, chegada): dict com distancia_metros, duracao_segundos, pedagio_centavos e polilinha)
+    """
+    agora = time.time()
+    conexao = _conectar()
+
+    with conexao:
+        conexao.executemany(
+            "INSERT OR REPLACE INTO trechos VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(partida, chegada, t["distancia_metros"], t["duracao_segundos"], t["pedagio_centavos"], t["polilinha"], agora)
+             for (partida, chegada), t in trechos.items()]
+        )
+
+@rastrear()
+def remover_endereco(endereco):
+    """
+    Remove da matriz todos os trechos que saem ou chegam no endereço informado.
+    """
+    conexao = _conectar()
+
+    with conexao:
+        conexao.execute("DELETE FROM trechos WHERE partida = ? OR chegada = ?", (endereco, endereco))
+
+# ---- Fim das Funções da Matriz ----
@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from polilinha import decodificar, decodificar_lote
+
+# ---- Modelos de Resultado ----
+# Todos os valores são guardados brutos (metros, segundos e centavos, como inteiros). A formatação para exibição
+# ("123.40 km", "HH:MM:SS", "R$ 56.70") acontece só na hora de mostrar, em telas.py.
+
+@dataclass(slots=True, frozen=True)
+class Trecho:
+    """Um trecho da rota entre duas paradas, com o pedágio estimado só dele (já multiplicado pelos eixos) e a sua geometria."""
+    distancia_metros: int
+    duracao_segundos: int
+    pedagio_centavos: int = 0
+    polilinha: str = ""
+
+    def pontos(self):
+        """Retorna (pontos: np.ndarray (n, 2) de latitude e longitude do trecho)"""
+        return decodificar(self.polilinha)
+
+
+@dataclass(slots=True, frozen=True)
+class Cenario:
+    """Uma rota completa: a sequência de trechos, o pedágio total (já multiplicado pelos eixos) e a polilinha da rota inteira."""
+    trechos: tuple
+    pedagio_centavos: int
+    polilinha: str = ""
+
+    @property
+    def distancia_metros(self):
+        return sum(trecho.distancia_metros for trecho in self.trechos)
+
+    @property
+    def duracao_segundos(self):
+        return sum(trecho.duracao_segundos for trecho in self.trechos)
+
+    def geometria(self):
+        """Retorna (pontos: list[np.ndarray (n, 2)], um por trecho, decodificados de uma vez)"""
+        return decodificar_lote(trecho.polilinha for trecho in self.trechos)
+
+    @classmethod
+    def de_dict(cls, dados):
+        """Retorna (cenario: Cenario) a partir do dicionário gerado por dataclasses.asdict."""
+        return cls(trechos=tuple(Trecho(**trecho) for trecho in dados["trechos"]),
+                   pedagio_centavos=dados["pedagio_centavos"],
+                   polilinha=dados["polilinha"])
+
+
+@dataclass(slots=True, frozen=True)
+class Comparacao:
+    """Comparação entre a ida e volta simples e a rota completa, com o valor excedente calculado pelo racional."""
+    data_calculo: str # "AAAA-MM-DD HH:MM:SS"
+    simples: Cenario
+    completo: Cenario
+    racional: float
+    valor_excedente_centavos: int
+
+    @property
+    def diferenca_metros(self):
+        return abs(self.completo.distancia_metros - self.simples.distancia_metros)
+
+    @property
+    def diferenca_segundos(self):
+        return abs(self.completo.duracao_segundos - self.simples.duracao_segundos)
+
+    @property
+    def diferenca_pedagio_centavos(self):
+        return abs(self.completo.pedagio_centavos - self.simples.pedagio_centavos)
+
+    def _totais(self):
+        return {"simples_metros": self.simples.distancia_metros,
+                "simples_segundos": self.simples.duracao_segundos,
+                "simples_pedagio_centavos": self.simples.pedagio_centavos,
+                "total_metros": self.completo.distancia_metros,
+                "total_segundos": self.completo.duracao_segundos,
+                "total_pedagio_centavos": self.completo.pedagio_centavos,
+                "diferenca_metros": self.diferenca_metros,
+                "diferenca_segundos": self.diferenca_segundos,
+                "diferenca_pedagio_centavos": self.diferenca_pedagio_centavos,
+                "racional": self.racional,
+                "valor_excedente_centavos": self.valor_excedente_centavos}
+
+
+@dataclass(slots=True, frozen=True)
+class ResultadoCotacao(Comparacao):
+    """Resultado do vectura: Origem → Destino 1 → Recarga → Destino 2 → Origem, comparado à ida e volta Origem → Destino 1 → Origem."""
+    origem: str
+    destino_1: str
+    recarga: str
+    destino_2: str
+
+    def para_dict(self):
+        """
+        Resume o resultado em um dicionário plano só com os totais (sem trechos nem polilinhas), usado no histórico, nos fixos e nas exportações.
+        Retorna (dados: dict)
+        """
+        return {"data_calculo": self.data_calculo,
+                "origem": self.origem,
+                "destino_1": self.destino_1,
+                "recarga": self.recarga,
+                "destino_2": self.destino_2,
+                **self._totais()}
+
+
+@dataclass(slots=True, frozen=True)
+class ResultadoMultiparadas(Comparacao):
+    """Resultado de uma rota com várias paradas: a sequência visitada (começando e terminando na origem) e se a ordem foi otimizada."""
+    origem: str
+    sequencia: tuple
+    otimizado: bool
+
+    def para_dict(self):
+        """Retorna (dados: dict plano com a sequência e os totais)"""
+        return {"data_calculo": self.data_calculo,
+                "origem": self.origem,
+                "sequencia": list(self.sequencia),
+                "otimizado": self.otimizado,
+                **self._totais()}
+
+# ---- Fim dos Modelos de Resultado ----
@@ -0,0 +1,208 @@
+from datetime import datetime
+import requests
+from modelos import Trecho, Cenario, ResultadoMultiparadas
+from utils import obter_trechos, calculo_frete, juntar_polilinhas, MATRIZ_WORKERS
+
+LIMITE_EXATO = 10 # Até essa quantidade de paradas a ordem ótima é calculada por programação dinâmica; acima disso, por heurística
+CRITERIOS = {"distancia": "distancia_metros", "tempo": "duracao_segundos"}
+
+# ---- Funções de Matriz ----
+
+def montar_matriz(pontos, chave, max_workers=MATRIZ_WORKERS):
+    """
+    Monta a matriz de trechos entre todos os pontos informados. Os trechos que ainda não estão na matriz salva são
+    consultados na API uma única vez cada (em paralelo) e gravados, para que as próximas otimizações não paguem por eles de novo.
+    Retorna (matriz: list[list[dict]] com distancia_metros, duracao_segundos, pedagio_centavos (já multiplicado pelos eixos) e polilinha; None na diagonal)
+    """
+    pares = [(partida, chegada) for partida in pontos for chegada in pontos if partida != chegada]
+    trechos = obter_trechos(pares, chave, max_workers)
+
+    for partida, chegada in pares:
+        if (partida, chegada) not in trechos:
+            raise ValueError(f"Não existe rota entre '{partida}' e '{chegada}'.")
+
+    return [[trechos[(partida, chegada)] if partida != chegada else None for chegada in pontos] for partida in pontos]
+
+# ---- Fim das Funções de Matriz ----
+
+# ---- Funções de Otimização ----
+
+def custo_sequencia(custo, sequencia):
+    """Soma o custo dos trechos de uma sequência fechada de índices (começa e termina no índice 0)."""
+    return sum(custo[a][b] for a, b in zip(sequencia[:-1], sequencia[1:]))
+
+def ordem_exata(custo, fixar_primeira):
+    """
+    Encontra a ordem ótima das paradas (índices 1..n) por programação dinâmica (Held-Karp), saindo e voltando ao índice 0.
+    Retorna (sequencia: list[int])
+    """
+    n = len(custo)
+    inicio = 1 if fixar_primeira else 0
+    paradas = [i for i in range(1, n) if i != inicio]
+
+    if not paradas:
+        return [0, inicio, 0] if inicio else [0, 0]
+
+    posicao = {parada: bit for bit, parada in enumerate(paradas)}
+
+    # melhor[(mascara, j)] = (custo, anterior) do caminho que sai do início, visita as paradas da máscara e termina em j
+    melhor = {(1 << posicao[j], j): (custo[0][inicio] + custo[inicio][j] if inicio else custo[0][j], None) for j in paradas}
+
+    for tamanho in range(2, len(paradas) + 1):
+        for (mascara, j), _ in list(melhor.items()):
+            if bin(mascara).count("1") != tamanho - 1:
+                continue
+
+            for k in paradas:
+                bit = 1 << posicao[k]
+
+                if mascara & bit:
+                    continue
+
+                candidato = melhor[(mascara, j)][0] + custo[j][k]
+                atual = melhor.get((mascara | bit, k))
+
+                if atual is None or candidato < atual[0]:
+                    melhor[(mascara | bit, k)] = (candidato, j)
+
+    completa = (1 << len(paradas)) - 1
+    ultima = min(paradas, key=lambda j: melhor[(completa, j)][0] + custo[j][0])
+
+    # Reconstrói a sequência de trás para frente
+    sequencia = []
+    mascara, j = completa, ultima
+    while j is not None:
+        sequencia.append(j)
+        anterior = melhor[(mascara, j)][1]
+        mascara ^= 1 << posicao[j]
+        j = anterior
+
+    sequencia.reverse()
+
+    return [0] + ([inicio] if inicio else []) + sequencia + [0]
+
+def ordem_heuristica(custo, fixar_primeira):
+    """
+    Encontra uma boa ordem das paradas: vizinho mais próximo seguido de melhorias 2-opt e Or-opt até não haver ganho.
+    Retorna (sequencia: list[int])
+    """
+    n = len(custo)
+    inicio = 1 if fixar_primeira else 0
+
+    # Vizinho mais próximo
+    sequencia = [0] + ([inicio] if inicio else [])
+    restantes = set(range(1, n)) - set(sequencia)
+    while restantes:
+        proximo = min(restantes, key=lambda k: custo[sequencia[-1]][k])
+        sequencia.append(proximo)
+        restantes.remove(proximo)
+    sequencia.append(0)
+
+    # Posições que podem ser alteradas (a origem e a primeira parada fixada ficam no lugar)
+    primeira_livre = 2 if inicio else 1
+    melhor_custo = custo_sequencia(custo, sequencia)
+    melhorou = True
+
+    while melhorou:
+        melhorou = False
+
+        # 2-opt: inverte um segmento da sequência
+        for i in range(primeira_livre, len(sequencia) - 2):
+            for j in range(i + 1, len(sequencia) - 1):
+                candidata = sequencia[:i] + sequencia[i:j + 1][::-1] + sequencia[j + 1:]
+                custo_candidata = custo_sequencia(custo, candidata)
+
+                if custo_candidata < melhor_custo:
+                    sequencia, melhor_custo, melhorou = candidata, custo_candidata, True
+
+        # Or-opt: move um segmento de 1 a 3 paradas para outra posição
+        for tamanho in (1, 2, 3):
+            for i in range(primeira_livre, len(sequencia) - tamanho):
+                segmento = sequencia[i:i + tamanho]
+                resto = sequencia[:i] + sequencia[i + tamanho:]
+
+                for j in range(primeira_livre, len(resto)):
+                    candidata = resto[:j] + segmento + resto[j:]
+                    custo_candidata = custo_sequencia(custo, candidata)
+
+                    if custo_candidata < melhor_custo:
+                        sequencia, melhor_custo, melhorou = candidata, custo_candidata, True
+                        break
+
+    return sequencia
+
+def otimizar_ordem(custo, fixar_primeira=True):
+    """
+    Escolhe entre o cálculo exato e o heurístico pela quantidade de paradas.
+    Retorna (sequencia: list[int])
+    """
+    if len(custo) - 1 <= LIMITE_EXATO:
+        return ordem_exata(custo, fixar_primeira)
+
+    return ordem_heuristica(custo, fixar_primeira)
+
+# ---- Fim das Funções de Otimização ----
+
+# ---- Cálculo com Várias Paradas ----
+
+def vectura_multiparadas(origem: str, paradas: list, chave_api: str, racional: float, ordenado: bool = False, fixar_primeira: bool = True, criterio: str = "distancia"):
+    """
+    Calcula uma rota que sai da origem, passa por todas as paradas e volta à origem. Se 'ordenado' for falso, a ordem das paradas é otimizada
+    pelo critério escolhido ('distancia' ou 'tempo'); com 'fixar_primeira', a primeira parada informada continua sendo a primeira (entrega do carregamento).
+    A comparação é feita contra a ida e volta simples até a primeira parada.
+    Retorna (sucesso: bool, mensagem: str, dados: ResultadoMultiparadas ou None)
+    """
+    if origem is None or not paradas or None in paradas or chave_api == "" or racional <= 0 or criterio not in CRITERIOS:
+        mensagem = "❌ Não foi possível realizar os cálculos. Confirme se os parâmetros estão todos preenchidos corretamente."
+
+        return False, mensagem, None
+
+    # Índice 0 é a origem; as paradas repetidas (ou iguais à origem) são visitadas uma vez cada na otimização
+    pontos = [origem] + [parada for parada in dict.fromkeys(paradas) if parada != origem]
+
+    if len(pontos) == 1 or paradas[0] == origem:
+        return False, "❌ A primeira parada precisa ser diferente da origem.", None
+
+    try:
+        matriz = montar_matriz(pontos, chave_api)
+    except requests.RequestException as erro:
+        return False, f"❌ Não foi possível consultar as rotas na API do Google ({erro.__class__.__name__}).", None
+    except (KeyError, IndexError) as erro:
+        return False, f"❌ Resposta inesperada da API ({erro.__class__.__name__}).", None
+    except ValueError as erro:
+        return False, f"❌ {erro}", None
+
+    campo = CRITERIOS[criterio]
+    custo = [[trecho[campo] if trecho is not None else 0 for trecho in linha] for linha in matriz]
+
+    if ordenado:
+        sequencia = [0] + [pontos.index(parada) for parada in paradas] + [0]
+    else:
+        sequencia = otimizar_ordem(custo, fixar_primeira)
+
+    def cenario(seq):
+        # Trechos de uma parada para ela mesma (parada igual à origem) entram zerados
+        trechos = tuple(Trecho(**matriz[a][b]) if a != b else Trecho(0, 0) for a, b in zip(seq[:-1], seq[1:]))
+
+        return Cenario(trechos=trechos,
+                       pedagio_centavos=sum(trecho.pedagio_centavos for trecho in trechos),
+                       polilinha=juntar_polilinhas([trecho.polilinha for trecho in trechos if trecho.polilinha]))
+
+    simples = cenario([0, pontos.index(paradas[0]), 0])
+    completo = cenario(sequencia)
+
+    diferenca_metros = abs(completo.distancia_metros - simples.distancia_metros)
+    diferenca_pedagio = abs(completo.pedagio_centavos - simples.pedagio_centavos)
+
+    dados = ResultadoMultiparadas(data_calculo=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                  simples=simples,
+                                  completo=completo,
+                                  racional=racional,
+                                  valor_excedente_centavos=calculo_frete(diff_pedagio_centavos=diferenca_pedagio, diff_metros=diferenca_metros, racional=racional),
+                                  origem=origem,
+                                  sequencia=tuple(pontos[i] for i in sequencia),
+                                  otimizado=not ordenado)
+
+    return True, "✅ Cálculos realizados com sucesso!", dados
+
+# ---- Fim do Cálculo com Várias Paradas ----
@@ -0,0 +1,91 @@
+import numpy as np
+
+PRECISAO = 5 # Casas decimais das coordenadas no formato de polilinha do Google (encodedPolyline)
+
+# ---- Decodificação ----
+
+def _ler(buffer):
+    """
+    Lê de uma vez todos os valores de um buffer de polilinha: cada byte carrega 5 bits do valor e um bit de continuação.
+    Retorna (deltas: np.ndarray[int64] com as diferenças em ordem, na escala inteira da polilinha; fim: np.ndarray[bool] dos bytes que fecham um valor)
+    """
+    codigos = np.frombuffer(buffer, dtype=np.uint8).astype(np.int64) - 63
+    fim = (codigos & 0x20) == 0
+
+    if codigos.size == 0:
+        return np.empty(0, dtype=np.int64), fim
+
+    inicios = np.flatnonzero(np.concatenate(([True], fim[:-1])))
+
+    # Posição de cada byte dentro do seu valor, para deslocar os 5 bits para o lugar certo
+    posicao = np.arange(codigos.size) - np.repeat(inicios, np.diff(np.append(inicios, codigos.size)))
+    valores = np.add.reduceat((codigos & 0x1f) << (5 * posicao), inicios)
+
+    # Desfaz o zigzag (o bit menos significativo guarda o sinal)
+    return np.where(valores & 1, ~(valores >> 1), valores >> 1), fim
+
+def decodificar(polilinha, precisao=PRECISAO):
+    """
+    Decodifica uma polilinha do Google sem laço em Python.
+    Retorna (pontos: np.ndarray (n, 2) de latitude e longitude)
+    """
+    deltas, _ = _ler(polilinha.encode("ascii"))
+
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** precisao
+
+def decodificar_lote(polilinhas, precisao=PRECISAO):
+    """
+    Decodifica várias polilinhas de uma vez (ex.: todas as rotas do histórico): os textos são juntados em um único buffer,
+    lidos em uma passada e separados no fim.
+    Retorna (pontos: list[np.ndarray (n, 2)] na mesma ordem das polilinhas)
+    """
+    polilinhas = list(polilinhas)
+
+    if not polilinhas:
+        return []
+
+    deltas, fim = _ler("".join(polilinhas).encode("ascii"))
+    deltas = deltas.reshape(-1, 2)
+
+    # Quantos pontos cada polilinha tem: dois valores fechados (latitude e longitude) por ponto dentro dos seus bytes
+    limites = np.cumsum([0] + [len(p) for p in polilinhas])
+    fechados = np.concatenate(([0], np.cumsum(fim)))
+    quantidades = (fechados[limites[1:]] - fechados[limites[:-1]]) // 2
+    inicios = np.concatenate(([0], np.cumsum(quantidades)[:-1]))
+
+    # A soma acumulada é feita no lote inteiro e reiniciada no começo de cada polilinha
+    acumulado = np.cumsum(deltas, axis=0)
+    anterior = np.where(inicios[:, None] > 0, acumulado[np.maximum(inicios - 1, 0)] if len(acumulado) else 0, 0)
+    pontos = (acumulado - np.repeat(anterior, quantidades, axis=0)) / 10 ** precisao
+
+    return np.split(pontos, np.cumsum(quantidades)[:-1])
+
+# ---- Fim da Decodificação ----
+
+# ---- Codificação ----
+
+def codificar(pontos, precisao=PRECISAO):
+    """
+    Codifica pontos (latitude, longitude) no formato de polilinha do Google, sem laço em Python.
+    Retorna (polilinha: str)
+    """
+    inteiros = np.round(np.asarray(pontos, dtype=float).reshape(-1, 2) * 10 ** precisao).astype(np.int64)
+
+    if inteiros.size == 0:
+        return ""
+
+    deltas = np.diff(inteiros, axis=0, prepend=0).ravel()
+    valores = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Cada valor vira de 1 a 7 blocos de 5 bits; todos os blocos menos o último levam o bit de continuação
+    blocos = (valores[:, None] >> (5 * np.arange(7))) & 0x1f
+    ocupados = blocos != 0
+    tamanhos = np.where(ocupados.any(axis=1), 7 - np.argmax(ocupados[:, ::-1], axis=1), 1)
+
+    usados = np.arange(7) < tamanhos[:, None]
+    continua = np.arange(7) < (tamanhos - 1)[:, None]
+    codigos = (blocos | (continua * 0x20)) + 63
+
+    return codigos[usados].astype(np.uint8).tobytes().decode("ascii")
+
+# ---- Fim da Codificação ----
@@ -0,0 +1,199 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+# Exportação das medições (spans): um arquivo JSONL com uma linha por medição e/ou o OpenTelemetry, se estiver instalado.
+# Sem exportação e sem coleta ativa (painel de depuração), as medições não são feitas e o custo é só uma verificação.
+ARQUIVO_RASTREAMENTO = os.environ.get("VECTURA_RASTREAMENTO", "")
+USAR_OTEL = os.environ.get("VECTURA_OTEL", "") == "1" and otel_trace is not None
+
+_atual = contextvars.ContextVar("medicao_atual", default=None)
+_coletores = contextvars.ContextVar("coletores", default=())
+_trava = threading.Lock()
+
+# ---- Medições ----
+
+class Medicao:
+    """Uma medição: nome, atributos, início (relógio monotônico) e duração, ligada à medição que a contém."""
+    __slots__ = ("nome", "atributos", "id", "id_rastreamento", "pai", "profundidade", "inicio", "inicio_epoch", "duracao_ms", "erro")
+
+    def __init__(self, nome, atributos, pai):
+        self.nome = nome
+        self.atributos = atributos
+        self.id = uuid.uuid4().hex[:16]
+        self.id_rastreamento = pai.id_rastreamento if pai is not None else uuid.uuid4().hex
+        self.pai = pai
+        self.profundidade = pai.profundidade + 1 if pai is not None else 0
+        self.inicio = time.perf_counter()
+        self.inicio_epoch = time.time()
+        self.duracao_ms = None
+        self.erro = None
+
+    def para_dict(self):
+        return {"nome": self.nome,
+                "id": self.id,
+                "id_rastreamento": self.id_rastreamento,
+                "id_pai": self.pai.id if self.pai is not None else None,
+                "inicio": self.inicio_epoch,
+                "duracao_ms": self.duracao_ms,
+                "erro": self.erro,
+                "atributos": self.atributos}
+
+def ativo():
+    """Retorna (ativo: bool) se as medições estão sendo feitas neste contexto."""
+    return bool(ARQUIVO_RASTREAMENTO or USAR_OTEL or _coletores.get())
+
+@contextmanager
+def medir(nome, **atributos):
+    """
+    Mede o bloco como uma medição com o nome e os atributos informados; medições abertas dentro dele ficam como filhas.
+    Uso: with medir("rotas.api", origem=origem): ...
+    """
+    if not ativo():
+        yield None
+        return
+
+    medicao = Medicao(nome, atributos, _atual.get())
+    token = _atual.set(medicao)
+    otel = otel_trace.get_tracer("vectura").start_as_current_span(nome, attributes=_atributos_otel(atributos)) if USAR_OTEL else None
+
+    try:
+        if otel is not None:
+            with otel as span_otel:
+                yield medicao
+                span_otel.set_attributes(_atributos_otel(medicao.atributos))
+        else:
+            yield medicao
+
+    except BaseException as erro:
+        medicao.erro = erro.__class__.__name__
+        raise
+
+    finally:
+        medicao.duracao_ms = (time.perf_counter() - medicao.inicio) * 1000
+        _atual.reset(token)
+        _finalizar(medicao)
+
+def rastrear(nome=None):
+    """Decorador que mede cada chamada da função (o nome padrão é modulo.funcao)."""
+    def decorador(funcao):
+        nome_medicao = nome or f"{funcao.__module__}.{funcao.__name__}"
+
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            if not ativo():
+                return funcao(*args, **kwargs)
+
+            with medir(nome_medicao):
+                return funcao(*args, **kwargs)
+
+        return envoltorio
+
+    return decorador
+
+def anotar(**atributos):
+    """Acrescenta atributos à medição aberta no momento (ex.: se a resposta veio do cache). Sem medição aberta, não faz nada."""
+    medicao = _atual.get()
+
+    if medicao is not None:
+        medicao.atributos.update(atributos)
+
+def propagar(funcao):
+    """
+    Leva a medição aberta e os coletores para outra thread (ex.: executor.submit(propagar(f), ...)), para que as medições
+    feitas lá fiquem dentro da medição que as disparou. Cada chamada precisa da sua própria cópia do contexto.
+    """
+    contexto = contextvars.copy_context()
+
+    return functools.partial(contexto.run, funcao)
+
+# ---- Fim das Medições ----
+
+# ---- Coleta e Exportação ----
+
+@contextmanager
+def coletar():
+    """
+    Guarda na lista devolvida todas as medições encerradas dentro do bloco (inclusive nas threads disparadas com propagar).
+    Uso: with coletar() as medicoes: vectura(...)
+    """
+    medicoes = []
+    token = _coletores.set(_coletores.get() + (medicoes,))
+
+    try:
+        yield medicoes
+    finally:
+        _coletores.reset(token)
+
+def _finalizar(medicao):
+    for medicoes in _coletores.get():
+        with _trava:
+            medicoes.append(medicao)
+
+    if ARQUIVO_RASTREAMENTO:
+        linha = json.dumps(medicao.para_dict(), ensure_ascii=False, default=str)
+
+        with _trava, open(ARQUIVO_RASTREAMENTO, "a", encoding="utf-8") as f:
+            f.write(linha + "\n")
+
+def _atributos_otel(atributos):
+    # O OpenTelemetry só aceita textos, números e booleanos como atributos
+    return {nome: valor if isinstance(valor, (str, bool, int, float)) else str(valor) for nome, valor in atributos.items() if valor is not None}
+
+def configurar_rastreamento(arquivo=None, otel=None):
+    """Liga ou desliga a exportação (arquivo JSONL, "" desliga; otel True/False), sem depender das variáveis de ambiente."""
+    global ARQUIVO_RASTREAMENTO, USAR_OTEL
+
+    if arquivo is not None:
+        ARQUIVO_RASTREAMENTO = arquivo
+
+    if otel is not None:
+        USAR_OTEL = otel and otel_trace is not None
+
+def resumir(medicoes):
+    """
+    Organiza as medições coletadas em árvore (cada medição seguida das que ela contém, em ordem de início),
+    com o início de cada uma contado a partir da primeira.
+    Retorna (linhas: list[dict] com nome, profundidade, inicio_ms, duracao_ms, erro e atributos)
+    """
+    if not medicoes:
+        return []
+
+    coletados = {medicao.id for medicao in medicoes}
+    filhos = {}
+
+    # Uma medição cuja mãe não foi coletada (ex.: aberta antes da coleta) vira raiz
+    for medicao in sorted(medicoes, key=lambda medicao: medicao.inicio):
+        pai = medicao.pai.id if medicao.pai is not None and medicao.pai.id in coletados else None
+        filhos.setdefault(pai, []).append(medicao)
+
+    origem = min(medicao.inicio for medicao in medicoes)
+    linhas = []
+
+    def visitar(medicao, profundidade):
+        linhas.append({"nome": medicao.nome,
+                       "profundidade": profundidade,
+                       "inicio_ms": (medicao.inicio - origem) * 1000,
+                       "duracao_ms": medicao.duracao_ms,
+                       "erro": medicao.erro,
+                       "atributos": medicao.atributos})
+
+        for filho in filhos.get(medicao.id, []):
+            visitar(filho, profundidade + 1)
+
+    for raiz in filhos.get(None, []):
+        visitar(raiz, 0)
+
+    return linhas
+
+# ---- Fim da Coleta e Exportação ----
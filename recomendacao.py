@@ -0,0 +1,123 @@
+import heapq
+import numpy as np
+import requests
+from geografia import haversine_km
+from utils import obter_trechos, calculo_frete
+
+TAMANHO_BLOCO = 20 # Quantidade de combinações avaliadas com trechos reais por rodada
+
+TRECHO_VAZIO = {"distancia_metros": 0, "duracao_segundos": 0, "pedagio_centavos": 0}
+
+# ---- Funções de Recomendação ----
+
+def coordenadas(locais):
+    """Monta os arrays de latitude e longitude de uma lista de (nome, dados)."""
+    return (np.array([dados["latitude"] for _, dados in locais], dtype=float),
+            np.array([dados["longitude"] for _, dados in locais], dtype=float))
+
+def recomendar_recargas(nome_origem, nome_destino, enderecos, chave, k=5, racional=None):
+    """
+    Classifica todas as combinações (Recarga, Destino 2) cadastradas para uma viagem Origem → Destino, pelos km a mais
+    em relação à ida e volta simples. Antes de olhar qualquer trecho real, calcula para todas as combinações de uma vez (NumPy)
+    um limite inferior em linha reta e só avalia com trechos reais as combinações que ainda podem entrar no top-k.
+    Retorna (sucesso: bool, mensagem: str, candidatos: list[dict] ordenada do melhor para o pior, com metros, segundos e centavos)
+    """
+    if nome_origem not in enderecos["Origem"] or nome_destino not in enderecos["Destino"] or chave == "":
+        return False, "❌ Selecione a origem e o destino e informe a chave.", []
+
+    origem = enderecos["Origem"][nome_origem]
+    destino = enderecos["Destino"][nome_destino]
+    recargas = list(enderecos["Recarga"].items())
+    destinos_2 = [(nome, dados) for nome, dados in enderecos["Destino"].items() if nome != nome_destino]
+
+    if not recargas or not destinos_2:
+        return True, "⚠️ Não há recargas ou segundos destinos cadastrados para combinar.", []
+
+    end_origem = origem["endereco_formatado"]
+    end_destino = destino["endereco_formatado"]
+
+    def trecho(trechos, partida, chegada):
+        return TRECHO_VAZIO if partida == chegada else trechos.get((partida, chegada))
+
+    try:
+        # A volta Destino → Origem é o único trecho da ida e volta simples que deixa de ser feito
+        trechos = obter_trechos([(end_destino, end_origem)], chave)
+        volta = trecho(trechos, end_destino, end_origem)
+
+        if volta is None:
+            return False, "❌ Não existe rota entre o destino e a origem.", []
+
+        # ---- Limite inferior (linha reta) para todas as combinações ----
+
+        lat_r, lon_r = coordenadas(recargas)
+        lat_d2, lon_d2 = coordenadas(destinos_2)
+
+        destino_recarga = haversine_km(destino["latitude"], destino["longitude"], lat_r, lon_r)
+        recarga_destino_2 = haversine_km(lat_r[:, None], lon_r[:, None], lat_d2[None, :], lon_d2[None, :])
+        destino_2_origem = haversine_km(lat_d2, lon_d2, origem["latitude"], origem["longitude"])
+
+        # km a mais nunca é menor que a soma das linhas retas dos trechos novos menos a volta real que deixa de existir
+        limite_inferior = destino_recarga[:, None] + recarga_destino_2 + destino_2_origem[None, :] - volta["distancia_metros"] / 1000
+        ordem = np.argsort(limite_inferior, axis=None)
+
+        # ---- Avaliação com trechos reais, em blocos, até o limite inferior passar do k-ésimo melhor ----
+
+        melhores = [] # heap com (-metros_extra, ...) dos k melhores até agora
+        posicao = 0
+
+        while posicao < ordem.size:
+            corte = -melhores[0][0] / 1000 if len(melhores) == k else np.inf
+
+            if limite_inferior.flat[ordem[posicao]] >= corte:
+                break
+
+            bloco = [divmod(int(indice), len(destinos_2)) for indice in ordem[posicao:posicao + TAMANHO_BLOCO]]
+            posicao += TAMANHO_BLOCO
+
+            pares = []
+            for i, j in bloco:
+                end_r = recargas[i][1]["endereco_formatado"]
+                end_d2 = destinos_2[j][1]["endereco_formatado"]
+                pares += [(end_destino, end_r), (end_r, end_d2), (end_d2, end_origem)]
+
+            trechos.update(obter_trechos([par for par in pares if par[0] != par[1]], chave))
+
+            for i, j in bloco:
+                end_r = recargas[i][1]["endereco_formatado"]
+                end_d2 = destinos_2[j][1]["endereco_formatado"]
+                novos = [trecho(trechos, end_destino, end_r), trecho(trechos, end_r, end_d2), trecho(trechos, end_d2, end_origem)]
+
+                if None in novos:
+                    continue
+
+                metros_extra = sum(t["distancia_metros"] for t in novos) - volta["distancia_metros"]
+                candidato = (-metros_extra, i, j,
+                             sum(t["duracao_segundos"] for t in novos) - volta["duracao_segundos"],
+                             sum(t["pedagio_centavos"] for t in novos) - volta["pedagio_centavos"])
+
+                if len(melhores) < k:
+                    heapq.heappush(melhores, candidato)
+                elif candidato > melhores[0]:
+                    heapq.heapreplace(melhores, candidato)
+
+    except requests.RequestException as erro:
+        return False, f"❌ Não foi possível consultar as rotas na API do Google ({erro.__class__.__name__}).", []
+    except (KeyError, IndexError, ValueError) as erro:
+        return False, f"❌ Resposta inesperada da API ({erro.__class__.__name__}).", []
+
+    candidatos = []
+    for menos_metros, i, j, segundos_extra, pedagio_diff in sorted(melhores, reverse=True):
+        candidato = {"recarga": recargas[i][0],
+                     "destino_2": destinos_2[j][0],
+                     "extra_metros": -menos_metros,
+                     "extra_segundos": segundos_extra,
+                     "diferenca_pedagio_centavos": pedagio_diff}
+
+        if racional:
+            candidato["valor_excedente_centavos"] = calculo_frete(diff_pedagio_centavos=abs(pedagio_diff), diff_metros=abs(menos_metros), racional=racional)
+
+        candidatos.append(candidato)
+
+    return True, f"✅ {len(candidatos)} combinações sugeridas.", candidatos
+
+# ---- Fim das Funções de Recomendação ----
@@ -0,0 +1,212 @@
+import argparse
+import heapq
+import os
+import threading
+import numpy as np
+import pandas as pd
+from geografia import haversine_km
+
+ARQUIVO_GRAFO = "grafo_rodoviario.npz"
+CASAS_NO = 6 # Casas decimais usadas para reconhecer que duas arestas do CSV chegam ao mesmo nó
+DISTANCIA_MAXIMA_NO_KM = 5.0 # Um endereço a mais que isso do nó mais próximo é considerado fora da malha
+
+COLUNAS_ARESTAS = ["lat_origem", "lon_origem", "lat_destino", "lon_destino", "distancia_metros", "duracao_segundos"]
+PESOS = {"distancia": "metros", "tempo": "segundos"}
+
+_grafos = {} # caminho -> (versão do arquivo, grafo)
+_trava = threading.Lock()
+
+# ---- Grafo Rodoviário ----
+
+class GrafoRodoviario:
+    """
+    Malha viária em arrays compactos (CSR): as arestas que saem do nó i ficam em inicio[i]:inicio[i + 1] dos arrays
+    de destino, metros e segundos. O grafo reverso (arestas que chegam em cada nó) é montado na carga para a busca
+    bidirecional.
+    """
+
+    def __init__(self, latitude, longitude, inicio, destino, metros, segundos):
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.longitude = np.asarray(longitude, dtype=float)
+        self.inicio = np.asarray(inicio, dtype=np.int64)
+        self.destino = np.asarray(destino, dtype=np.int32)
+        self.metros = np.asarray(metros, dtype=np.int32)
+        self.segundos = np.asarray(segundos, dtype=np.int32)
+
+        # Grafo reverso: as mesmas arestas ordenadas pelo nó de chegada, guardando o índice da aresta original
+        origem = np.repeat(np.arange(self.nos, dtype=np.int32), np.diff(self.inicio))
+        ordem = np.argsort(self.destino, kind="stable")
+        self.inicio_reverso = np.concatenate(([0], np.cumsum(np.bincount(self.destino, minlength=self.nos))))
+        self.origem_reversa = origem[ordem]
+        self.aresta_reversa = ordem.astype(np.int64)
+
+    @property
+    def nos(self):
+        return len(self.latitude)
+
+    @classmethod
+    def carregar(cls, caminho=ARQUIVO_GRAFO):
+        """Retorna (grafo: GrafoRodoviario) lido de um arquivo .npz gerado por construir_grafo."""
+        with np.load(caminho) as arquivo:
+            return cls(arquivo["latitude"], arquivo["longitude"], arquivo["inicio"], arquivo["destino"], arquivo["metros"], arquivo["segundos"])
+
+    def salvar(self, caminho=ARQUIVO_GRAFO):
+        np.savez_compressed(caminho, latitude=self.latitude, longitude=self.longitude, inicio=self.inicio,
+                            destino=self.destino, metros=self.metros, segundos=self.segundos)
+
+    def no_mais_proximo(self, latitude, longitude):
+        """Retorna (no: int, distancia_km: float) do nó da malha mais próximo (linha reta) do ponto informado."""
+        distancias = haversine_km(latitude, longitude, self.latitude, self.longitude)
+        no = int(np.argmin(distancias))
+
+        return no, float(distancias[no])
+
+    def _vizinhos(self, no, lado, pesos):
+        """Arestas de saída (lado 0) ou de chegada (lado 1) de um nó: (vizinho, peso, índice da aresta)."""
+        if lado == 0:
+            a, b = self.inicio[no], self.inicio[no + 1]
+            return zip(self.destino[a:b].tolist(), pesos[a:b].tolist(), range(a, b))
+
+        a, b = self.inicio_reverso[no], self.inicio_reverso[no + 1]
+        arestas = self.aresta_reversa[a:b]
+
+        return zip(self.origem_reversa[a:b].tolist(), pesos[arestas].tolist(), arestas.tolist())
+
+    def caminho_minimo(self, partida, chegada, criterio="tempo"):
+        """
+        Busca o caminho mínimo entre dois nós com Dijkstra bidirecional: uma busca sai da partida, outra sai da chegada
+        pelo grafo reverso, e a busca termina quando as duas fronteiras não podem mais melhorar o melhor encontro.
+        Retorna (arestas: list[int] do caminho em ordem, ou None se não houver caminho)
+        """
+        if partida == chegada:
+            return []
+
+        pesos = getattr(self, PESOS[criterio])
+        distancia = ({partida: 0}, {chegada: 0})
+        anterior = ({partida: None}, {chegada: None}) # (nó anterior, aresta) em cada lado
+        filas = ([(0, partida)], [(0, chegada)])
+        fechados = (set(), set())
+        melhor, encontro = np.inf, None
+
+        while filas[0] and filas[1]:
+            if filas[0][0][0] + filas[1][0][0] >= melhor:
+                break
+
+            lado = 0 if filas[0][0][0] <= filas[1][0][0] else 1
+            atual, no = heapq.heappop(filas[lado])
+
+            if no in fechados[lado]:
+                continue
+
+            fechados[lado].add(no)
+
+            for vizinho, peso, aresta in self._vizinhos(no, lado, pesos):
+                candidato = atual + peso
+
+                if candidato < distancia[lado].get(vizinho, np.inf):
+                    distancia[lado][vizinho] = candidato
+                    anterior[lado][vizinho] = (no, aresta)
+                    heapq.heappush(filas[lado], (candidato, vizinho))
+
+                outro = distancia[1 - lado].get(vizinho)
+                if outro is not None and candidato + outro < melhor:
+                    melhor, encontro = candidato + outro, vizinho
+
+        if encontro is None:
+            return None
+
+        # Da partida até o encontro (de trás para frente) e do encontro até a chegada
+        ida, no = [], encontro
+        while anterior[0][no] is not None:
+            no, aresta = anterior[0][no]
+            ida.append(aresta)
+
+        volta, no = [], encontro
+        while anterior[1][no] is not None:
+            no, aresta = anterior[1][no]
+            volta.append(aresta)
+
+        return ida[::-1] + volta
+
+    def nos_do_caminho(self, partida, arestas):
+        """Retorna (nos: list[int]) visitados ao seguir as arestas a partir do nó de partida."""
+        return [partida] + self.destino[arestas].tolist()
+
+# ---- Fim do Grafo Rodoviário ----
+
+# ---- Construção e Carga ----
+
+def construir_grafo(caminho_csv, caminho_saida=ARQUIVO_GRAFO):
+    """
+    Monta o grafo a partir de um CSV de arestas (ex.: exportado de um recorte do OpenStreetMap) com as colunas
+    lat_origem, lon_origem, lat_destino, lon_destino, distancia_metros, duracao_segundos e, opcionalmente, mao_dupla (0 ou 1).
+    Os nós são as coordenadas distintas das pontas das arestas. O grafo é salvo em .npz para ser carregado pelo aplicativo.
+    Retorna (grafo: GrafoRodoviario)
+    """
+    df = pd.read_csv(caminho_csv)
+
+    faltantes = [coluna for coluna in COLUNAS_ARESTAS if coluna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Colunas ausentes no arquivo de arestas: {', '.join(faltantes)}")
+
+    # Vias de mão dupla viram duas arestas, uma em cada sentido
+    if "mao_dupla" in df.columns:
+        inversas = df[df["mao_dupla"].astype(bool)].rename(columns={"lat_origem": "lat_destino", "lon_origem": "lon_destino",
+                                                                    "lat_destino": "lat_origem", "lon_destino": "lon_origem"})
+        df = pd.concat([df, inversas], ignore_index=True)
+
+    pontas = np.round(np.vstack([df[["lat_origem", "lon_origem"]].to_numpy(float), df[["lat_destino", "lon_destino"]].to_numpy(float)]), CASAS_NO)
+    coordenadas, indices = np.unique(pontas, axis=0, return_inverse=True)
+    indices = indices.ravel()
+
+    origem, destino = indices[:len(df)], indices[len(df):]
+    ordem = np.argsort(origem, kind="stable")
+
+    grafo = GrafoRodoviario(latitude=coordenadas[:, 0],
+                            longitude=coordenadas[:, 1],
+                            inicio=np.concatenate(([0], np.cumsum(np.bincount(origem, minlength=len(coordenadas))))),
+                            destino=destino[ordem],
+                            metros=np.round(df["distancia_metros"].to_numpy(float)[ordem]),
+                            segundos=np.round(df["duracao_segundos"].to_numpy(float)[ordem]))
+
+    if caminho_saida:
+        grafo.salvar(caminho_saida)
+
+    return grafo
+
+def carregar_grafo(caminho=ARQUIVO_GRAFO):
+    """
+    Carrega o grafo uma única vez por versão do arquivo (as próximas chamadas reaproveitam os arrays já em memória).
+    Um arquivo gerado ou regerado depois, mesmo por outro processo, é carregado na chamada seguinte.
+    Retorna (grafo: GrafoRodoviario ou None se o arquivo não existir)
+    """
+    with _trava:
+        # A ausência do arquivo não fica guardada: o grafo pode ser gerado com o aplicativo aberto
+        if not os.path.exists(caminho):
+            _grafos.pop(caminho, None)
+            return None
+
+        versao = os.path.getmtime(caminho)
+
+        if caminho not in _grafos or _grafos[caminho][0] != versao:
+            _grafos[caminho] = (versao, GrafoRodoviario.carregar(caminho))
+
+        return _grafos[caminho][1]
+
+# ---- Fim da Construção e Carga ----
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o grafo rodoviário usado no cálculo de rotas sem a API do Google.")
+    parser.add_argument("arestas", help="CSV com lat_origem, lon_origem, lat_destino, lon_destino, distancia_metros, duracao_segundos e mao_dupla (opcional).")
+    parser.add_argument("--saida", default=ARQUIVO_GRAFO, help=f"Arquivo .npz gerado (padrão: {ARQUIVO_GRAFO}).")
+    args = parser.parse_args()
+
+    grafo = construir_grafo(args.arestas, args.saida)
+
+    print(f"✅ Grafo com {grafo.nos} nós e {len(grafo.destino)} arestas salvo em {args.saida}.")
+
+
+if __name__ == "__main__":
+
+    main()
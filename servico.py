@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import os
+import aiohttp
+from aiohttp import web
+from cache import ler_cache, gravar_cache
+from consumo import resumo_consumo, reservar_rotas, registrar_acerto, sku_rotas, rotas_rebaixadas, OrcamentoEsgotado, CAMPO_NIVEL
+from cliente_http import calcular_espera, STATUS_REPETIVEIS, TENTATIVAS, TIMEOUT_CONEXAO, TIMEOUT_LEITURA, TAMANHO_POOL
+from lote import resolver_lane, ler_racional, COLUNAS_ENTRADA
+from utils import carregar_enderecos, montar_requisicao_rotas, processar_rotas, rotas_vectura, ler_cotacao, gravar_cotacao, reprecificar, URL_ROTAS
+
+PORTA = 8080
+MAX_EM_VOO = 8 # Máximo de chamadas simultâneas à API de Rotas, somando todas as cotações em andamento
+LIMITE_LOTE = 500 # Máximo de lanes aceitas em um único pedido de lote
+RACIONAL_PADRAO = 12.0
+
+# ---- Chamadas à API de Rotas ----
+
+async def rotas_async(app, origin, destination, waypoints, api_key):
+    """
+    Versão assíncrona de google_routes_api: mesmo corpo, mesma chave de cache e mesmas novas tentativas (429/5xx e falhas de rede),
+    pela sessão HTTP compartilhada do serviço. O semáforo só é ocupado durante a chamada, não durante a espera entre tentativas.
+    O cache e o consumo ficam no SQLite, então são lidos e gravados fora do laço de eventos.
+    Retorna (resposta: dict)
+    """
+    headers, body, chave_cache = montar_requisicao_rotas(origin, destination, waypoints, api_key)
+
+    resposta_cache = await asyncio.to_thread(ler_cache, "rotas", chave_cache)
+    if resposta_cache is not None:
+        await asyncio.to_thread(registrar_acerto, sku_rotas(body))
+        return resposta_cache
+
+    # Cotações simultâneas que precisam da mesma rota esperam a mesma chamada, em vez de repeti-la
+    tarefa = app["em_andamento"].get(chave_cache)
+
+    if tarefa is None:
+        tarefa = asyncio.ensure_future(chamar_rotas(app, headers, body, chave_cache))
+        app["em_andamento"][chave_cache] = tarefa
+        tarefa.add_done_callback(lambda _: app["em_andamento"].pop(chave_cache, None))
+
+    return await asyncio.shield(tarefa)
+
+async def chamar_rotas(app, headers, body, chave_cache):
+    # A reserva no orçamento pode esperar na fila, então roda fora do laço de eventos
+    headers, body, nivel = await asyncio.to_thread(reservar_rotas, headers, body)
+
+    for tentativa in range(TENTATIVAS):
+        ultima = tentativa == TENTATIVAS - 1
+
+        try:
+            async with app["semaforo"]:
+                async with app["sessao"].post(app["url_rotas"], headers=headers, json=body) as resposta:
+                    if resposta.status in STATUS_REPETIVEIS and not ultima:
+                        espera = calcular_espera(tentativa, resposta)
+                    else:
+                        dados = await resposta.json(content_type=None)
+                        break
+
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if ultima:
+                raise
+
+            espera = calcular_espera(tentativa)
+
+        await asyncio.sleep(espera)
+
+    # Uma resposta rebaixada é marcada e não vai para o cache, para não ocupar o lugar da completa
+    if nivel != "completo":
+        dados[CAMPO_NIVEL] = nivel
+
+    # Só guarda respostas válidas, para que erros da API não fiquem presos no cache
+    elif dados.get("routes"):
+        await asyncio.to_thread(gravar_cache, "rotas", chave_cache, dados)
+
+    return dados
+
+# ---- Fim das Chamadas à API de Rotas ----
+
+# ---- Cotação ----
+
+async def cotar(app, lane, enderecos):
+    """
+    Cota uma lane (nomes cadastrados de origem, destino, recarga e destino_2, e um racional opcional).
+    As duas rotas da cotação são pedidas ao mesmo tempo.
+    Retorna (resultado: dict pronto para JSON)
+    """
+    resultado = {coluna: lane.get(coluna) for coluna in COLUNAS_ENTRADA}
+
+    racional, mensagem = ler_racional(lane.get("racional"), app["racional"])
+
+    if racional is None:
+        return {**resultado, "status": "erro", "mensagem": mensagem}
+
+    enderecos_lane, mensagem = resolver_lane(lane, enderecos)
+
+    if enderecos_lane is None:
+        return {**resultado, "status": "erro", "mensagem": mensagem}
+
+    memo = await asyncio.to_thread(ler_cotacao, *enderecos_lane, "google")
+
+    if memo is not None:
+        status, mensagem, dados = True, memo[0], memo[1]
+    else:
+        rota_simples, rota_carregada = rotas_vectura(*enderecos_lane)
+
+        try:
+            respostas = await asyncio.gather(*(rotas_async(app, rota[0], rota[1], list(rota[2]), app["chave_api"]) for rota in (rota_simples, rota_carregada)))
+            status, mensagem, dados = processar_rotas(*enderecos_lane, *respostas, racional)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OrcamentoEsgotado) as erro:
+            return {**resultado, "status": "erro", "mensagem": f"❌ Não foi possível consultar as rotas na API do Google ({erro.__class__.__name__})."}
+        except (KeyError, IndexError, ValueError) as erro:
+            # Corpo que não é JSON (ex.: página de erro de um proxy) ou JSON sem os campos esperados
+            return {**resultado, "status": "erro", "mensagem": f"❌ Resposta inesperada da API ({erro.__class__.__name__})."}
+
+        if status and not rotas_rebaixadas(*respostas):
+            await asyncio.to_thread(gravar_cotacao, "google", mensagem, dados)
+
+    if not status:
+        return {**resultado, "status": "erro", "mensagem": mensagem}
+
+    if dados.racional != racional:
+        dados = reprecificar(dados, racional)
+
+    return {**resultado, "status": "ok", "mensagem": mensagem, **dados.para_dict()}
+
+# ---- Fim da Cotação ----
+
+# ---- Rotas HTTP ----
+
+async def ler_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='{"erro": "Corpo da requisição não é um JSON válido."}', content_type="application/json")
+
+async def cotacao(request):
+    """POST /cotacao com {"origem", "destino", "recarga", "destino_2", "racional" (opcional)}."""
+    lane = await ler_json(request)
+
+    if not isinstance(lane, dict):
+        return web.json_response({"erro": "Informe a cotação como um objeto JSON."}, status=400)
+
+    return web.json_response(await cotar(request.app, lane, await asyncio.to_thread(carregar_enderecos)))
+
+async def lote(request):
+    """POST /lote com {"lanes": [...], "racional" (opcional, padrão das lanes sem racional)}. As lanes são cotadas ao mesmo tempo."""
+    pedido = await ler_json(request)
+    lanes = pedido.get("lanes") if isinstance(pedido, dict) else None
+
+    if not isinstance(lanes, list) or len(lanes) > LIMITE_LOTE:
+        return web.json_response({"erro": f"Informe 'lanes' como uma lista de até {LIMITE_LOTE} cotações."}, status=400)
+
+    invalidas = [numero for numero, lane in enumerate(lanes, start=1) if not isinstance(lane, dict)]
+    if invalidas:
+        return web.json_response({"erro": f"Cada lane deve ser um objeto JSON (lanes inválidas: {', '.join(map(str, invalidas))})."}, status=400)
+
+    enderecos = await asyncio.to_thread(carregar_enderecos)
+    padrao = pedido.get("racional")
+    lanes = [{"racional": padrao, **lane} for lane in lanes]
+
+    # Uma lane com erro inesperado vira um resultado com erro, sem derrubar as outras
+    resultados = await asyncio.gather(*(cotar(request.app, lane, enderecos) for lane in lanes), return_exceptions=True)
+    resultados = [{**{coluna: lane.get(coluna) for coluna in COLUNAS_ENTRADA}, "status": "erro", "mensagem": f"❌ Erro inesperado na cotação ({resultado.__class__.__name__})."}
+                  if isinstance(resultado, Exception) else resultado
+                  for lane, resultado in zip(lanes, resultados)]
+
+    return web.json_response({"resultados": resultados,
+                              "sucesso": sum(resultado["status"] == "ok" for resultado in resultados),
+                              "falhas": sum(resultado["status"] != "ok" for resultado in resultados)})
+
+async def saude(request):
+    return web.json_response({"status": "ok"})
+
+async def consumo(request):
+    """GET /consumo?dias=N com o uso da API por SKU nos últimos N dias (padrão: hoje)."""
+    try:
+        dias = max(1, int(request.query.get("dias", 1)))
+    except ValueError:
+        return web.json_response({"erro": "'dias' deve ser um número inteiro."}, status=400)
+
+    return web.json_response({"consumo": resumo_consumo(dias)})
+
+# ---- Fim das Rotas HTTP ----
+
+def criar_app(chave_api, url_rotas=URL_ROTAS, max_em_voo=MAX_EM_VOO, racional=RACIONAL_PADRAO):
+    """
+    Monta o serviço. Uma única sessão HTTP (com pool de conexões) é aberta na subida e fechada na parada.
+    Retorna (app: aiohttp.web.Application)
+    """
+    app = web.Application()
+    app["chave_api"] = chave_api
+    app["url_rotas"] = url_rotas
+    app["racional"] = racional
+
+    async def sessao_compartilhada(app):
+        conector = aiohttp.TCPConnector(limit=max(TAMANHO_POOL, max_em_voo))
+        timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT_CONEXAO, sock_read=TIMEOUT_LEITURA)
+
+        async with aiohttp.ClientSession(connector=conector, timeout=timeout) as sessao:
+            app["sessao"] = sessao
+            app["semaforo"] = asyncio.Semaphore(max_em_voo)
+            app["em_andamento"] = {}
+            yield
+
+    app.cleanup_ctx.append(sessao_compartilhada)
+    app.add_routes([web.post("/cotacao", cotacao),
+                    web.post("/lote", lote),
+                    web.get("/saude", saude),
+                    web.get("/consumo", consumo)])
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP de cotação de frete (cotações avulsas e em lote).")
+    parser.add_argument("--porta", type=int, default=PORTA, help="Porta do serviço.")
+    parser.add_argument("--chave", default=os.environ.get("GOOGLE_API_KEY", ""), help="Chave da API do Google (padrão: variável GOOGLE_API_KEY).")
+    parser.add_argument("--url-rotas", default=URL_ROTAS, help="Endereço da API de Rotas (ex.: um servidor local de testes).")
+    parser.add_argument("--em-voo", type=int, default=MAX_EM_VOO, help="Máximo de chamadas simultâneas à API de Rotas.")
+    parser.add_argument("--racional", type=float, default=RACIONAL_PADRAO, help="Racional padrão (R$/km) das cotações que não informam um.")
+    args = parser.parse_args()
+
+    if not args.chave:
+        parser.error("Informe a chave da API com --chave ou pela variável GOOGLE_API_KEY.")
+
+    web.run_app(criar_app(args.chave, args.url_rotas, args.em_voo, args.racional), port=args.porta)
+
+
+if __name__ == "__main__":
+
+    main()
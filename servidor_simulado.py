@@ -0,0 +1,218 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+from cliente_http import chave_gravacao, DIR_GRAVACOES
+from geografia import haversine_km
+from polilinha import codificar
+
+PORTA = 8765
+CAMINHO_ROTAS = "/directions/v2:computeRoutes"
+CAMINHO_GEOCODE = "/maps/api/geocode/json"
+
+FATOR_ESTRADA = 1.3 # Distância por estrada estimada a partir da linha reta, nas respostas sintéticas
+VELOCIDADE_MEDIA = 60 / 3.6 # Velocidade média (m/s) usada para a duração nas respostas sintéticas
+PEDAGIO_POR_KM = 12 # Centavos de pedágio por km nas respostas sintéticas
+
+# ---- Respostas Sintéticas ----
+# Quando não há gravação para uma requisição, o servidor pode inventar uma resposta determinística: cada endereço vira
+# sempre a mesma coordenada (numa área que cobre o estado de São Paulo), e rotas e geocodificação concordam entre si.
+
+def coordenada_sintetica(endereco):
+    """Retorna (latitude: float, longitude: float) fixa para o texto do endereço."""
+    numero = int(hashlib.sha256(endereco.strip().lower().encode("utf-8")).hexdigest()[:12], 16)
+
+    return -25.0 + (numero % 10_000) / 10_000 * 5.0, -53.0 + (numero // 10_000 % 10_000) / 10_000 * 9.0
+
+def resposta_geocode_sintetica(endereco):
+    lat, lng = coordenada_sintetica(endereco)
+
+    return {"status": "OK",
+            "results": [{"formatted_address": endereco.strip(),
+                         "geometry": {"location": {"lat": lat, "lng": lng}}}]}
+
+def resposta_rotas_sintetica(corpo):
+    pedagios = "TOLLS" in corpo.get("extraComputations", [])
+    enderecos = [corpo["origin"]["address"], *(parada["address"] for parada in corpo.get("intermediates", [])), corpo["destination"]["address"]]
+    pontos = [coordenada_sintetica(endereco) for endereco in enderecos]
+    legs = []
+
+    for (lat1, lng1), (lat2, lng2) in zip(pontos[:-1], pontos[1:]):
+        metros = int(haversine_km(lat1, lng1, lat2, lng2) * 1000 * FATOR_ESTRADA)
+        pedagio = metros // 1000 * PEDAGIO_POR_KM if pedagios else 0
+        linha = np.column_stack((np.linspace(lat1, lat2, 20), np.linspace(lng1, lng2, 20)))
+
+        legs.append({"distanceMeters": metros,
+                     "duration": f"{int(metros / VELOCIDADE_MEDIA)}s",
+                     "polyline": {"encodedPolyline": codificar(linha)},
+                     "travelAdvisory": {"tollInfo": {"estimatedPrice": [{"currencyCode": "BRL", "units": str(pedagio // 100), "nanos": pedagio % 100 * 10_000_000}]}}})
+
+    pedagio_total = sum(int(leg["travelAdvisory"]["tollInfo"]["estimatedPrice"][0]["units"]) * 100
+                        + leg["travelAdvisory"]["tollInfo"]["estimatedPrice"][0]["nanos"] // 10_000_000 for leg in legs)
+
+    return {"routes": [{"distanceMeters": sum(leg["distanceMeters"] for leg in legs),
+                        "duration": f"{sum(int(leg['duration'][:-1]) for leg in legs)}s",
+                        "polyline": {"encodedPolyline": codificar(np.array(pontos))},
+                        "legs": legs,
+                        "travelAdvisory": {"tollInfo": {"estimatedPrice": [{"currencyCode": "BRL", "units": str(pedagio_total // 100), "nanos": pedagio_total % 100 * 10_000_000}]}}}]}
+
+# ---- Fim das Respostas Sintéticas ----
+
+# ---- Servidor ----
+
+class ServidorSimulado(ThreadingHTTPServer):
+    """
+    Servidor HTTP que imita as APIs de Rotas (computeRoutes) e de Geocoding respondendo com as gravações de um diretório
+    (as mesmas gravadas por cliente_http no modo "gravar"), com latência, variação (jitter) e erros injetados configuráveis.
+    """
+    daemon_threads = True
+
+    def __init__(self, endereco, diretorio=DIR_GRAVACOES, latencia=0.0, jitter=0.0, taxa_erro=0.0, taxa_limite=0.0, sintetico=True, semente=None):
+        super().__init__(endereco, TratadorSimulado)
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_erro = taxa_erro
+        self.taxa_limite = taxa_limite
+        self.sintetico = sintetico
+        self.aleatorio = random.Random(semente)
+        self.trava = threading.Lock()
+        self.contagem = {"requisicoes": 0, "gravadas": 0, "sinteticas": 0, "erros_injetados": 0, "nao_encontradas": 0}
+        self.gravacoes = {}
+
+        for caminho in glob.glob(os.path.join(diretorio, "*.json")):
+            with open(caminho, "r", encoding="utf-8") as f:
+                gravacao = json.load(f)
+
+            if {"metodo", "caminho", "status", "resposta"} <= set(gravacao):
+                chave = chave_gravacao(gravacao["metodo"], gravacao["caminho"], gravacao.get("parametros"), gravacao.get("corpo"))
+                self.gravacoes[chave] = gravacao
+
+    def sortear(self):
+        """Retorna (espera: float em segundos, erro: int ou None) para uma requisição."""
+        with self.trava:
+            espera = max(0.0, self.latencia + self.aleatorio.uniform(-self.jitter, self.jitter))
+            sorteio = self.aleatorio.random()
+
+        if sorteio < self.taxa_erro:
+            return espera, 503
+
+        if sorteio < self.taxa_erro + self.taxa_limite:
+            return espera, 429
+
+        return espera, None
+
+    def contar(self, campo):
+        with self.trava:
+            self.contagem[campo] += 1
+
+
+class TratadorSimulado(BaseHTTPRequestHandler):
+
+    def log_message(self, formato, *args):
+        pass
+
+    def responder(self, status, conteudo, cabecalhos=None):
+        corpo = json.dumps(conteudo, ensure_ascii=False).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def atender(self, metodo, caminho, parametros, corpo):
+        servidor = self.server
+        servidor.contar("requisicoes")
+
+        espera, erro = servidor.sortear()
+        time.sleep(espera)
+
+        if erro is not None:
+            servidor.contar("erros_injetados")
+            cabecalhos = {"Retry-After": "1"} if erro == 429 else None
+            return self.responder(erro, {"error": {"code": erro, "message": "Erro injetado pelo servidor simulado.", "status": "UNAVAILABLE" if erro == 503 else "RESOURCE_EXHAUSTED"}}, cabecalhos)
+
+        gravacao = servidor.gravacoes.get(chave_gravacao(metodo, caminho, parametros, corpo))
+
+        if gravacao is not None:
+            servidor.contar("gravadas")
+            return self.responder(gravacao["status"], gravacao["resposta"])
+
+        if servidor.sintetico and caminho == CAMINHO_ROTAS and corpo:
+            servidor.contar("sinteticas")
+            return self.responder(200, resposta_rotas_sintetica(corpo))
+
+        if servidor.sintetico and caminho == CAMINHO_GEOCODE and parametros.get("address"):
+            servidor.contar("sinteticas")
+            return self.responder(200, resposta_geocode_sintetica(parametros["address"]))
+
+        servidor.contar("nao_encontradas")
+        self.responder(404, {"error": {"code": 404, "message": f"Nenhuma gravação para {metodo} {caminho}.", "status": "NOT_FOUND"}})
+
+    def do_GET(self):
+        partes = urlsplit(self.path)
+        parametros = {nome: valores[0] for nome, valores in parse_qs(partes.query).items()}
+
+        self.atender("GET", partes.path, parametros, None)
+
+    def do_POST(self):
+        partes = urlsplit(self.path)
+        tamanho = int(self.headers.get("Content-Length", 0))
+
+        try:
+            corpo = json.loads(self.rfile.read(tamanho) or b"null")
+        except ValueError:
+            return self.responder(400, {"error": {"code": 400, "message": "Corpo inválido.", "status": "INVALID_ARGUMENT"}})
+
+        self.atender("POST", partes.path, {}, corpo)
+
+def iniciar_servidor(porta=0, **configuracao):
+    """
+    Sobe o servidor simulado em uma thread (porta 0 escolhe uma porta livre), para testes e benchmarks.
+    Retorna (servidor: ServidorSimulado, url_base: str). Para parar: servidor.shutdown()
+    """
+    servidor = ServidorSimulado(("127.0.0.1", porta), **configuracao)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+# ---- Fim do Servidor ----
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita as APIs de Rotas e de Geocoding do Google a partir de gravações.")
+    parser.add_argument("--porta", type=int, default=PORTA, help="Porta do servidor.")
+    parser.add_argument("--gravacoes", default=DIR_GRAVACOES, help="Diretório com as respostas gravadas.")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência média de cada resposta (segundos).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variação máxima da latência, para mais ou para menos (segundos).")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração das requisições respondidas com 503.")
+    parser.add_argument("--taxa-limite", type=float, default=0.0, help="Fração das requisições respondidas com 429 (com Retry-After).")
+    parser.add_argument("--sem-sintetico", action="store_true", help="Responde 404 quando não houver gravação, em vez de uma resposta sintética.")
+    parser.add_argument("--semente", type=int, default=None, help="Semente do sorteio de latência e erros, para repetir um teste.")
+    args = parser.parse_args()
+
+    servidor = ServidorSimulado(("127.0.0.1", args.porta), diretorio=args.gravacoes, latencia=args.latencia, jitter=args.jitter,
+                                taxa_erro=args.taxa_erro, taxa_limite=args.taxa_limite, sintetico=not args.sem_sintetico, semente=args.semente)
+
+    print(f"✅ Servidor simulado em http://127.0.0.1:{args.porta} ({len(servidor.gravacoes)} gravações).")
+    print(f"   VECTURA_URL_ROTAS=http://127.0.0.1:{args.porta}{CAMINHO_ROTAS}")
+    print(f"   VECTURA_URL_GEOCODE=http://127.0.0.1:{args.porta}{CAMINHO_GEOCODE}")
+
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+
+    main()
@@ -1,9 +1,195 @@
 import streamlit as st
 import pandas as pd
-from utils import carregar_enderecos, salvar_enderecos, excluir_enderecos, extrai_coord, vectura, salva_historico, reduzir_para_historico, limpar_historico, carregar_fixos, salvar_fixos, fixar_calculo, limpar_fixos, gerar_mapa
+from contextlib import nullcontext
+from utils import MAPAS_EM_CACHE, carregar_enderecos, salvar_enderecos, excluir_enderecos, extrai_coord, vectura, reprecificar, salva_historico, reduzir_para_historico, gerar_id_consulta, limpar_historico, carregar_fixos, salvar_fixos, fixar_calculo, limpar_fixos, gerar_mapa, gerar_mapa_trechos, pontos_mapa, ROTEAMENTOS, converter_tempo
+from recomendacao import recomendar_recargas
+from banco import consultar_historico, valores_historico, contar_historico
 from streamlit_folium import st_folium
 import folium
+from rastreamento import rastrear, coletar, resumir
+from consumo import resumo_consumo
 
+# Nomes das colunas nas tabelas de histórico e de consultas fixas
+NOMES_COLUNAS = {"data_calculo": "Data Cálculo",
+                 "origem": "Origem",
+                 "destino_1": "Destino 1",
+                 "recarga": "Recarga",
+                 "destino_2": "Destino 2",
+                 "simples_metros": "KM Total (Simples)",
+                 "simples_segundos": "Tempo Total (Simples)",
+                 "simples_pedagio_centavos": "Valor Pedágios (Simples)",
+                 "total_metros": "KM Total",
+                 "total_segundos": "Tempo Total",
+                 "total_pedagio_centavos": "Valor Total Pedágios",
+                 "diferenca_metros": "Diferença KM",
+                 "diferenca_segundos": "Diferença Tempo",
+                 "diferenca_pedagio_centavos": "Diferença Tarifas",
+                 "racional": "Racional",
+                 "valor_excedente_centavos": "Valor Excedente"}
+
+NOMES_ROTEAMENTO = {"automatico": "Automático", "google": "API do Google", "local": "Grafo local"} # Opções de cálculo das rotas
+
+ABAS_RESULTADO = ["Valor Sugerido", "Mapas", "Distâncias", "Pedágios"] # Visões do resultado de um cálculo
+
+ROTULOS_TRECHOS = ("Origem → Destino 1", "Destino 1 → Recarga", "Recarga → Destino 2", "Destino 2 → Origem") # Trechos da rota completa
+
+LOCALIZACAO_INICIAL = (-23.5505, -46.6333) # Centro do mapa da tela de cálculo
+
+# Nomes dos SKUs da API do Google no resumo de consumo
+NOMES_SKU = {"rotas_enterprise": "Rotas (Enterprise)",
+             "rotas_pro": "Rotas (Pro)",
+             "rotas_essentials": "Rotas (Essentials)",
+             "geocoding": "Geocoding"}
+
+# Opções de ordenação do histórico (colunas indexadas no banco)
+ORDENACAO_HISTORICO = {"calculado_em": "Data do cálculo",
+                       "valor_excedente": "Valor excedente",
+                       "origem": "Origem",
+                       "destino_1": "Destino 1",
+                       "recarga": "Recarga"}
+
+# ---- Formatação para Exibição ----
+# Os resultados guardam metros, segundos e centavos como inteiros; só aqui viram texto.
+
+def formatar_km(metros):
+    return f"{metros / 1000:.2f} km"
+
+def formatar_tempo(segundos):
+    return "{:02}:{:02}:{:02}".format(*converter_tempo(abs(int(segundos))))
+
+def formatar_reais(centavos):
+    return f"R$ {centavos / 100:.2f}"
+
+def legenda_pontos(polilinha):
+    """Retorna (texto: str com quantos pontos da rota foram desenhados no mapa depois da simplificação)"""
+    pontos, total = pontos_mapa(polilinha)
+
+    return f"Rota desenhada com {len(pontos)} de {total} pontos ({1 - len(pontos) / max(total, 1):.0%} a menos)."
+
+FORMATOS_COLUNAS = {"_metros": formatar_km, "_segundos": formatar_tempo, "_centavos": formatar_reais}
+
+def formatar_tabela(df):
+    """
+    Formata as colunas numéricas de uma tabela de resultados pelo sufixo do nome (_metros, _segundos, _centavos).
+    Colunas que não são numéricas (registros antigos, já formatados) ficam como estão.
+    Retorna (df: pd.DataFrame)
+    """
+    df = df.copy()
+
+    for coluna in df.columns:
+        formato = next((f for sufixo, f in FORMATOS_COLUNAS.items() if coluna.endswith(sufixo)), None)
+
+        if formato is not None and pd.api.types.is_numeric_dtype(df[coluna]):
+            df[coluna] = df[coluna].map(formato, na_action="ignore")
+
+    return df
+
+# ---- Fim da Formatação para Exibição ----
+
+# ---- Mapas e Tabelas em Cache ----
+# Cada clique em um widget executa a página inteira de novo; o que depende só dos dados é montado uma vez por conteúdo.
+
+@st.cache_resource(max_entries=MAPAS_EM_CACHE, show_spinner=False)
+def mapa_marcadores(marcadores):
+    """
+    Monta o mapa da tela de cálculo com um pino para cada local selecionado.
+    marcadores: tuple de (latitude, longitude, rótulo, cor)
+    Retorna (mapa: folium.Map)
+    """
+    mapa = folium.Map(location=LOCALIZACAO_INICIAL, zoom_start=9)
+
+    for latitude, longitude, rotulo, cor in marcadores:
+        folium.Marker(location=[latitude, longitude], popup=rotulo, icon=folium.Icon(color=cor)).add_to(mapa)
+
+    return mapa
+
+@st.cache_data(show_spinner=False)
+def tabela_enderecos(locais):
+    """Retorna (df: pd.DataFrame com o nome e o endereço de cada local salvo de um tipo)"""
+    return pd.DataFrame([{"Nome": nome, "Endereço": dados["endereco_formatado"]} for nome, dados in locais.items()])
+
+def mapas_resultado(id_resultado, dados):
+    """
+    Monta os mapas de um resultado só quando a visão de mapas é aberta, e guarda os do último resultado na sessão
+    para que as próximas execuções da página não os refaçam.
+    Retorna (mapa_ida_volta: folium.Map, mapa_completo: folium.Map)
+    """
+    guardados = st.session_state.get("mapas_vectura")
+
+    if guardados is not None and guardados[0] == id_resultado:
+        return guardados[1]
+
+    # Com a geometria de cada trecho na resposta, a rota completa é desenhada com uma cor por trecho
+    polilinhas_trechos = tuple(trecho.polilinha for trecho in dados.completo.trechos)
+
+    if all(polilinhas_trechos):
+        mapa_completo = gerar_mapa_trechos(polilinhas_trechos, ROTULOS_TRECHOS)
+    else:
+        mapa_completo = gerar_mapa(dados.completo.polilinha)
+
+    mapas = (gerar_mapa(dados.simples.polilinha), mapa_completo)
+    st.session_state["mapas_vectura"] = (id_resultado, mapas)
+
+    return mapas
+
+# O st_folium serializa o mapa inteiro para o navegador em toda execução da página
+@rastrear("st_folium")
+def exibir_mapa(mapa, width, height):
+    return st_folium(mapa, width=width, height=height)
+
+# ---- Fim dos Mapas e Tabelas em Cache ----
+
+# ---- Depuração ----
+
+def tabela_rastreamento(medicoes):
+    """Retorna (df: pd.DataFrame com uma linha por medição, recuada conforme a medição que a contém)"""
+    return pd.DataFrame([{"Etapa": " " * linha["profundidade"] + linha["nome"],
+                          "Início (ms)": round(linha["inicio_ms"], 1),
+                          "Duração (ms)": round(linha["duracao_ms"], 1),
+                          "Erro": linha["erro"] or "",
+                          "Detalhes": ", ".join(f"{nome}={valor}" for nome, valor in linha["atributos"].items())}
+                         for linha in resumir(medicoes)])
+
+def painel_rastreamento(medicoes_pagina):
+    """Mostra os tempos da última cotação e da execução atual da página (com o modo de depuração ligado na barra lateral)."""
+    with st.expander("🐞 Tempos de Execução"):
+        medicoes_cotacao = st.session_state.get("rastreamento_vectura")
+
+        st.write("### Última cotação")
+        if medicoes_cotacao:
+            st.dataframe(tabela_rastreamento(medicoes_cotacao), hide_index=True)
+        else:
+            st.info("Rode uma cotação com o modo de depuração ligado para ver os tempos de cada etapa.")
+
+        st.write("### Esta execução da página")
+        st.dataframe(tabela_rastreamento(medicoes_pagina), hide_index=True)
+
+# ---- Fim da Depuração ----
+
+# ---- Consumo da API ----
+
+def painel_consumo():
+    """Mostra na barra lateral o uso da API: chamadas, respostas do cache, custo estimado e o que resta do orçamento de hoje."""
+    with st.sidebar.expander("📊 Consumo da API"):
+        hoje = resumo_consumo()
+        mes = resumo_consumo(30)
+
+        col1, col2 = st.columns(2)
+        col1.metric("Custo hoje", f"US$ {sum(linha['custo_usd'] for linha in hoje):.2f}")
+        col2.metric("Últimos 30 dias", f"US$ {sum(linha['custo_usd'] for linha in mes):.2f}")
+
+        st.dataframe(pd.DataFrame([{"SKU": NOMES_SKU.get(linha["sku"], linha["sku"]),
+                                    "Chamadas": linha["chamadas"],
+                                    "Cache": linha["acertos_cache"],
+                                    "Restante hoje": "—" if linha["restante_dia"] is None else linha["restante_dia"],
+                                    "Rebaixadas": linha["degradadas"],
+                                    "Bloqueadas": linha["bloqueadas"]} for linha in hoje]), hide_index=True)
+
+        st.caption("Custos estimados pela tabela pública de preços do Google, sem descontos por volume.")
+
+# ---- Fim do Consumo da API ----
+
+@rastrear()
 def tela_0():
     
     st.markdown("""<div class="app-info">
@@ -128,6 +314,7 @@ def tela_0():
   <p style="margin-top:14px">Tudo isso em segundos — com precisão, transparência e sem depender de planilhas externas.</p>
 </div>""", unsafe_allow_html=True)
 
+@rastrear()
 def tela_1():
     st.subheader("💰 Cálculo Frete") # Subtítulo da página Vectura
     st.divider()
@@ -135,12 +322,13 @@ def tela_1():
     # ---- Sidebar ----
     origens = [None] + list(st.session_state["enderecos"]["Origem"].keys())
     destinos = [None] + list(st.session_state["enderecos"]["Destino"].keys())
-    recargas = [None] + list(st.session_state["enderecos"]["Recarga"].keys())
 
     st.sidebar.subheader("⚙️ Chave API")
 
     api_key = st.sidebar.text_input("Insira a chave de API")
 
+    roteamento = st.sidebar.radio("Cálculo das rotas", options=list(ROTEAMENTOS), format_func=lambda x: NOMES_ROTEAMENTO[x], horizontal=True)
+
     st.sidebar.divider()
 
     st.sidebar.subheader("🚚 Locais de Origem/Destino") # Título do Sidebar
@@ -162,6 +350,15 @@ def tela_1():
       endereco_destino = st.session_state["enderecos"]["Destino"][destino]["endereco_formatado"]
       st.sidebar.write(endereco_destino)
 
+    # Com o destino escolhido, as recargas aparecem da mais próxima para a mais distante dele
+    if destino is None:
+      recargas = [None] + list(st.session_state["enderecos"]["Recarga"].keys())
+
+    else:
+      dados_destino = st.session_state["enderecos"]["Destino"][destino]
+      proximas = st.session_state["indice"].vizinhos("Recarga", dados_destino["latitude"], dados_destino["longitude"], k=len(st.session_state["enderecos"]["Recarga"]))
+      recargas = [None] + [nome for nome, _ in proximas]
+
     recarga = st.sidebar.selectbox(label="Recarga:", options=recargas, format_func=lambda x: "Selecione..." if x is None else x, placeholder="Selecione uma das opções.") # Selectbox para endereço de entrega do caminhão
 
     if recarga == None:
@@ -198,68 +395,79 @@ def tela_1():
 
     if origem == None and destino == None and recarga == None and segundo_destino == None:
       # Gera o mapa para ficar exposto na tela inicial
-      localizacao_inicial = (-23.5505, -46.6333) 
-      mapa = folium.Map(location=localizacao_inicial, zoom_start=9)
+      mapa = mapa_marcadores(())
 
-      st_folium(mapa, width=1200, height=600)
+      exibir_mapa(mapa, width=1200, height=600)
     
     else:
 
-      # Gera o mapa para ficar exposto na tela inicial
-      localizacao_inicial = (-23.5505, -46.6333) 
-      mapa = folium.Map(location=localizacao_inicial, zoom_start=9)
-
-      if origem is not None:
-        dados = st.session_state["enderecos"]["Origem"][origem]
-        folium.Marker(
-            location=[dados["latitude"], dados["longitude"]],
-            popup=f"Origem: {origem}",
-            icon=folium.Icon(color="blue")
-        ).add_to(mapa)
-
-      # Exibir pin do destino
-      if destino is not None:
-          dados = st.session_state["enderecos"]["Destino"][destino]
-          folium.Marker(
-              location=[dados["latitude"], dados["longitude"]],
-              popup=f"Destino: {destino}",
-              icon=folium.Icon(color="black")
-          ).add_to(mapa)
-
-      # Exibir pin da recarga
-      if recarga is not None:
-          dados = st.session_state["enderecos"]["Recarga"][recarga]
-          folium.Marker(
-              location=[dados["latitude"], dados["longitude"]],
-              popup=f"Recarga: {recarga}",
-              icon=folium.Icon(color="red")
-          ).add_to(mapa)
-
-      if segundo_destino is not None:
-        dados = st.session_state["enderecos"]["Destino"][segundo_destino]
-        folium.Marker(
-              location=[dados["latitude"], dados["longitude"]],
-              popup=f"Segundo Destino: {segundo_destino}",
-              icon=folium.Icon(color="orange")
-          ).add_to(mapa)
-
-      st_folium(mapa, width=900, height=600)
+      # Um pino para cada local escolhido: (tipo, nome, rótulo, cor)
+      selecionados = [("Origem", origem, "Origem", "blue"),
+                      ("Destino", destino, "Destino", "black"),
+                      ("Recarga", recarga, "Recarga", "red"),
+                      ("Destino", segundo_destino, "Segundo Destino", "orange")]
+
+      marcadores = tuple((st.session_state["enderecos"][tipo][nome]["latitude"],
+                          st.session_state["enderecos"][tipo][nome]["longitude"],
+                          f"{rotulo}: {nome}",
+                          cor)
+                         for tipo, nome, rotulo, cor in selecionados if nome is not None)
+
+      mapa = mapa_marcadores(marcadores)
+
+      exibir_mapa(mapa, width=900, height=600)
+
+      # Sugestões de Recarga / Segundo Destino para a viagem selecionada
+      if origem is not None and destino is not None:
+        with st.expander("🔁 Sugestões de Recarga e Segundo Destino"):
+          if st.button("Sugerir combinações"):
+            status, mensagem, candidatos = recomendar_recargas(origem, destino, st.session_state["enderecos"], api_key, racional=racional)
+
+            if status and candidatos:
+              df_candidatos = pd.DataFrame([
+                  {
+                      "Recarga": candidato["recarga"],
+                      "Destino 2": candidato["destino_2"],
+                      "KM Extra": formatar_km(candidato["extra_metros"]),
+                      "Tempo Extra": formatar_tempo(candidato["extra_segundos"]),
+                      "Diferença Tarifas": formatar_reais(candidato["diferenca_pedagio_centavos"]),
+                      "Valor Excedente": formatar_reais(candidato["valor_excedente_centavos"]) if "valor_excedente_centavos" in candidato else ""
+                  }
+                  for candidato in candidatos
+              ])
+
+              st.dataframe(df_candidatos, hide_index=True)
+
+            elif status:
+              st.info(mensagem)
+
+            else:
+              st.error(mensagem)
 
     # ---- Fim da Tela Principal ----
 
       if botao_rodar: # Se o botão "Rodar" for selecionado:
 
-        status, mensagem, dados = vectura(origem=endereco_origem, 
-                          destino=endereco_destino, 
-                          recarga=endereco_recarga, 
-                          destino_2=endereco_segundo,
-                          chave_api = api_key,
-                          racional=racional
-                          ) # Roda o modelo
+        # Com a depuração desligada, a cotação não é medida (a não ser que a exportação das medições esteja ligada)
+        with coletar() if st.session_state.get("depuracao") else nullcontext() as medicoes_cotacao:
+          status, mensagem, dados = vectura(origem=endereco_origem, 
+                            destino=endereco_destino, 
+                            recarga=endereco_recarga, 
+                            destino_2=endereco_segundo,
+                            chave_api = api_key,
+                            racional=racional,
+                            roteamento=roteamento
+                            ) # Roda o modelo
+
+        st.session_state["rastreamento_vectura"] = medicoes_cotacao
         
         if status:
 
+          dados_reduzidos = reduzir_para_historico(dados)
+          salva_historico(st.session_state["historico"], dados_reduzidos)
+
           st.session_state["resultados_vectura"] = dados
+          st.session_state["id_resultado_vectura"] = gerar_id_consulta(dados_reduzidos)
           st.session_state["rodou_vectura"] = True
           st.session_state["mensagem_vectura"] = mensagem
       
@@ -268,25 +476,22 @@ def tela_1():
         dados = st.session_state["resultados_vectura"]
         mensagem = st.session_state["mensagem_vectura"]
 
-        st.session_state["polilinha_1"] = dados["polilinha_1"]
-        st.session_state["polilinha_2"] = dados["polilinha_2"]
-
-        st.session_state["mapa_1"] = gerar_mapa(dados["polilinha_1"])
-        st.session_state["mapa_2"] = gerar_mapa(dados["polilinha_2"])
-
-        dados_reduzidos = reduzir_para_historico(dados)
-        salva_historico(st.session_state["historico"], dados_reduzidos)
+        # Mudar só o racional não refaz a cotação: o valor excedente é recalculado sobre as mesmas rotas
+        if dados.racional != racional:
+          dados = reprecificar(dados, racional)
+          st.session_state["resultados_vectura"] = dados
 
         col_mensagem, col_botao = st.columns([0.9, 0.1])
 
         col_mensagem.success(mensagem)
         botao_fixar = col_botao.button("📌 Fixar Cálculo")
 
-        abas = st.tabs(["Valor Sugerido", "Mapas", "Distâncias", "Pedágios"]) # Criação de abas para apresentação dos resultados
+        # st.tabs executa o conteúdo de todas as abas em toda execução; com a seleção, só a visão escolhida é montada
+        aba_resultado = st.pills("Resultados", options=ABAS_RESULTADO, default=ABAS_RESULTADO[0], key="aba_resultado", label_visibility="collapsed")
 
-        with abas[0]:
+        if aba_resultado == "Valor Sugerido":
           st.subheader("💰 Valor Sugerido ao Cliente")
-          st.metric("Valor Excedente / Sugerido", dados['valor_excedente'])
+          st.metric("Valor Excedente / Sugerido", formatar_reais(dados.valor_excedente_centavos))
 
           st.divider()
 
@@ -295,36 +500,40 @@ def tela_1():
 
           with col1:
               st.write("### Ida e Volta Simples")
-              st.metric("Total (km)", dados["km_total_simples"])
-              st.metric("Total (tempo)", dados["tempo_total_simples"])
-              st.metric("Valor Pedágios", dados["valor_pedagio_total_simples"])
+              st.metric("Total (km)", formatar_km(dados.simples.distancia_metros))
+              st.metric("Total (tempo)", formatar_tempo(dados.simples.duracao_segundos))
+              st.metric("Valor Pedágios", formatar_reais(dados.simples.pedagio_centavos))
 
           with col2:
               st.write("### Rota Completa (Com Recarga)")
-              st.metric("Total (km)", dados["km_total"])
-              st.metric("Total (tempo)", dados["tempo_total"])
-              st.metric("Valor Pedágios", dados["valor_pedagios_total"])
+              st.metric("Total (km)", formatar_km(dados.completo.distancia_metros))
+              st.metric("Total (tempo)", formatar_tempo(dados.completo.duracao_segundos))
+              st.metric("Valor Pedágios", formatar_reais(dados.completo.pedagio_centavos))
 
           st.divider()
 
           st.write("### Diferenças Entre Rotas")
           colA, colB, colC = st.columns(3)
-          colA.metric("Dif. km", dados["km_diff"])
-          colB.metric("Dif. tempo", dados["tempo_diff"])
-          colC.metric("Dif. tarifas", dados["tarifas_diff"])
+          colA.metric("Dif. km", formatar_km(dados.diferenca_metros))
+          colB.metric("Dif. tempo", formatar_tempo(dados.diferenca_segundos))
+          colC.metric("Dif. tarifas", formatar_reais(dados.diferenca_pedagio_centavos))
 
           st.divider()
           st.write("### Racional do Cálculo")
-          st.info(dados["racional"])
+          st.info(f"R$ {dados.racional:.2f} por km rodado a mais, somados à diferença de pedágios.")
         
-        with abas[1]:
+        if aba_resultado == "Mapas":
+          mapa_1, mapa_2 = mapas_resultado(st.session_state["id_resultado_vectura"], dados)
+
           st.subheader("🗺️ Mapa - Ida e Volta")
-          st_folium(st.session_state["mapa_1"], width=1200, height=300)
+          exibir_mapa(mapa_1, width=1200, height=300)
+          st.caption(legenda_pontos(dados.simples.polilinha))
 
           st.divider()
 
           st.subheader("🗺️ Mapa - Rota Completa")
-          st_folium(st.session_state["mapa_2"], width=1200, height=300)
+          exibir_mapa(mapa_2, width=1200, height=300)
+          st.caption(legenda_pontos(dados.completo.polilinha))
         # st.subheader("🗺️ Mapa - Ida e Volta")
         # polilinha_1 = dados["polilinha_1"]
         # mapa_1 = gerar_mapa(polilinha_1)
@@ -354,12 +563,13 @@ def tela_1():
         # col13.subheader("🗺️ Rota - Trecho 4")
         # col13.image(dados["mapa_rota_trecho_4"])        
 
-        with abas[2]:
+        if aba_resultado == "Distâncias":
           st.subheader("📏 Distâncias - Ida e Volta")
           col1, col2 = st.columns(2)
 
-          col1.metric("Ida", dados["km_ida"])
-          col2.metric("Volta", dados["km_volta"])
+          ida, volta = dados.simples.trechos
+          col1.metric("Ida", formatar_km(ida.distancia_metros))
+          col2.metric("Volta", formatar_km(volta.distancia_metros))
 
           st.divider()
 
@@ -367,20 +577,18 @@ def tela_1():
 
           col3, col4, col5, col6 = st.columns(4)
 
-          col3.metric("Trecho 1", dados["km_trecho_1"])
-          col4.metric("Trecho 2", dados["km_trecho_2"])
-          col5.metric("Trecho 3", dados["km_trecho_3"])
-          col6.metric("Trecho 4", dados["km_trecho_4"])
+          for coluna, numero, trecho in zip((col3, col4, col5, col6), range(1, 5), dados.completo.trechos):
+            coluna.metric(f"Trecho {numero}", formatar_km(trecho.distancia_metros))
 
           st.divider()
 
           st.write("")
           st.write("### Diferenças entre rotas")
-          st.metric("Diferença Total", dados["km_diff"])
+          st.metric("Diferença Total", formatar_km(dados.diferenca_metros))
           
-        with abas[3]:
+        if aba_resultado == "Pedágios":
           st.subheader("🛣️ Pedágios — Ida e Volta Simples")
-          st.metric("Valor Total", dados["valor_pedagio_total_simples"])
+          st.metric("Valor Total", formatar_reais(dados.simples.pedagio_centavos))
 
           # st.write("### Lista Pedágios (Simples)")
           # st.table(pd.DataFrame(dados["lista_pedagios_total_simples"], columns=["Pedágio"]))
@@ -388,7 +596,12 @@ def tela_1():
           st.divider()
 
           st.subheader("🛣️ Pedágios — Rota Completa")
-          st.metric("Valor Total", dados["valor_pedagios_total"])
+          st.metric("Valor Total", formatar_reais(dados.completo.pedagio_centavos))
+
+          colP1, colP2, colP3, colP4 = st.columns(4)
+
+          for coluna, rotulo, trecho in zip((colP1, colP2, colP3, colP4), ROTULOS_TRECHOS, dados.completo.trechos):
+            coluna.metric(rotulo, formatar_reais(trecho.pedagio_centavos))
 
           # st.write("### Lista Pedágios (Completa)")
           # st.table(pd.DataFrame(dados["lista_pedagios_total"], columns=["Pedágio"]))
@@ -397,7 +610,7 @@ def tela_1():
 
           st.subheader("Diferenças entre rotas")
           colD1, colD2 = st.columns(2)
-          colD1.metric("Dif. Tarifas", dados["tarifas_diff"])
+          colD1.metric("Dif. Tarifas", formatar_reais(dados.diferenca_pedagio_centavos))
           colD2.metric("—", "")
         
         if botao_fixar:
@@ -414,6 +627,7 @@ def tela_1():
                 st.error(mensagem)
           
 
+@rastrear()
 def tela_2():
 
     tabs = st.tabs(["Registro/Exclusão", "Locais Registrados"]) # Criação de 2 abas
@@ -437,7 +651,7 @@ def tela_2():
         botao_salvar_endereco = col1.button("Salvar Endereço") # Cria um botão para salvar o endereço.
 
         if botao_salvar_endereco == True: # Se a seleção feita acima for "Saída", procurar na lista de endereços de Saída. Se não tiver o endereço, salvar com o nome inputado.
-            sucesso, mensagem = salvar_enderecos(tipo, nome_salvar, endereco_salvar, st.session_state["enderecos"], api_key)
+            sucesso, mensagem = salvar_enderecos(tipo, nome_salvar, endereco_salvar, st.session_state["enderecos"], api_key, st.session_state["indice"])
 
             # Caso as entradas passem pelas validações da função salvar_enderecos, solta uma mensagem de sucesso e carrega os enderecos
 
@@ -472,7 +686,7 @@ def tela_2():
         botao_excluir_endereco = col2.button("Excluir Endereço") # Cria um botão para excluir o endereço.
 
         if botao_excluir_endereco == True: # Procura na lista da opção selecionada o nome do endereço, se passar pela validação, o endereço excluído
-            sucesso2, mensagem2 = excluir_enderecos(tipo, nome_excluir, st.session_state["enderecos"])
+            sucesso2, mensagem2 = excluir_enderecos(tipo, nome_excluir, st.session_state["enderecos"], st.session_state["indice"])
 
             # Se a exclusão for bem sucedida, solta uma mensagem de sucesso e atualiza a lista de endereços salvos
 
@@ -487,35 +701,9 @@ def tela_2():
     
     with tabs[1]:
 
-        data_origens = st.session_state["enderecos"]["Origem"]
-        data_destino = st.session_state["enderecos"]["Destino"]
-        data_recarga = st.session_state["enderecos"]["Recarga"]
-
-        
-
-        df_origem = pd.DataFrame([
-                    {
-                        "Nome": nome,
-                        "Endereço": dados["endereco_formatado"]
-                    }
-                    for nome, dados in data_origens.items()
-                ]) # Cria o DataFrame com os endereços de saída 
-        
-        df_destino = pd.DataFrame([
-                    {
-                        "Nome": nome,
-                        "Endereço": dados["endereco_formatado"]
-                    }
-                    for nome, dados in data_destino.items()
-                ]) # Cria o DataFrame com os endereços de entrega
-        
-        df_recarga = pd.DataFrame([
-                    {
-                        "Nome": nome,
-                        "Endereço": dados["endereco_formatado"]
-                    }
-                    for nome, dados in data_recarga.items()
-                ]) # Cria o DataFrame com os endereços de recarga
+        df_origem = tabela_enderecos(st.session_state["enderecos"]["Origem"]) # DataFrame com os endereços de saída
+        df_destino = tabela_enderecos(st.session_state["enderecos"]["Destino"]) # DataFrame com os endereços de entrega
+        df_recarga = tabela_enderecos(st.session_state["enderecos"]["Recarga"]) # DataFrame com os endereços de recarga
 
         col3, col4, col5 = st.columns([1, 1, 1])
 
@@ -532,6 +720,7 @@ def tela_2():
         col5.dataframe(df_recarga) # Expõe o DF de recarga criado acima
 
 
+@rastrear()
 def tela_3():
     abas = st.tabs(["Histórico de Consultas", "Consultas Fixadas"])
 
@@ -544,7 +733,7 @@ def tela_3():
       botao_limpar_historico = col2.button("🧹 Limpar Histórico")
 
       if botao_limpar_historico:
-          if st.session_state["historico"]:
+          if contar_historico():
 
               status, mensagem = limpar_historico()
 
@@ -554,36 +743,60 @@ def tela_3():
               else:
                   st.error("❌ Não foi possível apagar o histórico")
 
-      if st.session_state["historico"]:
-
-        df_historico = pd.DataFrame(st.session_state["historico"])
-
-        df_historico = df_historico.rename(
-           columns={"origem": "Origem",
-                    "destino_1": "Destino 1",
-                    "recarga": "Recarga",
-                    "destino_2": "Destino 2",
-                    "km_total_simples": "KM Total (Simples)",
-                    "tempo_total_simples": "Tempo Total (Simples)",
-                    "qtd_pedagio_total_simples": "Qtd. Pedágios (Simples)",
-                    "valor_pedagio_total_simples": "Valor Pedágios (Simples)",
-                    "lista_pedagios_total_simples": "Lista Pedágios (Simples)",
-                    "km_total": "KM Total",
-                    "tempo_total": "Tempo Total",
-                    "qtd_total_pedagios": "Qtd. Total Pedágios",
-                    "valor_pedagios_total": "Valor Total Pedágios",
-                    "lista_pedagios_total": "Lista Total Pedágios",
-                    "km_diff": "Diferença KM",
-                    "tempo_diff": "Diferença Tempo",
-                    "qtd_pedagio_diff": "Diferença Pedágios",
-                    "tarifas_diff": "Diferença Tarifas",
-                    "racional": "Racional",
-                    "valor_excedente": "Valor Excedente"}
-        )
+      # ---- Filtros ----
+
+      with st.expander("🔎 Filtros e Ordenação"):
+        colF1, colF2, colF3 = st.columns(3)
 
+        destinos_historico = sorted(set(valores_historico("destino_1")) | set(valores_historico("destino_2")))
+
+        filtro_origem = colF1.selectbox("Origem", options=[None] + valores_historico("origem"), format_func=lambda x: "Todas" if x is None else x)
+        filtro_destino = colF2.selectbox("Destino", options=[None] + destinos_historico, format_func=lambda x: "Todos" if x is None else x)
+        filtro_recarga = colF3.selectbox("Recarga", options=[None] + valores_historico("recarga"), format_func=lambda x: "Todas" if x is None else x)
+
+        colF4, colF5, colF6, colF7 = st.columns(4)
+
+        periodo = colF4.date_input("Período", value=[], format="DD/MM/YYYY")
+        valor_minimo = colF5.number_input("Valor mínimo (R$)", min_value=0.0, value=None)
+        valor_maximo = colF6.number_input("Valor máximo (R$)", min_value=0.0, value=None)
+        ordenar_por = colF7.selectbox("Ordenar por", options=list(ORDENACAO_HISTORICO), format_func=lambda x: ORDENACAO_HISTORICO[x])
+
+        colF8, colF9 = st.columns(2)
+
+        decrescente = colF8.toggle("Ordem decrescente", value=True)
+        tamanho_pagina = colF9.selectbox("Consultas por página", options=[25, 50, 100], index=1)
+
+      # ---- Fim dos Filtros ----
+
+      filtros = {"origem": filtro_origem,
+                 "destino": filtro_destino,
+                 "recarga": filtro_recarga,
+                 "data_inicio": periodo[0] if len(periodo) > 0 else None,
+                 "data_fim": periodo[-1] if len(periodo) > 0 else None,
+                 "valor_minimo": valor_minimo,
+                 "valor_maximo": valor_maximo}
+
+      # Carrega do banco somente a página que vai ser exibida; a mesma consulta traz o total para saber quantas páginas existem
+      pagina = st.session_state.get("pagina_historico", 1)
+      consultas, total = consultar_historico(**filtros, ordenar_por=ordenar_por, decrescente=decrescente, pagina=pagina - 1, tamanho=tamanho_pagina)
+      paginas = max(1, -(-total // tamanho_pagina))
+
+      # Com outros filtros ou outro tamanho de página, a página escolhida pode não existir mais: volta para a última
+      if pagina > paginas:
+          pagina = paginas
+          consultas, total = consultar_historico(**filtros, ordenar_por=ordenar_por, decrescente=decrescente, pagina=pagina - 1, tamanho=tamanho_pagina)
+
+      st.session_state["pagina_historico"] = pagina
+      st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, step=1, key="pagina_historico")
+
+      if consultas:
+
+        df_historico = formatar_tabela(pd.DataFrame(consultas)).rename(columns=NOMES_COLUNAS)
+
+        st.caption(f"{total} consultas encontradas.")
         st.dataframe(df_historico)
       else:
-        st.info("Nenhuma consulta realizada ainda.")
+        st.info("Nenhuma consulta encontrada.")
           
     with abas[1]:
       
@@ -611,30 +824,9 @@ def tela_3():
 
       if st.session_state["fixos"]:
 
-        df_fixos = pd.DataFrame(st.session_state["fixos"])
-
-        df_fixos = df_fixos.rename(
-           columns={"origem": "Origem",
-                    "destino_1": "Destino 1",
-                    "recarga": "Recarga",
-                    "destino_2": "Destino 2",
-                    "km_total_simples": "KM Total (Simples)",
-                    "tempo_total_simples": "Tempo Total (Simples)",
-                    "qtd_pedagio_total_simples": "Qtd. Pedágios (Simples)",
-                    "valor_pedagio_total_simples": "Valor Pedágios (Simples)",
-                    "lista_pedagios_total_simples": "Lista Pedágios (Simples)",
-                    "km_total": "KM Total",
-                    "tempo_total": "Tempo Total",
-                    "qtd_total_pedagios": "Qtd. Total Pedágios",
-                    "valor_pedagios_total": "Valor Total Pedágios",
-                    "lista_pedagios_total": "Lista Total Pedágios",
-                    "km_diff": "Diferença KM",
-                    "tempo_diff": "Diferença Tempo",
-                    "qtd_pedagio_diff": "Diferença Pedágios",
-                    "tarifas_diff": "Diferença Tarifas",
-                    "racional": "Racional",
-                    "valor_excedente": "Valor Excedente"}
-        )
+        df_fixos = formatar_tabela(pd.DataFrame(st.session_state["fixos"]))
+
+        df_fixos = df_fixos.rename(columns=NOMES_COLUNAS)
 
         st.dataframe(df_fixos)
       else:
@@ -1,16 +1,54 @@
+import hashlib
 import json
 import os
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
 from datetime import datetime
 import requests
 import folium
-import polyline
+import numpy as np
 import streamlit as st
+from cache import gerar_chave, ler_cache, gravar_cache
+from cliente_http import requisitar
+from banco import migrar_enderecos_json, listar_enderecos, endereco_existe, endereco_em_uso, inserir_endereco, remover_endereco_banco, migrar_historico_json, registrar_historico, ler_historico, apagar_historico
+from polilinha import decodificar, decodificar_lote, codificar
+from geografia import simplificar_rota, TOLERANCIA_PIXELS
+from modelos import Trecho, Cenario, ResultadoCotacao
+from roteamento_local import carregar_grafo, ARQUIVO_GRAFO, DISTANCIA_MAXIMA_NO_KM
+from matriz_trechos import consultar_trechos, pares_faltantes, gravar_trechos, remover_endereco
+from rastreamento import rastrear, medir, anotar, propagar
+from consumo import reservar, reservar_rotas, registrar_acerto, rotas_rebaixadas, sku_rotas, OrcamentoEsgotado, SKU_GEOCODING, CAMPO_NIVEL
 
 ARQUIVO_ENDERECOS = "enderecos.json"
 ARQUIVO_HISTORICO = "historico.json"
 ARQUIVO_FIXOS = "fixos.json"
+ARQUIVO_EXEMPLO_ROTAS = os.path.join("fixtures", "exemplo_rotas.json")
+
+# Endereços das APIs do Google; podem ser trocados por variável de ambiente (ex.: um servidor local de testes)
+URL_ROTAS = os.environ.get("VECTURA_URL_ROTAS", "https://routes.googleapis.com/directions/v2:computeRoutes")
+URL_GEOCODE = os.environ.get("VECTURA_URL_GEOCODE", "https://maps.googleapis.com/maps/api/geocode/json")
+
+CAMPOS_ROTAS = (
+    "routes.distanceMeters,"
+    "routes.duration,"
+    "routes.polyline.encodedPolyline,"
+    "routes.legs.distanceMeters,"
+    "routes.legs.duration,"
+    "routes.legs.polyline.encodedPolyline,"
+    "routes.legs.travelAdvisory.tollInfo,"
+    "routes.travelAdvisory.tollInfo"
+)
+PREFERENCIA_ROTA = "TRAFFIC_AWARE_OPTIMAL"
+ROTEAMENTOS = ("automatico", "google", "local") # automatico: API do Google, com o grafo local quando a API falha ou não há chave
+GEOCODE_WORKERS = 4 # Máximo de consultas simultâneas à API de Geocoding na geocodificação em lote
+EIXOS_PEDAGIO = 6 # O valor estimado pela API é multiplicado pela quantidade de eixos do caminhão
+VERSAO_COTACOES = 2 # Muda quando o formato das cotações guardadas muda (2: pedágio de cada trecho já multiplicado pelos eixos)
+MATRIZ_WORKERS = 4 # Máximo de consultas simultâneas à API de Rotas ao preencher a matriz de trechos
+LIMITE_PREENCHIMENTO = 100 # Máximo de trechos calculados em segundo plano a cada endereço cadastrado (os demais são consultados quando forem usados)
+# Tipos de trecho que a cotação consulta na matriz: ida e volta do destino, e a ida e a volta da recarga
+TRECHOS_COTACAO = (("Origem", "Destino"), ("Destino", "Origem"), ("Destino", "Recarga"), ("Recarga", "Destino"))
 
-enderecos_disponiveis = {}
 historico = []
 fixos = []
 
@@ -56,59 +94,67 @@ def limpar_fixos():
 
 # ---- Funções de Histórico ----
 
-def carregar_historico():
-    if not os.path.exists(ARQUIVO_HISTORICO):
-        with open(ARQUIVO_HISTORICO, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=4)
-        return []
+PAGINA_HISTORICO = 50 # Quantidade de consultas lidas do histórico por página
+ZOOM_MAPA = 12 # Zoom com que os mapas de rota abrem
+ZOOM_SIMPLIFICACAO = 15 # Zoom até o qual a rota simplificada fica idêntica à original na tela (alguns níveis acima do inicial)
+CORES_TRECHOS = ["blue", "green", "red", "orange", "purple", "darkblue", "cadetblue", "darkred"] # Uma cor por trecho no mapa da rota completa
+MAPAS_EM_CACHE = 32 # Quantidade de mapas mantidos em memória entre as execuções da página (os mais antigos são descartados)
+
+CAMPOS_HISTORICO = [
+    "data_calculo",
+    "origem",
+    "destino_1",
+    "recarga",
+    "destino_2",
+    "simples_metros",
+    "simples_segundos",
+    "simples_pedagio_centavos",
+    "total_metros",
+    "total_segundos",
+    "total_pedagio_centavos",
+    "diferenca_metros",
+    "diferenca_segundos",
+    "diferenca_pedagio_centavos",
+    "racional",
+    "valor_excedente_centavos",
+]
+
+# Gera o id de uma consulta a partir do seu conteúdo (a mesma consulta sempre gera o mesmo id)
+def gerar_id_consulta(consulta):
+    return hashlib.sha1(json.dumps(consulta, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+def carregar_historico(pagina=0, tamanho=PAGINA_HISTORICO):
+    """
+    Carrega uma página do histórico, da consulta mais recente para a mais antiga.
+    Na primeira execução, importa para o banco as consultas do antigo historico.json.
+    Retorna (historico: list[dict])
+    """
+    migrar_historico_json(ARQUIVO_HISTORICO, gerar_id_consulta)
 
-    return []
+    return ler_historico(pagina, tamanho)
 
 def salva_historico(historico_original, consulta):
-    historico = historico_original
+    """
+    Acrescenta a consulta ao histórico salvo e, se ela for nova, à lista em memória (mais recente primeiro).
+    Salvar a mesma consulta de novo (ex.: a cada recarregamento da tela) não duplica o registro.
+    Retorna (inserida: bool)
+    """
+    inserida = registrar_historico(gerar_id_consulta(consulta), consulta)
 
-    # Adiciona a nova consulta ao final
-    historico.append(consulta)
+    if inserida:
+        historico_original.insert(0, consulta)
 
-    # Se tiver mais que 10, remove a mais antiga (posição 0)
-    if len(historico) > 10:
-        historico.pop(0)
-    
-    with open(ARQUIVO_HISTORICO, "w", encoding="utf-8") as f:
-        json.dump(historico, f, ensure_ascii=False, indent=4)
+        # A lista em memória guarda só a primeira página
+        del historico_original[PAGINA_HISTORICO:]
 
-    historico_original = historico
+    return inserida
 
 def reduzir_para_historico(dados):
-    CAMPOS_HISTORICO = [
-        "origem",
-        "destino_1",
-        "recarga",
-        "destino_2",
-        "km_total_simples",
-        "tempo_total_simples",
-        "qtd_pedagio_total_simples",
-        "valor_pedagio_total_simples",
-        "lista_pedagios_total_simples",
-        "km_total",
-        "tempo_total",
-        "qtd_total_pedagios",
-        "valor_pedagios_total",
-        "lista_pedagios_total",
-        "km_diff",
-        "tempo_diff",
-        "qtd_pedagio_diff",
-        "tarifas_diff",
-        "racional",
-        "valor_excedente",
-    ]
-
-    return {campo: dados[campo] for campo in CAMPOS_HISTORICO if campo in dados}
+    return dados.para_dict()
 
 def limpar_historico():
 
-    with open(ARQUIVO_HISTORICO, "w", encoding="utf-8") as f:
-        json.dump([], f, ensure_ascii=False, indent=4)
+    apagar_historico()
 
     return True, "✅ Histórico limpo com sucesso."
 
@@ -142,14 +188,14 @@ def formata_endereco(endereco):
 
 # Função para carregar dados já salvos
 def carregar_enderecos():
-    if os.path.exists(ARQUIVO_ENDERECOS):
-        with open(ARQUIVO_ENDERECOS, "r", encoding="utf-8") as f:
-            return json.load(f)
-    else:
-        return enderecos_disponiveis.copy()
+    # Na primeira execução, importa para o banco os endereços do antigo enderecos.json
+    migrar_enderecos_json(ARQUIVO_ENDERECOS, normalizar_endereco)
+
+    return listar_enderecos()
 
 # Função para salvar novos dados
-def salvar_enderecos(tipo, nome_salvar, endereco_salvar, enderecos, chave):
+@rastrear()
+def salvar_enderecos(tipo, nome_salvar, endereco_salvar, enderecos, chave, indice=None):
     """
     Valida e salva um novo endereço no dicionário principal.
     Retorna (sucesso: bool, mensagem: str).
@@ -166,7 +212,7 @@ def salvar_enderecos(tipo, nome_salvar, endereco_salvar, enderecos, chave):
     # Verifica duplicidades
     if nome_salvar in enderecos[tipo]:
         return False, f"❌ O nome '{nome_salvar}' já foi usado em {tipo}."
-    if endereco_salvar in enderecos[tipo].values():
+    if endereco_existe(tipo, normalizar_endereco(endereco_salvar)):
         return False, f"❌ Este endereço já foi cadastrado em {tipo}."
     
     if chave == "":
@@ -175,7 +221,13 @@ def salvar_enderecos(tipo, nome_salvar, endereco_salvar, enderecos, chave):
     if chave != st.secrets['chave']:
         return False,  f"❌ Chave incorreta."
 
-    endereco = extrai_coord(endereco_salvar, chave)
+    try:
+        endereco = extrai_coord(endereco_salvar, chave)
+    except OrcamentoEsgotado:
+        return False, "❌ O orçamento de consultas de endereço da API acabou. Tente novamente mais tarde."
+
+    if endereco[0] is None:
+        return False, "❌ Endereço não encontrado."
 
     lat = endereco[1][0]
     long = endereco[1][1]
@@ -189,17 +241,30 @@ def salvar_enderecos(tipo, nome_salvar, endereco_salvar, enderecos, chave):
         "data_cadastro": datetime.now().strftime("%d/%m/%Y %H:%M:%S")
     }
 
+    # Persiste no banco (os índices únicos barram nome ou endereço já cadastrados no tipo)
+    sucesso, repetido = inserir_endereco(tipo, nome_salvar, registro, normalizar_endereco(registro["endereco_formatado"]))
+
+    if not sucesso:
+        if repetido == "nome":
+            return False, f"❌ O nome '{nome_salvar}' já foi usado em {tipo}."
+        return False, f"❌ Este endereço já foi cadastrado em {tipo}."
+
     # Salva o novo endereço
     enderecos[tipo][nome_salvar] = registro
 
-    # Persiste no JSON
-    with open(ARQUIVO_ENDERECOS, "w", encoding="utf-8") as f:
-        json.dump(enderecos, f, ensure_ascii=False, indent=4)
+    # Atualiza o índice espacial somente com o novo ponto
+    if indice is not None:
+        indice.adicionar(tipo, nome_salvar, lat, long)
+
+    # Calcula em segundo plano os trechos entre o novo endereço e os já cadastrados, sem segurar a página. Trechos que falharem
+    # ou passarem do limite ficam de fora; até serem calculados, o vectura consulta essas rotas direto na API.
+    agendar_preenchimento(pares_matriz(enderecos, endereco_formatado[0]), chave)
 
     return True, f"✅ Endereço salvo como {tipo}!"
 
 # Função para excluir dados salvos
-def excluir_enderecos(tipo, nome_excluir, enderecos):
+@rastrear()
+def excluir_enderecos(tipo, nome_excluir, enderecos, indice=None):
     """
     Valida e exclui um endereço existente no dicionário principal.
     Retorna (sucesso: bool, mensagem: str).
@@ -218,11 +283,16 @@ def excluir_enderecos(tipo, nome_excluir, enderecos):
         return False, f"❌ O nome '{nome_excluir}' não existe na base de {tipo}."
 
     # Exclui o endereço
+    endereco_excluido = enderecos[tipo][nome_excluir]["endereco_formatado"]
     del enderecos[tipo][nome_excluir]
+    remover_endereco_banco(tipo, nome_excluir)
+
+    if indice is not None:
+        indice.remover(tipo, nome_excluir)
 
-    # Atualiza o arquivo JSON
-    with open(ARQUIVO_ENDERECOS, "w", encoding="utf-8") as f:
-        json.dump(enderecos, f, ensure_ascii=False, indent=4)
+    # Remove os trechos da matriz, a não ser que o mesmo endereço continue cadastrado em outro tipo
+    if not endereco_em_uso(endereco_excluido, normalizar_endereco(endereco_excluido)):
+        remover_endereco(endereco_excluido)
 
     return True, f"✅ Endereço excluído da base de {tipo}!"
 
@@ -240,12 +310,30 @@ def excluir_enderecos(tipo, nome_excluir, enderecos):
     
 #     return lista_pedagios
 
+# Normaliza o texto do endereço para comparação e uso como chave (sem acentos, minúsculo e sem espaços repetidos)
+def normalizar_endereco(endereco):
+    sem_acentos = unicodedata.normalize("NFKD", endereco).encode("ascii", "ignore").decode("ascii")
+
+    return " ".join(sem_acentos.lower().replace(",", " ").split()).strip(" .")
+
 # Função para extrair as coordenadas de um endereço
-def extrai_coord(endereco, chave):
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
+@rastrear()
+def extrai_coord(endereco, chave, usar_cache=True):
+    chave_cache = normalizar_endereco(endereco)
+
+    if usar_cache:
+        resultado_cache = ler_cache("geocode", chave_cache)
+
+        if resultado_cache is not None:
+            registrar_acerto(SKU_GEOCODING)
+            endereco_formatado, (lat, lng) = resultado_cache
+            return endereco_formatado, (lat, lng)
+
+    reservar(SKU_GEOCODING)
+
     params = {"address": endereco, "key": chave}
 
-    r = requests.get(url, params=params).json()
+    r = requisitar("GET", URL_GEOCODE, params=params).json()
 
     if r["status"] == "OK":
         result = r["results"][0]
@@ -253,22 +341,71 @@ def extrai_coord(endereco, chave):
         lng = result["geometry"]["location"]["lng"]
         endereco_formatado = result["formatted_address"]
 
+        if usar_cache:
+            gravar_cache("geocode", chave_cache, [endereco_formatado, [lat, lng]])
+
         return endereco_formatado, (lat, lng)
     
     return None, None, None
 
+# Função para extrair as coordenadas de vários endereços de uma vez
+def geocodificar_em_lote(enderecos, chave, max_workers=GEOCODE_WORKERS):
+    """
+    Geocodifica uma lista de endereços: remove repetidos, responde o que já está no cache e consulta o restante em paralelo.
+    Uma falha na consulta ou uma resposta fora do formato esperado fica registrada só para aquele endereço.
+    Retorna (resultados: dict -> endereço: (endereco_formatado, (lat, lng)) ou None quando não encontrado ou com erro,
+             erros: dict -> endereço: nome do erro, só para os endereços cuja consulta falhou)
+    """
+    # Agrupa os endereços pelo texto normalizado, para que cada endereço distinto seja consultado uma única vez
+    grupos = {}
+    for endereco in enderecos:
+        grupos.setdefault(normalizar_endereco(endereco), []).append(endereco)
+
+    resultados_normalizados = {}
+    erros_normalizados = {}
+    faltantes = []
+
+    for chave_cache, originais in grupos.items():
+        resultado_cache = ler_cache("geocode", chave_cache)
+
+        if resultado_cache is not None:
+            registrar_acerto(SKU_GEOCODING)
+            endereco_formatado, (lat, lng) = resultado_cache
+            resultados_normalizados[chave_cache] = (endereco_formatado, (lat, lng))
+        else:
+            faltantes.append((chave_cache, originais[0]))
+
+    if faltantes:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {chave_cache: executor.submit(propagar(extrai_coord), original, chave) for chave_cache, original in faltantes}
+
+            for chave_cache, futuro in futuros.items():
+                try:
+                    resultado = futuro.result()
+                except (requests.RequestException, KeyError, IndexError, ValueError) as erro:
+                    erros_normalizados[chave_cache] = erro.__class__.__name__
+                    resultado = (None, None, None)
+
+                # Mesmo critério de salvar_enderecos: sem endereço formatado, o endereço não foi encontrado
+                resultados_normalizados[chave_cache] = resultado if resultado[0] is not None else None
+
+    resultados = {endereco: resultados_normalizados[chave_cache] for chave_cache, originais in grupos.items() for endereco in originais}
+    erros = {endereco: erros_normalizados[chave_cache] for chave_cache, originais in grupos.items() for endereco in originais if chave_cache in erros_normalizados}
+
+    return resultados, erros
+
 # ---- Fim da Função de Endereços ----
 
 
 # ---- Funções de Cálculos (Distâncias, Pedágios, etc) ----
 
 # Cálculo do valor do frete
-def calculo_frete(diff_pedagio, diff_km, racional):
+def calculo_frete(diff_pedagio_centavos, diff_metros, racional):
     """
     Faz o cálculo do valor a ser cobrado a partir da multiplicação da diferença de km rodado pelo racional e acrescido da diferença do pedágio
-    Retorna (frete: str)
+    Retorna (frete: int em centavos)
     """
-    return f"R$ {(diff_km * racional) + diff_pedagio:.2f}" 
+    return round(diff_metros / 1000 * racional * 100) + diff_pedagio_centavos
 
 # # Função de contagem de pedágios no trajeto
 # def conta_pedagios(infos_rotas):
@@ -293,20 +430,12 @@ def calculo_frete(diff_pedagio, diff_km, racional):
 
 #     return valor_total
 
-def google_routes_api(origin, destination, waypoints=None, api_key=None):
-    url = "https://routes.googleapis.com/directions/v2:computeRoutes"
-
+# Monta os cabeçalhos, o corpo e a chave de cache de uma chamada computeRoutes (compartilhado com o serviço assíncrono)
+def montar_requisicao_rotas(origin, destination, waypoints=None, api_key=None):
     headers = {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": api_key,
-        "X-Goog-FieldMask": (
-            "routes.distanceMeters,"
-            "routes.duration,"
-            "routes.polyline.encodedPolyline,"
-            "routes.legs.distanceMeters,"
-            "routes.legs.duration,"
-            "routes.travelAdvisory.tollInfo"
-        )
+        "X-Goog-FieldMask": CAMPOS_ROTAS
     }
 
     body = {
@@ -314,24 +443,322 @@ def google_routes_api(origin, destination, waypoints=None, api_key=None):
         "destination": {"address": destination},
         "travelMode": "DRIVE",
         "extraComputations": ["TOLLS"],
-        "routingPreference": "TRAFFIC_AWARE_OPTIMAL",
+        "routingPreference": PREFERENCIA_ROTA,
         "polylineQuality": "OVERVIEW"
     }
 
     if waypoints:
         body["intermediates"] = [{"address": w} for w in waypoints]
 
-    response = requests.post(url, headers=headers, json=body).json()
+    # A chave considera origem, destino, paradas (na ordem), preferência de rota e os campos pedidos
+    return headers, body, gerar_chave(body, CAMPOS_ROTAS)
+
+@rastrear()
+def google_routes_api(origin, destination, waypoints=None, api_key=None, usar_cache=True, timeout=None, limitador=None, rebaixar=True, espera_orcamento=None):
+    headers, body, chave_cache = montar_requisicao_rotas(origin, destination, waypoints, api_key)
+
+    if usar_cache:
+        resposta_cache = ler_cache("rotas", chave_cache)
+
+        if resposta_cache is not None:
+            anotar(cache=True)
+            registrar_acerto(sku_rotas(body))
+            return resposta_cache
+
+    anotar(cache=False)
+
+    # Limita a taxa apenas das chamadas que realmente vão para a API
+    if limitador is not None:
+        with medir("limitador.aguardar"):
+            limitador.aguardar()
+
+    # Sem orçamento para o SKU pedido, a chamada espera na fila ou é rebaixada para um nível mais barato (sem pedágios)
+    headers, body, nivel = reservar_rotas(headers, body, rebaixar, espera_orcamento)
+
+    resposta = requisitar("POST", URL_ROTAS, headers=headers, json=body, timeout=timeout)
+
+    with medir("rotas.json", bytes=len(resposta.content)):
+        response = resposta.json()
+
+    # Uma resposta rebaixada é marcada e não vai para o cache, para não ocupar o lugar da completa
+    if nivel != "completo":
+        response[CAMPO_NIVEL] = nivel
+
+    # Só guarda respostas válidas, para que erros da API não fiquem presos no cache
+    elif usar_cache and response.get("routes"):
+        gravar_cache("rotas", chave_cache, response)
 
     return response
 
-def gerar_mapa(encoded_polyline):
-    coords = polyline.decode(encoded_polyline)
+# ---- Roteamento Local ----
+
+# Coordenadas de um endereço sem consultar a API: primeiro os endereços cadastrados, depois o cache de geocodificação
+def coordenadas_endereco(endereco):
+    for locais in listar_enderecos().values():
+        for dados in locais.values():
+            if dados["endereco_formatado"] == endereco:
+                return dados["latitude"], dados["longitude"]
+
+    resultado_cache = ler_cache("geocode", normalizar_endereco(endereco))
+
+    if resultado_cache is not None:
+        return tuple(resultado_cache[1])
+
+    return None
+
+@rastrear()
+def rotas_locais(origin, destination, waypoints=None, api_key=None, criterio="tempo", **kwargs):
+    """
+    Calcula a rota no grafo rodoviário local, sem rede, com a mesma interface e o mesmo formato de resposta de google_routes_api
+    (os parâmetros da API, como a chave, são ignorados). O grafo não tem tarifas, então a rota vem sem pedágio.
+    Retorna (resposta: dict com "routes", ou com "error" quando não for possível calcular)
+    """
+    grafo = carregar_grafo()
+
+    if grafo is None:
+        return {"error": {"message": f"grafo rodoviário local não encontrado ({ARQUIVO_GRAFO})"}}
+
+    nos = []
+    for endereco in [origin, *(waypoints or []), destination]:
+        coordenadas = coordenadas_endereco(endereco)
+
+        if coordenadas is None:
+            return {"error": {"message": f"coordenadas desconhecidas para '{endereco}'"}}
+
+        no, distancia_km = grafo.no_mais_proximo(*coordenadas)
+
+        if distancia_km > DISTANCIA_MAXIMA_NO_KM:
+            return {"error": {"message": f"'{endereco}' está fora da malha do grafo local"}}
+
+        nos.append(no)
+
+    legs = []
+    for partida, chegada in zip(nos[:-1], nos[1:]):
+        arestas = grafo.caminho_minimo(partida, chegada, criterio)
+
+        if arestas is None:
+            return {"error": {"message": "não existe caminho no grafo local entre as paradas"}}
+
+        caminho = grafo.nos_do_caminho(partida, arestas)
+        legs.append({"distanceMeters": int(grafo.metros[arestas].sum()),
+                     "duration": f"{int(grafo.segundos[arestas].sum())}s",
+                     "polyline": {"encodedPolyline": codificar(np.column_stack((grafo.latitude[caminho], grafo.longitude[caminho])))}})
+
+    rota = {"distanceMeters": sum(leg["distanceMeters"] for leg in legs),
+            "duration": f"{sum(int(leg['duration'][:-1]) for leg in legs)}s",
+            "legs": legs,
+            "polyline": {"encodedPolyline": juntar_polilinhas([leg["polyline"]["encodedPolyline"] for leg in legs])}}
+
+    return {"routes": [rota]}
+
+# ---- Fim do Roteamento Local ----
+
+# Extrai o valor estimado de pedágio de uma rota ou de um trecho (leg) da resposta da API, em centavos e sem multiplicar pelos eixos
+# (0 quando não há pedágio)
+def pedagio_centavos(rota):
+    precos = rota.get("travelAdvisory", {}).get("tollInfo", {}).get("estimatedPrice", [])
+
+    if not precos:
+        return 0
+
+    return int(precos[0].get("units", 0)) * 100 + int(precos[0].get("nanos", 0)) // 10_000_000
+
+# Monta o campo travelAdvisory no formato da API a partir de um valor em centavos
+def aviso_pedagio(centavos):
+    return {"tollInfo": {"estimatedPrice": [{"currencyCode": "BRL",
+                                             "units": str(centavos // 100),
+                                             "nanos": (centavos % 100) * 10_000_000}]}}
+
+# ---- Funções da Matriz de Trechos ----
+
+def calcular_trecho(partida, chegada, chave):
+    """
+    Consulta a API de Rotas para um único trecho (sem paradas).
+    Retorna (trecho: dict com distancia_metros, duracao_segundos, pedagio_centavos e polilinha, ou None se não houver rota)
+    """
+    # A matriz guarda os trechos por muito tempo: sem orçamento, o trecho fica para depois em vez de entrar sem pedágios
+    resposta = google_routes_api(origin=partida, destination=chegada, api_key=chave, rebaixar=False)
+
+    if not resposta.get("routes"):
+        return None
+
+    rota = resposta["routes"][0]
+
+    return {"distancia_metros": rota["legs"][0]["distanceMeters"],
+            "duracao_segundos": int(rota["legs"][0]["duration"].replace("s", "")),
+            "pedagio_centavos": pedagio_centavos(rota),
+            "polilinha": rota["polyline"]["encodedPolyline"]}
+
+def pares_matriz(enderecos, endereco=None):
+    """
+    Lista os pares (partida, chegada) que a cotação pode consultar na matriz (TRECHOS_COTACAO), sem repetição.
+    Com 'endereco', só os pares que saem ou chegam nele.
+    Retorna (pares: list[tuple])
+    """
+    formatados = {tipo: [dados["endereco_formatado"] for dados in locais.values()] for tipo, locais in enderecos.items()}
+    pares = {}
+
+    for tipo_partida, tipo_chegada in TRECHOS_COTACAO:
+        partidas = formatados.get(tipo_partida, [])
+        chegadas = formatados.get(tipo_chegada, [])
+
+        if endereco is None:
+            candidatos = ((partida, chegada) for partida in partidas for chegada in chegadas)
+        else:
+            candidatos = [(endereco, chegada) for chegada in chegadas] if endereco in partidas else []
+            candidatos += [(partida, endereco) for partida in partidas] if endereco in chegadas else []
+
+        pares.update((par, None) for par in candidatos if par[0] != par[1])
+
+    return list(pares)
+
+def calcular_trechos(pares, chave, max_workers=MATRIZ_WORKERS):
+    """
+    Consulta na API (em paralelo) e grava na matriz os trechos informados. Um trecho que falha não descarta os demais.
+    Retorna (trechos: dict -> (partida, chegada): dict, erro: Exception ou None -> a primeira falha)
+    """
+    trechos = {}
+    erro = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futuros = {par: executor.submit(propagar(calcular_trecho), par[0], par[1], chave) for par in pares}
+
+        for par, futuro in futuros.items():
+            try:
+                trecho = futuro.result()
+            except (requests.RequestException, KeyError, IndexError, ValueError) as falha:
+                erro = erro or falha
+                continue
+
+            if trecho is not None:
+                trechos[par] = trecho
+
+    gravar_trechos(trechos)
+
+    return trechos, erro
+
+@rastrear()
+def preencher_matriz(pares, chave, limite=LIMITE_PREENCHIMENTO, max_workers=MATRIZ_WORKERS):
+    """
+    Calcula e grava na matriz até 'limite' dos pares informados que ainda não estão nela.
+    Retorna (quantidade de trechos gravados: int)
+    """
+    faltantes = pares_faltantes(pares, limite)
+
+    if not faltantes:
+        return 0
+
+    trechos, _ = calcular_trechos(faltantes, chave, max_workers)
+
+    return len(trechos)
+
+_fila_matriz = ThreadPoolExecutor(max_workers=1) # Preenchimentos da matriz em segundo plano, um de cada vez
+
+def agendar_preenchimento(pares, chave):
+    """
+    Preenche a matriz com os pares informados em segundo plano, depois dos preenchimentos já agendados.
+    Retorna (futuro: concurrent.futures.Future com a quantidade de trechos gravados)
+    """
+    return _fila_matriz.submit(propagar(preencher_matriz), pares, chave)
+
+def obter_trechos(pares, chave, max_workers=MATRIZ_WORKERS):
+    """
+    Busca os trechos na matriz e consulta na API (em paralelo, uma vez cada) somente os que faltam, gravando-os na matriz.
+    Se algum trecho falhar, os que deram certo ficam gravados e a primeira falha é lançada depois.
+    A matriz guarda o pedágio como a API estima (por eixo); os trechos retornados já vêm multiplicados pelos eixos.
+    Retorna (trechos: dict -> (partida, chegada): dict). Pares sem rota possível não aparecem.
+    """
+    trechos = consultar_trechos(pares)
+    faltantes = [par for par in set(pares) if par not in trechos]
+
+    if faltantes:
+        novos, erro = calcular_trechos(faltantes, chave, max_workers)
+        trechos.update(novos)
+
+        if erro is not None:
+            raise erro
+
+    return {par: {**trecho, "pedagio_centavos": trecho["pedagio_centavos"] * EIXOS_PEDAGIO} for par, trecho in trechos.items()}
+
+# Junta as polilinhas de trechos consecutivos em uma só, sem repetir o ponto de ligação entre eles
+def juntar_polilinhas(polilinhas):
+    trechos = [pontos for pontos in decodificar_lote(polilinhas) if len(pontos)]
+
+    if not trechos:
+        return ""
+
+    return codificar(np.concatenate([trechos[0]] + [pontos[1:] for pontos in trechos[1:]]))
+
+@rastrear()
+def montar_resposta_matriz(paradas):
+    """
+    Monta, somente com trechos da matriz, uma resposta no mesmo formato da API de Rotas para a sequência de paradas informada.
+    Os pedágios ficam por eixo, como a API devolve: os eixos entram uma única vez, em montar_cenario.
+    Retorna (resposta: dict ou None se algum trecho não estiver na matriz)
+    """
+    pares = list(zip(paradas[:-1], paradas[1:]))
+    trechos = consultar_trechos(pares)
+
+    if len(trechos) < len(set(pares)):
+        return None
+
+    legs = [{"distanceMeters": trechos[par]["distancia_metros"],
+             "duration": f"{trechos[par]['duracao_segundos']}s",
+             "polyline": {"encodedPolyline": trechos[par]["polilinha"]},
+             "travelAdvisory": aviso_pedagio(trechos[par]["pedagio_centavos"])} for par in pares]
+    total_pedagio = sum(trechos[par]["pedagio_centavos"] for par in pares)
+
+    rota = {"distanceMeters": sum(leg["distanceMeters"] for leg in legs),
+            "duration": f"{sum(int(leg['duration'][:-1]) for leg in legs)}s",
+            "legs": legs,
+            "polyline": {"encodedPolyline": juntar_polilinhas([trechos[par]["polilinha"] for par in pares])},
+            "travelAdvisory": aviso_pedagio(total_pedagio)}
+
+    return {"routes": [rota]}
+
+# ---- Fim das Funções da Matriz de Trechos ----
+
+# Pontos da rota que vão para o mapa: a polilinha decodificada e simplificada para o zoom em que a rota é vista
+@st.cache_data(max_entries=MAPAS_EM_CACHE, show_spinner=False)
+@rastrear()
+def pontos_mapa(encoded_polyline, zoom=ZOOM_SIMPLIFICACAO, tolerancia_pixels=TOLERANCIA_PIXELS):
+    """
+    Retorna (pontos: np.ndarray (n, 2) de latitude e longitude, total_original: int)
+    """
+    coords = decodificar(encoded_polyline)
+
+    return simplificar_rota(coords, zoom, tolerancia_pixels), len(coords)
+
+# O mapa depende só da polilinha: nas execuções seguintes da página (qualquer clique em um widget) ele é reaproveitado
+@st.cache_resource(max_entries=MAPAS_EM_CACHE, show_spinner=False)
+@rastrear()
+def gerar_mapa(encoded_polyline, zoom=ZOOM_SIMPLIFICACAO, tolerancia_pixels=TOLERANCIA_PIXELS):
+    coords, _ = pontos_mapa(encoded_polyline, zoom, tolerancia_pixels)
 
     lat0, lng0 = coords[0]
-    mapa = folium.Map(location=[lat0, lng0], zoom_start=12)
+    mapa = folium.Map(location=[lat0, lng0], zoom_start=ZOOM_MAPA)
+
+    folium.PolyLine(coords.tolist(), color="blue", weight=5).add_to(mapa)
+
+    return mapa
+
+# Mapa da rota com cada trecho em uma cor, montado a partir das polilinhas de cada trecho
+@st.cache_resource(max_entries=MAPAS_EM_CACHE, show_spinner=False)
+@rastrear()
+def gerar_mapa_trechos(polilinhas, rotulos=None, zoom=ZOOM_SIMPLIFICACAO, tolerancia_pixels=TOLERANCIA_PIXELS):
+    mapa = None
+
+    for numero, polilinha in enumerate(polilinhas):
+        coords, _ = pontos_mapa(polilinha, zoom, tolerancia_pixels)
 
-    folium.PolyLine(coords, color="blue", weight=5).add_to(mapa)
+        if len(coords) == 0:
+            continue
+
+        if mapa is None:
+            mapa = folium.Map(location=coords[0].tolist(), zoom_start=ZOOM_MAPA)
+
+        rotulo = rotulos[numero] if rotulos else f"Trecho {numero + 1}"
+        folium.PolyLine(coords.tolist(), color=CORES_TRECHOS[numero % len(CORES_TRECHOS)], weight=5, tooltip=rotulo).add_to(mapa)
 
     return mapa
 
@@ -345,6 +772,22 @@ def dist_tempo(infos_rotas):
 
     return resposta
 
+# Monta o cenário (trechos, pedágio total e polilinha) a partir da resposta da API de Rotas
+def montar_cenario(infos_rotas, com_pedagio=True):
+    rota = infos_rotas["routes"][0]
+
+    # A API omite campos zerados, então um trecho sem deslocamento pode vir sem distância ou duração
+    # Cada trecho traz a própria geometria e o próprio pedágio, vindos da mesma resposta (sem consultas extras)
+    trechos = tuple(Trecho(distancia_metros=leg.get("distanceMeters", 0),
+                           duracao_segundos=int(leg.get("duration", "0s").replace("s", "")),
+                           pedagio_centavos=pedagio_centavos(leg) * EIXOS_PEDAGIO if com_pedagio else 0,
+                           polilinha=leg.get("polyline", {}).get("encodedPolyline", ""))
+                    for leg in dist_tempo(infos_rotas))
+
+    return Cenario(trechos=trechos,
+                   pedagio_centavos=pedagio_centavos(rota) * EIXOS_PEDAGIO if com_pedagio else 0,
+                   polilinha=rota["polyline"]["encodedPolyline"])
+
 def converter_tempo(tempo):
     horas = tempo // 3600
     minutos = (tempo % 3600) // 60
@@ -352,274 +795,226 @@ def converter_tempo(tempo):
 
     return horas, minutos, segundos
 
-# Faz os cálculos e retorna um dicionário com as informações necessárias para serem apresentadas
-def vectura(origem: str, destino: str, recarga: str, destino_2: str, chave_api: str, racional: int):
+# Monta as duas rotas consultadas em um cálculo, no formato (partida, chegada, paradas intermediárias)
+def rotas_vectura(origem, destino, recarga, destino_2):
+    rota_simples = (origem, origem, (destino,))
+    rota_carregada = (origem, origem, (destino, recarga, destino_2))
 
-    if origem == None or destino == None or recarga == None or destino_2 == None or chave_api == "" or racional <= 0:
-        mensagem = "❌ Não foi possível realizar os cálculos. Confirme se os parâmetros estão todos preenchidos corretamente."
+    return rota_simples, rota_carregada
 
-        return False, mensagem, None
+# ---- Memória de Cotações ----
 
-# # ---- REQUEST API QUALP ----
+# Identifica a versão dos dados de rota: muda quando mudam os campos pedidos, a preferência de rota, os eixos ou o grafo local
+def impressao_rotas(roteamento):
+    if roteamento == "local":
+        versao_grafo = os.path.getmtime(ARQUIVO_GRAFO) if os.path.exists(ARQUIVO_GRAFO) else None
 
-#     # Request na API do QualP para os dois trechos e retorna os dados no json
-#     dados_trecho_1_qualp = api_qualp(origem=origem, destino=destino, eixos=eixos_carregado, key=confidential.qualp_key)
-#     dados_trecho_2_qualp = api_qualp(origem=destino, destino=recarga, eixos=eixos_descarregado, key=confidential.qualp_key)
-#     dados_trecho_3_qualp = api_qualp(origem=recarga, destino=destino_2, eixos=eixos_carregado, key=confidential.qualp_key)
-#     dados_trecho_4_qualp = api_qualp(origem=destino_2, destino=origem, eixos=eixos_descarregado, key=confidential.qualp_key)
-
-#     dados_trecho_volta_simples_qualp = api_qualp(origem=destino, destino=origem, eixos=eixos_descarregado, key=confidential.qualp_key)
-
-# # ---- REQUEST API QUALP ----
-
-# ---- REQUEST API GOOGLE ----
+        return gerar_chave("local", versao_grafo)
 
-    dados_ida_volta_simples = google_routes_api(origin=origem, destination=origem, waypoints=[destino], api_key=chave_api)
-    dados_retorno_carregado = google_routes_api(origin=origem, destination=origem, waypoints=[destino, recarga, destino_2], api_key=chave_api)
+    return gerar_chave("google", CAMPOS_ROTAS, PREFERENCIA_ROTA, EIXOS_PEDAGIO)
 
-# ---- REQUEST API GOOGLE ----
-
-    dados_caso_1 = dist_tempo(dados_ida_volta_simples)
-    dados_caso_2 = dist_tempo(dados_retorno_carregado)
-
-# ---- DISTÂNCIAS ----
-
-    # Pega a distância (tanto texto quanto valor) do JSON de resultado para todos os trechos
-    dist_trecho_1 = round((dados_caso_2[0]["distanceMeters"]) / 1000, 1)
-    dist_trecho_2 = round((dados_caso_2[1]["distanceMeters"]) / 1000, 1)
-    dist_trecho_3 = round((dados_caso_2[2]["distanceMeters"]) / 1000, 1)
-    dist_trecho_4 = round((dados_caso_2[3]["distanceMeters"]) / 1000, 1)
-
-    # Pega a distância (tanto texto quanto valor) do JSON considerando a volta do trecho_1
-    dist_ida = round((dados_caso_1[0]["distanceMeters"]) / 1000, 1)
-    dist_volta = round((dados_caso_1[1]["distanceMeters"]) / 1000, 1)
-
-    # Faz o cálculo da distância do trecho total para os 2 casos (ida e volta direta ou ida, descarga, recarga, descarga e volta)
-    dist_caso_1 = dist_ida + dist_volta
-    dist_caso_2 = dist_trecho_1 + dist_trecho_2 + dist_trecho_3 + dist_trecho_4
+def chave_cotacao(origem, destino, recarga, destino_2, roteamento):
+    # O racional fica de fora: ele só entra no valor excedente, que é recalculado na leitura
+    return gerar_chave(origem, destino, recarga, destino_2, impressao_rotas(roteamento), VERSAO_COTACOES)
 
-    # Faz o cálculo da diferença de km que serão rodados nos dois casos.
-    dist_diff = abs(dist_caso_1 - dist_caso_2)
-
-# ---- DISTÂNCIAS ----
-
-# ---- TEMPO DE VIAGEM ----
+def ler_cotacao(origem, destino, recarga, destino_2, roteamento):
+    """
+    Busca uma cotação já calculada para os quatro endereços com os mesmos dados de rota.
+    Retorna (mensagem: str, dados: ResultadoCotacao com a data de agora) ou None
+    """
+    registro = ler_cache("cotacoes", chave_cotacao(origem, destino, recarga, destino_2, roteamento))
 
-    # Pega o tempo de viagem do JSON de resultado para todos os trechos
-    tempo_trecho_1_segundo = int(dados_caso_2[0]["duration"].replace("s", ""))
-    horas_trecho_1, minutos_trecho_1, segundos_trecho_1 = converter_tempo(tempo_trecho_1_segundo)
-    tempos_total_trecho_1 = f"{horas_trecho_1:02}:{minutos_trecho_1:02}:{segundos_trecho_1:02}"
+    if registro is None:
+        return None
 
-    tempo_trecho_2_segundo = int(dados_caso_2[1]["duration"].replace("s", ""))
-    horas_trecho_2, minutos_trecho_2, segundos_trecho_2 = converter_tempo(tempo_trecho_2_segundo)
-    tempos_total_trecho_2 = f"{horas_trecho_2:02}:{minutos_trecho_2:02}:{segundos_trecho_2:02}"
+    dados = ResultadoCotacao(data_calculo=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                             simples=Cenario.de_dict(registro["simples"]),
+                             completo=Cenario.de_dict(registro["completo"]),
+                             racional=registro["racional"],
+                             valor_excedente_centavos=registro["valor_excedente_centavos"],
+                             origem=origem,
+                             destino_1=destino,
+                             recarga=recarga,
+                             destino_2=destino_2)
 
-    tempo_trecho_3_segundo = int(dados_caso_2[2]["duration"].replace("s", ""))
-    horas_trecho_3, minutos_trecho_3, segundos_trecho_3 = converter_tempo(tempo_trecho_3_segundo)
-    tempos_total_trecho_3 = f"{horas_trecho_3:02}:{minutos_trecho_3:02}:{segundos_trecho_3:02}"
+    return registro["mensagem"], dados
 
-    tempo_trecho_4_segundo = int(dados_caso_2[3]["duration"].replace("s", ""))
-    horas_trecho_4, minutos_trecho_4, segundos_trecho_4 = converter_tempo(tempo_trecho_4_segundo)
-    tempos_total_trecho_4 = f"{horas_trecho_4:02}:{minutos_trecho_4:02}:{segundos_trecho_4:02}"
+def gravar_cotacao(roteamento, mensagem, dados):
+    registro = {"mensagem": mensagem,
+                "simples": asdict(dados.simples),
+                "completo": asdict(dados.completo),
+                "racional": dados.racional,
+                "valor_excedente_centavos": dados.valor_excedente_centavos}
 
-    # Pega o tempo de viagem do JSON considerando a volta do trecho_1
-    tempo_ida_segundo = int(dados_caso_1[0]["duration"].replace("s", ""))
-    horas_ida, minutos_ida, segundos_ida = converter_tempo(tempo_ida_segundo)
-    tempo_total_ida = f"{horas_ida:02}:{minutos_ida:02}:{segundos_ida:02}"
+    gravar_cache("cotacoes", chave_cotacao(dados.origem, dados.destino_1, dados.recarga, dados.destino_2, roteamento), registro)
 
-    tempo_volta_segundo = int(dados_caso_1[1]["duration"].replace("s", ""))
-    horas_volta, minutos_volta, segundos_volta = converter_tempo(tempo_volta_segundo)
-    tempo_total_volta = f"{horas_volta:02}:{minutos_volta:02}:{segundos_volta:02}"
+# Recalcula só o valor excedente de uma cotação para outro racional (distâncias, tempos e pedágios não mudam)
+def reprecificar(dados, racional):
+    return replace(dados, racional=racional, valor_excedente_centavos=calculo_frete(diff_pedagio_centavos=dados.diferenca_pedagio_centavos,
+                                                                                 diff_metros=dados.diferenca_metros,
+                                                                                 racional=racional))
 
-    # Faz o cálculo do tempo total de viagem do trecho total para os 2 casos (ida e volta direta ou ida, descarga, recarga, descarga e volta)
-    tempo_1 = tempo_ida_segundo + tempo_volta_segundo
-    horas_1, minutos_1, segundos_1 = converter_tempo(tempo_1)
-    tempos_total_1 = f"{horas_1:02}:{minutos_1:02}:{segundos_1:02}"
+# ---- Fim da Memória de Cotações ----
 
-    tempo_2 = tempo_trecho_1_segundo + tempo_trecho_2_segundo + tempo_trecho_3_segundo + tempo_trecho_4_segundo
-    horas_2, minutos_2, segundos_2 = converter_tempo(tempo_2)
-    tempos_total_2 = f"{horas_2:02}:{minutos_2:02}:{segundos_2:02}"
+# Faz os cálculos e retorna o resultado (ResultadoCotacao) com as informações necessárias para serem apresentadas
+@rastrear()
+def vectura(origem: str, destino: str, recarga: str, destino_2: str, chave_api: str, racional: int, usar_matriz: bool = True, roteamento: str = "automatico"):
 
-    # Faz o cálculo da diferença do tempo total de viagem que serão rodados nos dois casos.
-    tempo_diff = abs(tempo_1 - tempo_2)
-    horas_diff, minutos_diff, segundos_diff = converter_tempo(tempo_diff)
-    tempos_total_diff = f"{horas_diff:02}:{minutos_diff:02}:{segundos_diff:02}"
+    # Sem chave, só é possível calcular pelo grafo local
+    sem_chave = chave_api == "" and (roteamento == "google" or (roteamento == "automatico" and carregar_grafo() is None))
 
-# ---- TEMPO DE VIAGEM ----
+    if origem == None or destino == None or recarga == None or destino_2 == None or sem_chave or racional <= 0 or roteamento not in ROTEAMENTOS:
+        mensagem = "❌ Não foi possível realizar os cálculos. Confirme se os parâmetros estão todos preenchidos corretamente."
 
-# # ---- QUANTIDADE PEDÁGIOS ----
+        return False, mensagem, None
 
-#     # Pega a quantidade de pedágios do JSON de resultado para todos os trechos
-#     pedagios_trecho_1 = conta_pedagios(dados_trecho_1_qualp)
-#     pedagios_trecho_2 = conta_pedagios(dados_trecho_2_qualp)
-#     pedagios_trecho_3 = conta_pedagios(dados_trecho_3_qualp)
-#     pedagios_trecho_4 = conta_pedagios(dados_trecho_4_qualp)
+    # Uma cotação já feita para os mesmos endereços e os mesmos dados de rota só tem o valor excedente recalculado
+    memo = ler_cotacao(origem, destino, recarga, destino_2, "local" if roteamento == "local" else "google")
 
-#     # Pega a quantidade de pedágios do JSON considerando a volta do trecho_1
-#     pedagios_trecho_volta_simples = conta_pedagios(dados_trecho_volta_simples_qualp)
+    if memo is not None:
+        anotar(memo=True)
+        return True, memo[0], memo[1] if memo[1].racional == racional else reprecificar(memo[1], racional)
 
-#     # Faz o cálculo da quantidade total de pedágios do trecho total para os 2 casos (ida e volta direta ou ida, descarga, recarga, descarga e volta)
-#     pedagios_total_1 = pedagios_trecho_1 + pedagios_trecho_volta_simples
-#     pedagios_total_2 = pedagios_trecho_1 + pedagios_trecho_2 + pedagios_trecho_3 + pedagios_trecho_4
+    status, mensagem, dados, roteamento_usado = _calcular_cotacao(origem, destino, recarga, destino_2, chave_api, racional, usar_matriz, roteamento)
+    anotar(memo=False, roteamento=roteamento_usado)
 
-#     # Faz o cálculo da diferença da quantidade de pedágios presentes nos dois casos.
-#     pedagios_diff = abs(pedagios_total_1 - pedagios_total_2)
+    # Uma cotação rebaixada pelo orçamento da API não é guardada, para que a próxima consulta tente a completa
+    if status and roteamento_usado != "rebaixado":
+        gravar_cotacao(roteamento_usado, mensagem, dados)
 
-# # ---- QUANTIDADE PEDÁGIOS ----
+    return status, mensagem, dados
 
-# ---- SOMA TARIFAS PEDÁGIOS ----
+# Calcula uma cotação consultando a matriz de trechos, a API do Google ou o grafo local, conforme o roteamento escolhido
+def _calcular_cotacao(origem, destino, recarga, destino_2, chave_api, racional, usar_matriz, roteamento):
 
-    # # Pega os valores dos pedágios do JSON de resultado para todos os trechos e soma
-    # tarifas_trecho_1 = soma_tarifas(dados_trecho_1_qualp)
-    # tarifas_trecho_2 = soma_tarifas(dados_trecho_2_qualp)
-    # tarifas_trecho_3 = soma_tarifas(dados_trecho_3_qualp)
-    # tarifas_trecho_4 = soma_tarifas(dados_trecho_4_qualp)
+# # ---- REQUEST API QUALP ----
 
-    # # Pega os valores dos pedágios do JSON considerando a volta do trecho_1
-    # tarifas_trecho_volta_simples = soma_tarifas(dados_trecho_volta_simples_qualp)
+#     # Request na API do QualP para os dois trechos e retorna os dados no json
+#     dados_trecho_1_qualp = api_qualp(origem=origem, destino=destino, eixos=eixos_carregado, key=confidential.qualp_key)
+#     dados_trecho_2_qualp = api_qualp(origem=destino, destino=recarga, eixos=eixos_descarregado, key=confidential.qualp_key)
+#     dados_trecho_3_qualp = api_qualp(origem=recarga, destino=destino_2, eixos=eixos_carregado, key=confidential.qualp_key)
+#     dados_trecho_4_qualp = api_qualp(origem=destino_2, destino=origem, eixos=eixos_descarregado, key=confidential.qualp_key)
 
-    # Faz o cálculo do valor total em pedágios do trecho total para os 2 casos (ida e volta direta ou ida, descarga, recarga, descarga e volta)    
-    tarifas_total_1_real = dados_ida_volta_simples["routes"][0]["travelAdvisory"]["tollInfo"]["estimatedPrice"][0]["units"]
-    tarifas_total_1_centavo = str(dados_ida_volta_simples["routes"][0]["travelAdvisory"]["tollInfo"]["estimatedPrice"][0]["nanos"])
-    tarifas_total_2_real = dados_retorno_carregado["routes"][0]["travelAdvisory"]["tollInfo"]["estimatedPrice"][0]["units"]
-    tarifas_total_2_centavo = str(dados_retorno_carregado["routes"][0]["travelAdvisory"]["tollInfo"]["estimatedPrice"][0]["nanos"])
+#     dados_trecho_volta_simples_qualp = api_qualp(origem=destino, destino=origem, eixos=eixos_descarregado, key=confidential.qualp_key)
 
-    tarifas_total_1 = float(f"{tarifas_total_1_real}.{tarifas_total_1_centavo[:2]}") * 6
-    tarifas_total_2 = float(f"{tarifas_total_2_real}.{tarifas_total_2_centavo[:2]}") * 6
+# # ---- REQUEST API QUALP ----
 
-    # Faz o cálculo do valor total em pedágios presentes nos dois casos.
-    tarifas_diff = abs(tarifas_total_1 - tarifas_total_2)
+# ---- REQUEST API GOOGLE ----
 
-# ---- SOMA TARIFAS PEDÁGIOS ----
+    rota_simples, rota_carregada = rotas_vectura(origem, destino, recarga, destino_2)
 
-# # ---- LISTA PEDÁGIOS ----
+    # Quando todos os trechos já estão na matriz, os dois cenários são montados sem nenhuma chamada à API
+    if usar_matriz and roteamento != "local":
+        dados_ida_volta_simples = montar_resposta_matriz([rota_simples[0], *rota_simples[2], rota_simples[1]])
+        dados_retorno_carregado = montar_resposta_matriz([rota_carregada[0], *rota_carregada[2], rota_carregada[1]])
 
-#     # Monta a lista com o nome dos pedágios no trecho
-#     lista_pedagios_trecho_1 = lista_pedagios(dados_trecho_1_qualp)
-#     lista_pedagios_trecho_2 = lista_pedagios(dados_trecho_2_qualp)
-#     lista_pedagios_trecho_3 = lista_pedagios(dados_trecho_3_qualp)
-#     lista_pedagios_trecho_4 = lista_pedagios(dados_trecho_4_qualp)
-    
-#     # Monta a lista com o nome dos pedágios considerando a volta do trecho_1
-#     lista_pedagios_trecho_volta_simples = lista_pedagios(dados_trecho_volta_simples_qualp)
+        if dados_ida_volta_simples is not None and dados_retorno_carregado is not None:
+            return *processar_rotas(origem, destino, recarga, destino_2, dados_ida_volta_simples, dados_retorno_carregado, racional), "google"
 
-#     # Monta a lista com o nome de todos os pedágios do trecho total para os 2 casos
-#     lista_pedagios_total_1 = list(dict.fromkeys(lista_pedagios_trecho_1 + lista_pedagios_trecho_volta_simples))
-#     lista_pedagios_total_2 = list(dict.fromkeys(lista_pedagios_trecho_1 + lista_pedagios_trecho_2 + lista_pedagios_trecho_3 + lista_pedagios_trecho_4))
+    if roteamento != "local" and chave_api != "":
+        # As duas rotas são independentes, então são pedidas ao mesmo tempo (a espera fica próxima de uma única chamada)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futuro_simples = executor.submit(propagar(google_routes_api), origin=rota_simples[0], destination=rota_simples[1], waypoints=list(rota_simples[2]), api_key=chave_api)
+            futuro_carregado = executor.submit(propagar(google_routes_api), origin=rota_carregada[0], destination=rota_carregada[1], waypoints=list(rota_carregada[2]), api_key=chave_api)
 
-# # ---- LISTA PEDÁGIOS ----
+            try:
+                # Cada chamada já tem timeout e tentativas limitadas no cliente HTTP
+                dados_ida_volta_simples = futuro_simples.result()
+                dados_retorno_carregado = futuro_carregado.result()
+                falhou = not (dados_ida_volta_simples.get("routes") and dados_retorno_carregado.get("routes"))
 
-# ---- CÁLCULO FRETE ----
+            except requests.RequestException as erro:
+                if roteamento == "google" or carregar_grafo() is None:
+                    mensagem = f"❌ Não foi possível consultar as rotas na API do Google ({erro.__class__.__name__})."
 
-    valor_frete = calculo_frete(diff_pedagio=tarifas_diff, diff_km=dist_diff, racional=racional)
+                    return False, mensagem, None, "google"
 
-# ---- CÁLCULO FRETE ----
+                falhou = True
 
-# ---- DATA CÁLCULO ----
+        # No modo automático, uma falha da API (rede, limite de uso, chave recusada) passa o cálculo para o grafo local
+        if roteamento == "google" or not falhou or carregar_grafo() is None:
+            usado = "rebaixado" if rotas_rebaixadas(dados_ida_volta_simples, dados_retorno_carregado) else "google"
 
-    # Salva a data do cálculo
-    data_calculo = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+            return *processar_rotas(origem, destino, recarga, destino_2, dados_ida_volta_simples, dados_retorno_carregado, racional), usado
 
-# ---- DATA CÁLCULO ----
+# ---- REQUEST API GOOGLE ----
 
-# ---- MAPAS ROTAS ----
+# ---- GRAFO LOCAL ----
 
-    # Extrai os links das imagens das rotas
-    # rota_trecho_1 = dados_trecho_1_qualp["rota_imagem"]
-    # rota_trecho_2 = dados_trecho_2_qualp["rota_imagem"]
-    # rota_trecho_3 = dados_trecho_3_qualp["rota_imagem"]
-    # rota_trecho_4 = dados_trecho_4_qualp["rota_imagem"]
+    dados_ida_volta_simples = rotas_locais(origin=rota_simples[0], destination=rota_simples[1], waypoints=list(rota_simples[2]))
+    dados_retorno_carregado = rotas_locais(origin=rota_carregada[0], destination=rota_carregada[1], waypoints=list(rota_carregada[2]))
 
-    # rota_trecho_volta_simples = dados_trecho_volta_simples_qualp["rota_imagem"]
+    status, mensagem, dados = processar_rotas(origem, destino, recarga, destino_2, dados_ida_volta_simples, dados_retorno_carregado, racional)
 
-    polilinha_1 = dados_ida_volta_simples["routes"][0]["polyline"]["encodedPolyline"]
-    polilinha_2 = dados_retorno_carregado["routes"][0]["polyline"]["encodedPolyline"]
+    if status:
+        mensagem = "✅ Cálculos realizados com o grafo rodoviário local (sem a API do Google e sem pedágios)."
 
-# ---- MAPAS ROTAS ----
+    return status, mensagem, dados, "local"
 
-# ---- DICIONÁRIO FINAL ----
+# ---- GRAFO LOCAL ----
 
-    dados = {"data_calculo":data_calculo,
-            
-            "origem": origem,
-            "destino_1": destino,
-            "recarga": recarga,
-            "destino_2": destino_2,
-            "retorno": origem,
+# Faz os cálculos a partir das respostas já obtidas da API para as duas rotas
+@rastrear()
+def processar_rotas(origem, destino, recarga, destino_2, dados_ida_volta_simples, dados_retorno_carregado, racional):
+    """
+    Calcula distâncias, tempos, pedágios e frete a partir das respostas da API para a rota simples e a rota com recarga.
+    Retorna (sucesso: bool, mensagem: str, dados: ResultadoCotacao ou None)
+    """
 
-            "km_ida": f"{dist_ida:.2f} km",
-            "km_volta": f"{dist_volta:.2f} km",
-            "km_total_simples": f"{dist_caso_1:.2f} km",
+    for resposta in (dados_ida_volta_simples, dados_retorno_carregado):
+        if not resposta.get("routes"):
+            erro = resposta.get("error", {}).get("message", "nenhuma rota encontrada")
+            mensagem = f"❌ Não foi possível calcular as rotas: {erro}"
 
-            "tempo_ida": tempo_total_ida,
-            "tempo_volta": tempo_total_volta,
-            "tempo_total_simples": tempos_total_1,
+            return False, mensagem, None
 
-            # "qtd_pedagio_ida": f"{pedagios_trecho_1} pedágios",
-            # "qtd_pedagio_volta": f"{pedagios_trecho_volta_simples} pedágios",
-            # "qtd_pedagio_total_simples": f"{pedagios_total_1} pedágios",
+# ---- CENÁRIOS ----
 
-            # "valor_pedagios_ida": f"R$ {tarifas_trecho_1:.2f}",
-            # "valor_pedagios_volta": f"R$ {tarifas_trecho_volta_simples:.2f}",
-            "valor_pedagio_total_simples": f"R$ {tarifas_total_1:.2f}",
+    # Se uma das rotas foi rebaixada pelo orçamento da API (sem pedágios), as duas são comparadas sem pedágios
+    com_pedagio = not rotas_rebaixadas(dados_ida_volta_simples, dados_retorno_carregado)
 
-            # "lista_pedagios_ida": lista_pedagios_trecho_1,
-            # "lista_pedagios_volta": lista_pedagios_trecho_volta_simples,
-            # "lista_pedagios_total_simples": lista_pedagios_total_1,
+    # Distância, tempo e pedágio de cada trecho, em metros, segundos e centavos
+    simples = montar_cenario(dados_ida_volta_simples, com_pedagio)
+    completo = montar_cenario(dados_retorno_carregado, com_pedagio)
 
-            "polilinha_1": polilinha_1,
+# ---- CENÁRIOS ----
 
-            "km_trecho_1": f"{dist_trecho_1:.2f} km",
-            "km_trecho_2": f"{dist_trecho_2:.2f} km",
-            "km_trecho_3": f"{dist_trecho_3:.2f} km",
-            "km_trecho_4": f"{dist_trecho_4:.2f} km",
-            "km_total": f"{dist_caso_2:.2f} km",
+# ---- CÁLCULO FRETE ----
 
-            "tempo_trecho_1": tempos_total_trecho_1,
-            "tempo_trecho_2": tempos_total_trecho_2,
-            "tempo_trecho_3": tempos_total_trecho_3,
-            "tempo_trecho_4": tempos_total_trecho_4,
-            "tempo_total": tempos_total_2,
+    diferenca_metros = abs(completo.distancia_metros - simples.distancia_metros)
+    diferenca_pedagio = abs(completo.pedagio_centavos - simples.pedagio_centavos)
 
-            # "qtd_pedagios_trecho_1": f"{pedagios_trecho_1} pedágios",
-            # "qtd_pedagios_trecho_2": f"{pedagios_trecho_2} pedágios",
-            # "qtd_pedagios_trecho_3": f"{pedagios_trecho_3} pedágios",
-            # "qtd_pedagios_trecho_4": f"{pedagios_trecho_4} pedágios",
-            # "qtd_total_pedagios": f"{pedagios_total_2} pedágios",
+    valor_frete = calculo_frete(diff_pedagio_centavos=diferenca_pedagio, diff_metros=diferenca_metros, racional=racional)
 
-            # "valor_pedagio_trecho_1": f"R$ {tarifas_trecho_1:.2f}",
-            # "valor_pedagio_trecho_2": f"R$ {tarifas_trecho_2:.2f}",
-            # "valor_pedagio_trecho_3": f"R$ {tarifas_trecho_3:.2f}",
-            # "valor_pedagio_trecho_4": f"R$ {tarifas_trecho_4:.2f}",
-            "valor_pedagios_total": f"R$ {tarifas_total_2:.2f}",
+# ---- CÁLCULO FRETE ----
 
-            # "lista_pedagios_trecho_1": lista_pedagios_trecho_1,
-            # "lista_pedagios_trecho_2": lista_pedagios_trecho_2,
-            # "lista_pedagios_trecho_3": lista_pedagios_trecho_3,
-            # "lista_pedagios_trecho_4": lista_pedagios_trecho_4,
-            # "lista_pedagios_total": lista_pedagios_total_2,
+# ---- RESULTADO FINAL ----
 
-            "polilinha_2": polilinha_2,
-            # "mapa_rota_trecho_2": rota_trecho_2,
-            # "mapa_rota_trecho_3": rota_trecho_3,
-            # "mapa_rota_trecho_4": rota_trecho_4,
+    dados = ResultadoCotacao(data_calculo=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                             simples=simples,
+                             completo=completo,
+                             racional=racional,
+                             valor_excedente_centavos=valor_frete,
+                             origem=origem,
+                             destino_1=destino,
+                             recarga=recarga,
+                             destino_2=destino_2)
 
-            "km_diff": f"{dist_diff:.2f} km",
-            "tempo_diff": tempos_total_diff,
-            # "qtd_pedagio_diff": f"{pedagios_diff} pedágios",
-            "tarifas_diff": f"R$ {tarifas_diff:.2f}",
-            "racional": racional,
+# ---- RESULTADO FINAL ----
 
-            "valor_excedente": valor_frete
-        }
-    
     mensagem = "✅ Cálculos realizados com sucesso!"
 
+    if not com_pedagio:
+        mensagem = "⚠️ Cálculos realizados sem pedágios: o orçamento de chamadas da API para rotas com pedágio foi atingido."
+
     return True, mensagem, dados
 
-def mock_from_file():
-    with open("exemplo_qualp.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+# Lê uma resposta de exemplo da API de Rotas (uma gravação de cliente_http ou a resposta pura), para testar sem rede
+def mock_from_file(caminho=ARQUIVO_EXEMPLO_ROTAS):
+    with open(caminho, "r", encoding="utf-8") as f:
+        conteudo = json.load(f)
+
+    return conteudo["resposta"] if "resposta" in conteudo else conteudo
 
 # # Faz o request na API do QualP
 # def api_qualp(origem: str, destino: str, eixos: int, key: str):